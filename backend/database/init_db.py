@@ -1,6 +1,185 @@
 import sqlite3
 import os
 
+# 按预约记录重算指定号源的人数 ({slots} 为返回 slot_id 的子查询)
+# 占用名额的预约: confirmed / checked_in / no_show (签到、爽约不释放名额)；
+# 教师课表锁定的号源只有一条教师预约，人数固定为 max_reservations
+RECOUNT_SLOTS_SQL = """UPDATE time_slots SET current_reservations = CASE
+            WHEN EXISTS (
+                SELECT 1 FROM reservations r JOIN users u ON r.user_account = u.user_account
+                WHERE r.slot_id = time_slots.slot_id AND r.status = 'confirmed' AND u.role = 'teacher'
+            ) THEN max_reservations
+            ELSE (
+                SELECT COUNT(*) FROM reservations r
+                WHERE r.slot_id = time_slots.slot_id AND r.status IN ('confirmed', 'checked_in', 'no_show')
+            ) END
+        WHERE slot_id IN ({slots});"""
+
+# 版本化迁移: (版本号, 说明, SQL)
+# 数据库当前版本记录在 PRAGMA user_version 中，启动时按顺序执行所有更高版本的迁移
+# 新增迁移只能追加到末尾，已发布的迁移不要修改
+MIGRATIONS = [
+    (1, "热点查询索引", """
+        -- get_available_slots / 号源维护: 按场地+日期+开始时间查找
+        CREATE INDEX IF NOT EXISTS idx_time_slots_court_date_start ON time_slots(court_id, date, start_time);
+        -- 按场馆查找场地 (号源查询的驱动表)
+        CREATE INDEX IF NOT EXISTS idx_courts_venue ON courts(venue_id);
+        -- get_user_reservations: 按用户查询并按创建时间排序
+        CREATE INDEX IF NOT EXISTS idx_reservations_user_create ON reservations(user_account, create_time);
+        -- create_reservation 重复预约检查 / 号源清理
+        CREATE INDEX IF NOT EXISTS idx_reservations_slot_status ON reservations(slot_id, status);
+        -- process_daily_tasks 爽约扫描: status='confirmed' 的预约
+        CREATE INDEX IF NOT EXISTS idx_reservations_status_slot ON reservations(status, slot_id);
+        -- 信用分恢复: 按用户查找最后一次扣分时间
+        CREATE INDEX IF NOT EXISTS idx_credit_logs_user_time ON credit_logs(user_account, time);
+    """),
+    (2, "同一用户同一时段只能有一条有效预约", """
+        -- 历史数据中的重复有效预约只保留最早的一条
+        CREATE TEMP TABLE duplicate_reservations AS
+            SELECT reservation_id, slot_id FROM reservations
+            WHERE status = 'confirmed' AND reservation_id NOT IN (
+                SELECT MIN(reservation_id) FROM reservations
+                WHERE status = 'confirmed' GROUP BY user_account, slot_id
+            );
+        UPDATE reservations SET status = 'cancelled', cancel_time = datetime('now', 'localtime')
+        WHERE reservation_id IN (SELECT reservation_id FROM duplicate_reservations);
+        -- 被取消的重复预约占用的名额随之释放
+        """ + RECOUNT_SLOTS_SQL.format(slots="SELECT slot_id FROM duplicate_reservations") + """
+        DROP TABLE duplicate_reservations;
+        CREATE UNIQUE INDEX IF NOT EXISTS uq_reservations_user_slot_confirmed
+            ON reservations(user_account, slot_id) WHERE status = 'confirmed';
+    """),
+    (3, "号源唯一键 (场地, 日期, 开始时间, 结束时间)", """
+        -- 合并历史重复号源: 每组重复号源保留 slot_id 最小的一条
+        CREATE TEMP TABLE slot_duplicates AS
+            SELECT t1.slot_id AS slot_id, MIN(t2.slot_id) AS keep_id FROM time_slots t1
+            JOIN time_slots t2 ON t2.court_id = t1.court_id AND t2.date = t1.date
+                AND t2.start_time = t1.start_time AND t2.end_time = t1.end_time
+            GROUP BY t1.slot_id HAVING t1.slot_id != MIN(t2.slot_id);
+        -- 合并后会与同一用户的其他有效预约重复的，取消 (优先保留保留号源上的预约，其次保留最早的)
+        UPDATE reservations SET status = 'cancelled', cancel_time = datetime('now', 'localtime')
+        WHERE status = 'confirmed' AND slot_id IN (SELECT slot_id FROM slot_duplicates)
+        AND EXISTS (
+            SELECT 1 FROM reservations r2
+            WHERE r2.status = 'confirmed' AND r2.user_account = reservations.user_account
+            AND r2.reservation_id != reservations.reservation_id
+            AND COALESCE((SELECT keep_id FROM slot_duplicates d WHERE d.slot_id = r2.slot_id), r2.slot_id)
+                = (SELECT keep_id FROM slot_duplicates d WHERE d.slot_id = reservations.slot_id)
+            AND (r2.slot_id NOT IN (SELECT slot_id FROM slot_duplicates) OR r2.reservation_id < reservations.reservation_id)
+        );
+        -- 预约改挂到保留的号源上，再删除多余号源
+        UPDATE reservations SET slot_id = (SELECT keep_id FROM slot_duplicates d WHERE d.slot_id = reservations.slot_id)
+        WHERE slot_id IN (SELECT slot_id FROM slot_duplicates);
+        DELETE FROM time_slots WHERE slot_id IN (SELECT slot_id FROM slot_duplicates);
+        -- 合并后超出场地容量的: 场地容量不变，按预约先后保留 max_reservations 个名额，
+        -- 多出的最晚的有效预约改为管理员取消 (已签到/爽约的历史记录不动，排在前面占名额)；
+        -- 教师课表锁定的号源不处理 (人数固定为 max_reservations)
+        CREATE TEMP TABLE slot_overflow AS
+            SELECT reservation_id FROM (
+                SELECT r.reservation_id, r.status, ts.max_reservations AS capacity,
+                    ROW_NUMBER() OVER (PARTITION BY r.slot_id ORDER BY r.status = 'confirmed', r.reservation_id) AS seat
+                FROM reservations r JOIN time_slots ts ON r.slot_id = ts.slot_id
+                WHERE r.slot_id IN (SELECT keep_id FROM slot_duplicates)
+                AND r.status IN ('confirmed', 'checked_in', 'no_show')
+                AND NOT EXISTS (
+                    SELECT 1 FROM reservations t JOIN users u ON t.user_account = u.user_account
+                    WHERE t.slot_id = r.slot_id AND t.status = 'confirmed' AND u.role = 'teacher'
+                )
+            ) WHERE status = 'confirmed' AND seat > capacity;
+        UPDATE reservations SET status = 'cancelled_by_admin', cancel_time = datetime('now', 'localtime')
+        WHERE reservation_id IN (SELECT reservation_id FROM slot_overflow);
+        DROP TABLE slot_overflow;
+        -- 保留号源的人数按合并后的预约重算
+        """ + RECOUNT_SLOTS_SQL.format(slots="SELECT keep_id FROM slot_duplicates") + """
+        DROP TABLE slot_duplicates;
+        CREATE UNIQUE INDEX IF NOT EXISTS uq_time_slots_court_date_time
+            ON time_slots(court_id, date, start_time, end_time);
+        -- 唯一索引已覆盖 (court_id, date, start_time) 前缀
+        DROP INDEX IF EXISTS idx_time_slots_court_date_start;
+    """),
+    (4, "号源按日期清理", """
+        -- 每日号源维护: 按日期范围删除过期号源 (唯一索引以 court_id 开头，无法用于日期范围)
+        CREATE INDEX IF NOT EXISTS idx_time_slots_date ON time_slots(date);
+    """),
+    (5, "号源版本号", """
+        -- 每次修改 current_reservations 时加 1，余量缓存据此判断写穿透事件的先后
+        ALTER TABLE time_slots ADD COLUMN version INTEGER NOT NULL DEFAULT 0;
+    """),
+    (6, "热门时段抽签志愿", """
+        CREATE TABLE IF NOT EXISTS lottery_entries (
+            entry_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_account TEXT NOT NULL, -- 关联用户账号
+            slot_id INTEGER NOT NULL, -- 志愿时段 ID
+            preference INTEGER NOT NULL, -- 志愿顺序 (1 = 第一志愿)
+            status TEXT NOT NULL, -- 状态 (pending/won/lost)
+            create_time DATETIME NOT NULL, -- 提交时间
+            FOREIGN KEY (user_account) REFERENCES users(user_account),
+            FOREIGN KEY (slot_id) REFERENCES time_slots(slot_id)
+        );
+        CREATE UNIQUE INDEX IF NOT EXISTS uq_lottery_entries_user_slot ON lottery_entries(user_account, slot_id);
+        -- 开奖: 按时段读取志愿 (不含 status，开奖时批量改状态不需要维护索引)
+        CREATE INDEX IF NOT EXISTS idx_lottery_entries_slot ON lottery_entries(slot_id);
+        -- 每天的热门时段只开奖一次，记录随机种子便于复核
+        CREATE TABLE IF NOT EXISTS lottery_draws (
+            date DATE PRIMARY KEY, -- 开奖日期 (时段所在日期)
+            seed INTEGER NOT NULL, -- 随机种子
+            entrants INTEGER NOT NULL, -- 参与人数
+            winners INTEGER NOT NULL, -- 中签人数
+            draw_time DATETIME NOT NULL -- 开奖时间
+        );
+    """),
+    (7, "时段候补队列", """
+        CREATE TABLE IF NOT EXISTS waitlist (
+            waitlist_id INTEGER PRIMARY KEY AUTOINCREMENT, -- 自增 ID 即候补顺序
+            user_account TEXT NOT NULL, -- 关联用户账号
+            slot_id INTEGER NOT NULL, -- 候补时段 ID
+            status TEXT NOT NULL, -- 状态 (waiting/promoted/skipped/cancelled/expired)
+            create_time DATETIME NOT NULL, -- 加入时间
+            update_time DATETIME, -- 状态变化时间
+            reservation_id INTEGER, -- 递补成功后生成的预约
+            FOREIGN KEY (user_account) REFERENCES users(user_account),
+            FOREIGN KEY (slot_id) REFERENCES time_slots(slot_id)
+        );
+        -- 同一用户同一时段只能有一条候补
+        CREATE UNIQUE INDEX IF NOT EXISTS uq_waitlist_user_slot_waiting
+            ON waitlist(user_account, slot_id) WHERE status = 'waiting';
+        -- 递补: 按时段取最早的候补 (部分索引只包含仍在等待的记录)
+        CREATE INDEX IF NOT EXISTS idx_waitlist_slot_waiting
+            ON waitlist(slot_id, waitlist_id) WHERE status = 'waiting';
+    """),
+]
+
+
+def get_schema_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(db_path):
+    """
+    将数据库升级到最新版本 (可对已有的 sports_venue.db 原地升级)
+    每个迁移在独立事务中执行，失败时回滚且不会更新版本号
+    :return: int - 升级后的版本号
+    """
+    conn = sqlite3.connect(db_path)
+    try:
+        version = get_schema_version(conn)
+        for target, description, sql in MIGRATIONS:
+            if target <= version:
+                continue
+            try:
+                # PRAGMA user_version 写在数据库头中，随事务一起提交或回滚
+                conn.executescript(f"BEGIN;\n{sql}\nPRAGMA user_version = {target};\nCOMMIT;")
+            except Exception:
+                if conn.in_transaction:
+                    conn.rollback()
+                raise
+            version = target
+            print(f"数据库已迁移到版本 {target}: {description}")
+        return version
+    finally:
+        conn.close()
+
+
 def init_db(db_path='database/sports_venue.db', schema_path='database/schema.sql'):
     """
     初始化数据库
@@ -22,6 +201,8 @@ def init_db(db_path='database/sports_venue.db', schema_path='database/schema.sql
     finally:
         conn.close()
 
+    migrate(db_path)
+
 if __name__ == '__main__':
     # 假设脚本在项目根目录下运行，或者直接运行
     # 如果直接运行此脚本，需要调整路径
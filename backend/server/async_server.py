@@ -0,0 +1,111 @@
+import asyncio
+import json
+import os
+import sys
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(current_dir)
+if project_root not in sys.path:
+    sys.path.append(project_root)
+
+try:
+    from server.server import SportsVenueServer
+    from server.protocol import HEADER, MAX_MESSAGE_SIZE, encode_message
+    from server.executor import ServerBusy, BUSY_RESPONSE
+    from server.pushhub import StreamConnection
+except ImportError:
+    sys.path.append(current_dir)
+    from server import SportsVenueServer
+    from protocol import HEADER, MAX_MESSAGE_SIZE, encode_message
+    from executor import ServerBusy, BUSY_RESPONSE
+    from pushhub import StreamConnection
+
+
+class AsyncSportsVenueServer(SportsVenueServer):
+    """
+    基于 asyncio 的服务器引擎 (线程/连接 模型的替代方案)
+    - 所有连接由单个事件循环管理，空闲连接只占用少量内存
+    - 请求分发仍走 process_request，协议与线程版完全一致
+    - sqlite 操作交给有界请求执行器 (RequestExecutor)，不阻塞事件循环，饱和时快速返回 busy
+    """
+
+    def __init__(self, host='127.0.0.1', port=8888, max_workers=16, max_queue=1024,
+                 action_limits=None, backlog=4096, inventory_engine=False, group_commit=True):
+        super().__init__(host, port, max_workers, max_queue, action_limits, inventory_engine, group_commit)
+        self.backlog = backlog
+        self.connection_count = 0
+
+    async def handle_connection(self, reader, writer):
+        self.connection_count += 1
+        # 推送帧由 PushHub 通过 call_soon_threadsafe 在本事件循环中写出，与响应不会交错
+        conn = StreamConnection(writer, asyncio.get_running_loop(), self.push_hub)
+        try:
+            while True:
+                try:
+                    header = await reader.readexactly(HEADER.size)
+                except asyncio.IncompleteReadError:
+                    break
+                (length,) = HEADER.unpack(header)
+                if length > MAX_MESSAGE_SIZE:
+                    print(f"[!] 协议错误: 消息长度超出上限: {length}")
+                    break
+                request_data = (await reader.readexactly(length)).decode('utf-8')
+
+                try:
+                    request = json.loads(request_data)
+                    frame = await asyncio.wrap_future(self.respond(request, conn))
+                except ServerBusy:
+                    frame = encode_message(BUSY_RESPONSE)
+                except json.JSONDecodeError:
+                    frame = encode_message({"status": "error", "message": "无效的 JSON 格式"})
+                except Exception as e:
+                    frame = encode_message({"status": "error", "message": f"服务器内部错误: {str(e)}"})
+
+                writer.write(frame)
+                # 等待写缓冲排空 (对端读得慢时自动背压)
+                await writer.drain()
+        except (ConnectionResetError, asyncio.IncompleteReadError):
+            pass
+        except Exception as e:
+            print(f"[!] 客户端处理错误: {e}")
+        finally:
+            self.connection_count -= 1
+            self.push_hub.drop(conn)
+            writer.close()
+
+    def collect_stats(self):
+        stats = super().collect_stats()
+        stats["connections"] = self.connection_count
+        return stats
+
+    async def serve(self):
+        server = await asyncio.start_server(self.handle_connection, self.host, self.port, backlog=self.backlog)
+        print(f"[*] 服务器已启动 (asyncio 模式)，监听 {self.host}:{self.port}，工作线程 {self.executor.max_workers}")
+        async with server:
+            await server.serve_forever()
+
+    def start(self):
+        # 线程版创建的监听 socket 在 asyncio 模式下不使用
+        self.server_socket.close()
+        # 启动定时任务
+        self.start_scheduler()
+        self.start_stats_dump()
+        self.push_hub.start()
+        if self.inventory:
+            self.inventory.start()
+        if self.group_commit:
+            self.group_commit.start()
+        try:
+            asyncio.run(self.serve())
+        except KeyboardInterrupt:
+            pass
+        except Exception as e:
+            print(f"[!] 服务器启动失败: {e}")
+        finally:
+            self.running = False
+            self.executor.shutdown()
+
+
+if __name__ == '__main__':
+    server = AsyncSportsVenueServer()
+    server.start()
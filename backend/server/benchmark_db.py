@@ -0,0 +1,815 @@
+import os
+import sys
+import time
+import shutil
+import socket
+import sqlite3
+import datetime
+import tempfile
+import threading
+import json
+
+#该py文件用于后端开发时测量 DBManager 的性能 (在临时数据库上运行，不影响 sports_venue.db)
+# 各项测量同时检查不变量 (不超卖、人数与预约记录一致等)，有检查失败时以非零状态退出；
+# python benchmark_db.py --check 只运行不变量检查 (跳过纯性能测量，数据量更小)
+current_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(current_dir)
+SCHEMA_PATH = os.path.join(project_root, 'database', 'schema.sql')
+sys.path.append(current_dir)
+
+from db_manager import DBManager
+from inventory import InventoryEngine
+from group_commit import GroupCommit
+from noshow_monitor import NoShowMonitor
+from pushhub import PushHub, SocketConnection
+from protocol import read_message_bytes
+from waiting_room import WaitingRoom
+from database.init_db import migrate
+
+# 不变量检查失败的记录，非空时脚本以非零状态退出
+FAILURES = []
+
+
+def check(condition, ok_message, fail_message):
+    """不变量检查: 打印结果，失败时记入 FAILURES"""
+    if condition:
+        print(f"    √ {ok_message}")
+    else:
+        print(f"    × {fail_message}")
+        FAILURES.append(fail_message)
+    return condition
+
+
+def count_slot_violations(conn, where="1", params=()):
+    """
+    人数与预约记录不一致或超卖的时段数
+    占用名额的预约: confirmed / checked_in / no_show；教师锁定的号源人数固定为 max_reservations
+    """
+    return conn.execute(f"""
+        SELECT COUNT(*) FROM time_slots ts
+        WHERE ({where}) AND (ts.current_reservations > ts.max_reservations OR ts.current_reservations != CASE
+            WHEN EXISTS (
+                SELECT 1 FROM reservations r JOIN users u ON r.user_account = u.user_account
+                WHERE r.slot_id = ts.slot_id AND r.status = 'confirmed' AND u.role = 'teacher'
+            ) THEN ts.max_reservations
+            ELSE (SELECT COUNT(*) FROM reservations r
+                  WHERE r.slot_id = ts.slot_id AND r.status IN ('confirmed', 'checked_in', 'no_show'))
+            END)
+    """, params).fetchone()[0]
+
+
+def create_bench_db(db_path, venue_count=5, courts_per_venue=8, user_count=200):
+    """根据 schema.sql 创建临时数据库并填充基准数据 (未来3天, 9:00-22:00 每小时一个号源)"""
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+    with open(SCHEMA_PATH, 'r', encoding='utf-8') as f:
+        cursor.executescript(f.read())
+
+    now = datetime.datetime.now()
+    today = datetime.date.today()
+    cursor.executemany("""
+        INSERT INTO users (user_account, password, name, role, phone, credit_score, create_time)
+        VALUES (?, '123456', ?, 'student', '', 100, ?)
+    """, [(f"s{i:05d}", f"学生{i}", now) for i in range(user_count)])
+    cursor.execute("""
+        INSERT INTO users (user_account, password, name, role, phone, credit_score, create_time)
+        VALUES ('t0001', '123456', '教师', 'teacher', '', 100, ?)
+    """, (now,))
+
+    for v in range(venue_count):
+        cursor.execute("INSERT INTO venues (venue_name, is_outdoor, location, description) VALUES (?, 0, '', '')",
+                       (f"场馆{v}",))
+        venue_id = cursor.lastrowid
+        for c in range(courts_per_venue):
+            cursor.execute("INSERT INTO courts (venue_id, court_name) VALUES (?, ?)", (venue_id, f"{c + 1}号场"))
+            court_id = cursor.lastrowid
+            rows = []
+            for day_offset in range(3):
+                date_str = (today + datetime.timedelta(days=day_offset)).strftime('%Y-%m-%d')
+                for h in range(9, 22):
+                    rows.append((court_id, date_str, f"{h:02d}:00:00", f"{h + 1:02d}:00:00", 1 if 19 <= h < 21 else 0))
+            cursor.executemany("""
+                INSERT INTO time_slots (court_id, date, start_time, end_time, max_reservations, current_reservations, is_hot)
+                VALUES (?, ?, ?, ?, 8, 0, ?)
+            """, rows)
+    conn.commit()
+    conn.close()
+
+
+def measure(label, func, rounds):
+    """执行 rounds 次，打印平均值与 p99 (毫秒)"""
+    samples = []
+    for i in range(rounds):
+        start = time.perf_counter()
+        func(i)
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    mean = sum(samples) / len(samples)
+    p99 = samples[min(len(samples) - 1, int(len(samples) * 0.99))]
+    print(f"    {label:<28} 平均 {mean:8.3f} ms   p99 {p99:8.3f} ms")
+    return mean
+
+
+def bench_connection_pool(db_path, rounds=2000):
+    """对比不使用连接池 (每次新建连接) 与使用连接池的单请求延迟"""
+    print("\n--- 连接池: 单请求延迟对比 ---")
+    date_str = datetime.date.today().strftime('%Y-%m-%d')
+    results = {}
+    for pool_size in (0, 16):
+        db = DBManager(db_path, pool_size=pool_size, slot_cache_size=0)
+        print(f"[*] pool_size={pool_size} ({'每次新建连接' if not pool_size else '连接池复用'})")
+        results[pool_size] = [
+            measure("validate_login", lambda i: db.validate_login(f"s{i % 200:05d}", '123456'), rounds),
+            measure("get_available_slots", lambda i: db.get_available_slots(1 + i % 5, date_str), rounds),
+            measure("get_user_reservations", lambda i: db.get_user_reservations(f"s{i % 200:05d}"), rounds),
+        ]
+        db.close()
+    for before, after in zip(results[0], results[16]):
+        print(f"    加速比: {before / after:.2f}x")
+
+
+def bench_slot_cache(db_path, rounds=5000):
+    """号源余量缓存: 对比 get_available_slots 直接查库与命中缓存的延迟"""
+    print("\n--- 号源余量缓存: get_available_slots ---")
+    date_str = datetime.date.today().strftime('%Y-%m-%d')
+    results = []
+    for cache_size in (0, 256):
+        db = DBManager(db_path, pool_size=16, slot_cache_size=cache_size)
+        results.append(measure(f"slot_cache_size={cache_size}", lambda i: db.get_available_slots(1 + i % 5, date_str), rounds))
+        if db.slot_cache:
+            print(f"    {db.slot_cache.stats()}")
+        db.close()
+    print(f"    加速比: {results[0] / results[1]:.2f}x")
+
+
+def stress_booking(db_path, threads=64, capacity=8, attempts_per_user=2):
+    """多线程并发预约同一个时段 (每个用户重复提交)，验证不超卖、不重复预约"""
+    print(f"\n--- 并发预约压测: {threads} 线程抢 {capacity} 个名额 ---")
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+    cursor.execute("""
+        INSERT INTO time_slots (court_id, date, start_time, end_time, max_reservations, current_reservations, is_hot)
+        VALUES (1, ?, '23:00:00', '23:59:00', ?, 0, 1)
+    """, (datetime.date.today().strftime('%Y-%m-%d'), capacity))
+    slot_id = cursor.lastrowid
+    conn.commit()
+
+    db = DBManager(db_path, pool_size=16)
+    barrier = threading.Barrier(threads)
+    results = []
+
+    def worker(i):
+        barrier.wait()
+        for _ in range(attempts_per_user):
+            results.append(db.create_reservation(f"s{i:05d}", slot_id))
+
+    start = time.perf_counter()
+    workers = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+    elapsed = time.perf_counter() - start
+    db.close()
+
+    succeeded = sum(1 for ok, _ in results if ok)
+    errors = [msg for ok, msg in results if not ok and msg.startswith("预约失败")]
+    cursor.execute("SELECT current_reservations FROM time_slots WHERE slot_id=?", (slot_id,))
+    current = cursor.fetchone()[0]
+    cursor.execute("SELECT COUNT(*), COUNT(DISTINCT user_account) FROM reservations WHERE slot_id=? AND status='confirmed'", (slot_id,))
+    confirmed, distinct_users = cursor.fetchone()
+    conn.close()
+
+    print(f"    请求 {len(results)} 次，耗时 {elapsed * 1000:.1f} ms，成功 {succeeded}，数据库错误 {len(errors)}")
+    print(f"    current_reservations={current}，有效预约 {confirmed} 条 (用户 {distinct_users} 个)")
+    check(succeeded == current == confirmed == distinct_users <= capacity and not errors,
+          "未超卖，无重复预约", "检测到超卖、计数不一致或数据库错误!")
+
+
+def bench_inventory(db_path, threads=32, user_count=200):
+    """
+    抢号高峰: 所有用户同时预约某一天的全部热门时段，对比直接写数据库与内存库存引擎
+    (两种模式分别使用明天、后天的热门时段，名额相同)
+    """
+    print(f"\n--- 热门时段抢号: {threads} 线程，{user_count} 个用户 ---")
+    conn = sqlite3.connect(db_path)
+    days = [(datetime.date.today() + datetime.timedelta(days=d)).strftime('%Y-%m-%d') for d in (1, 2)]
+
+    def run(label, date_str, use_engine):
+        slot_ids = [r[0] for r in conn.execute("SELECT slot_id FROM time_slots WHERE date=? AND is_hot=1", (date_str,))]
+        capacity = conn.execute("SELECT SUM(max_reservations - current_reservations) FROM time_slots WHERE date=? AND is_hot=1",
+                                (date_str,)).fetchone()[0]
+        db = DBManager(db_path, pool_size=16, slot_cache_size=0)
+        engine = None
+        if use_engine:
+            engine = InventoryEngine(db)
+            engine.start()
+        barrier = threading.Barrier(threads)
+        results = []
+
+        def worker(t):
+            barrier.wait()
+            for u in range(t, user_count, threads):
+                for slot_id in slot_ids:
+                    results.append(db.create_reservation(f"s{u:05d}", slot_id)[0])
+
+        start = time.perf_counter()
+        workers = [threading.Thread(target=worker, args=(t,)) for t in range(threads)]
+        for t in workers:
+            t.start()
+        for t in workers:
+            t.join()
+        decided = time.perf_counter() - start
+        if engine:
+            engine.flush()
+            engine.stop()
+        elapsed = time.perf_counter() - start
+        db.close()
+
+        succeeded = sum(results)
+        overbooked = count_slot_violations(conn, "ts.date = ? AND ts.is_hot = 1", (date_str,))
+        print(f"    {label:<14} 请求 {len(results)} 次，成功 {succeeded}/{capacity}，"
+              f"全部响应 {decided * 1000:8.1f} ms，写入完成 {elapsed * 1000:8.1f} ms  ({len(results) / decided:9.0f} 次/秒)")
+        if engine:
+            stats = engine.stats()
+            print(f"    {'':<14} 批次 {stats['batches']}，平均每批 {stats['avg_batch']} 条，冲突 {stats['conflicts']}")
+        check(overbooked == 0 and succeeded == capacity, "计数一致，未超卖，名额全部售出",
+              f"{label}: {overbooked} 个时段计数不一致或超卖，成功 {succeeded}/{capacity}")
+
+    run("直接写数据库", days[0], False)
+    run("内存库存引擎", days[1], True)
+    conn.close()
+
+
+def bench_group_commit(db_path, threads=32, per_thread=20):
+    """并发写吞吐: 每个线程预约 per_thread 个普通时段再逐个取消，对比逐个提交与组提交"""
+    print(f"\n--- 组提交: {threads} 线程并发预约/取消 ---")
+    conn = sqlite3.connect(db_path)
+    slot_ids = [r[0] for r in conn.execute("SELECT slot_id FROM time_slots WHERE is_hot=0 AND max_reservations=8 "
+                                           "AND current_reservations=0 LIMIT ?", (threads * per_thread,))]
+    conn.close()
+
+    for synchronous in ('NORMAL', 'FULL'):
+        for use_group in (False, True):
+            db = DBManager(db_path, pool_size=16, slot_cache_size=0, pragmas={"synchronous": synchronous})
+            coordinator = None
+            if use_group:
+                coordinator = GroupCommit(db)
+                coordinator.start()
+            barrier = threading.Barrier(threads)
+            failures = []
+
+            def worker(t):
+                user = f"s{t:05d}"
+                mine = slot_ids[t * per_thread:(t + 1) * per_thread]
+                barrier.wait()
+                for slot_id in mine:
+                    ok, msg = db.create_reservation(user, slot_id)
+                    if not ok:
+                        failures.append(msg)
+                ok, rows = db.get_user_reservations(user)
+                for row in rows:
+                    if row["status"] == 'confirmed':
+                        ok, msg = db.cancel_reservation(user, row["id"])
+                        if not ok:
+                            failures.append(msg)
+
+            start = time.perf_counter()
+            workers = [threading.Thread(target=worker, args=(t,)) for t in range(threads)]
+            for t in workers:
+                t.start()
+            for t in workers:
+                t.join()
+            elapsed = time.perf_counter() - start
+            label = f"synchronous={synchronous} " + ("组提交" if use_group else "逐个提交")
+            extra = ""
+            if coordinator:
+                stats = coordinator.stats()
+                coordinator.stop()
+                extra = f"  (事务 {stats['batches']} 个，平均每批 {stats['avg_batch']} 个写操作)"
+            db.close()
+            writes = threads * per_thread * 2
+            print(f"    {label:<28} {writes} 次写操作 {elapsed * 1000:8.1f} ms  {writes / elapsed:8.0f} 次/秒{extra}")
+            if failures:
+                check(False, "", f"{label}: 失败 {len(failures)} 次: {failures[0]}")
+
+    conn = sqlite3.connect(db_path)
+    violations = count_slot_violations(conn, "ts.slot_id IN (%s)" % ",".join("?" * len(slot_ids)), slot_ids)
+    conn.close()
+    check(violations == 0, "预约/取消后计数一致", f"{violations} 个时段计数不一致")
+
+
+def bench_lottery(db_path, entrants=50000, per_user=3):
+    """热门时段抽签: entrants 人各填 per_user 个志愿，测量开奖 (分配 + 批量写入) 耗时并核对结果"""
+    import random
+    print(f"\n--- 热门时段抽签: {entrants} 人，每人 {per_user} 个志愿 ---")
+    rng = random.Random(7)
+    conn = sqlite3.connect(db_path)
+    date_str = datetime.date.today().strftime('%Y-%m-%d')
+    slot_ids = [r[0] for r in conn.execute("SELECT slot_id FROM time_slots WHERE date=? AND is_hot=1", (date_str,))]
+    now = datetime.datetime.now()
+    # 信用分 70-100 均匀分布 (≤80 的不参与)
+    credits = {f"l{i:06d}": rng.randint(70, 100) for i in range(entrants)}
+    conn.executemany("""
+        INSERT INTO users (user_account, password, name, role, phone, credit_score, create_time)
+        VALUES (?, '123456', '', 'student', '', ?, ?)
+    """, [(user, credit, now) for user, credit in credits.items()])
+    conn.commit()
+    # 直接写入志愿表 (migrate 在 DBManager 初始化时已建表)
+    db = DBManager(db_path, pool_size=4, slot_cache_size=0)
+    conn.executemany("""
+        INSERT INTO lottery_entries (user_account, slot_id, preference, status, create_time)
+        VALUES (?, ?, ?, 'pending', ?)
+    """, [(user, slot_id, i + 1, now) for user in credits for i, slot_id in enumerate(rng.sample(slot_ids, per_user))])
+    conn.commit()
+    before = conn.execute("SELECT COUNT(*) FROM reservations WHERE status='confirmed'").fetchone()[0]
+
+    ok, report = db.run_lottery(date_str, seed=42)
+    db.close()
+    if not ok:
+        check(False, "", f"开奖失败: {report}")
+        conn.close()
+        return
+    print(f"    run_lottery                  {report['elapsed_ms']:8.1f} ms   "
+          f"(参与 {report['entrants']} 人，名额 {report['seats']}，中签 {report['winners']})")
+
+    added = conn.execute("SELECT COUNT(*) FROM reservations WHERE status='confirmed'").fetchone()[0] - before
+    overbooked = conn.execute("SELECT COUNT(*) FROM time_slots WHERE date=? AND current_reservations > max_reservations",
+                              (date_str,)).fetchone()[0]
+    multi = conn.execute("""
+        SELECT COUNT(*) FROM (SELECT user_account FROM lottery_entries WHERE status='won'
+                              GROUP BY user_account HAVING COUNT(*) > 1)
+    """).fetchone()[0]
+    low_won = conn.execute("""
+        SELECT COUNT(*) FROM lottery_entries le JOIN users u ON le.user_account = u.user_account
+        WHERE le.status='won' AND u.credit_score <= 80
+    """).fetchone()[0]
+    bands = conn.execute("""
+        SELECT CASE WHEN u.credit_score <= 90 THEN '81-90' ELSE '91-100' END AS band,
+               COUNT(DISTINCT u.user_account), COUNT(DISTINCT CASE WHEN le.status='won' THEN u.user_account END)
+        FROM lottery_entries le JOIN users u ON le.user_account = u.user_account
+        WHERE u.credit_score > 80 GROUP BY band ORDER BY band
+    """).fetchall()
+    conn.close()
+    for band, total, won in bands:
+        print(f"    信用分 {band:<7} 参与 {total:6d} 人，中签率 {won / total * 100:5.2f}%")
+    check(added == report['winners'] and overbooked == 0 and multi == 0 and low_won == 0,
+          "预约数与中签数一致，未超卖，每人最多中一个",
+          f"抽签结果不一致: 新增预约 {added}，超卖时段 {overbooked}，多次中签 {multi}，低信用分中签 {low_won}")
+
+
+def bench_teacher_schedule(db_path):
+    """教师课表: 为一个场馆 (8 个场地) 导入一周7天的课 (约一个学期的号源)，再移除其中一门"""
+    print("\n--- 教师课表: 批量锁定 / 释放 ---")
+    db = DBManager(db_path, pool_size=4)
+    start = time.perf_counter()
+    for weekday in range(7):
+        db.add_teacher_schedule('t0001', 1, weekday, '10:00:00', '11:00:00')
+    elapsed = (time.perf_counter() - start) * 1000
+    print(f"    add_teacher_schedule x7      {elapsed:8.3f} ms   (每次 {elapsed / 7:.3f} ms)")
+
+    conn = sqlite3.connect(db_path)
+    locked = conn.execute("SELECT COUNT(*) FROM reservations WHERE user_account='t0001' AND status='confirmed'").fetchone()[0]
+    schedule_id = conn.execute("SELECT MAX(schedule_id) FROM class_schedules").fetchone()[0]
+
+    start = time.perf_counter()
+    ok, msg = db.remove_teacher_schedule('t0001', schedule_id)
+    elapsed = (time.perf_counter() - start) * 1000
+    remaining = conn.execute("SELECT COUNT(*) FROM reservations WHERE user_account='t0001' AND status='confirmed'").fetchone()[0]
+    violations = count_slot_violations(conn, "ts.court_id IN (SELECT court_id FROM courts WHERE venue_id = 1)")
+    conn.close()
+    print(f"    remove_teacher_schedule      {elapsed:8.3f} ms   ({msg}，释放 {locked - remaining}/{locked} 个锁定时段)")
+    db.close()
+    check(ok and 0 < remaining < locked and violations == 0, "锁定/释放后计数一致",
+          f"教师课表: {msg}，剩余锁定 {remaining}/{locked}，计数不一致时段 {violations}")
+
+
+def bench_daily_tasks(db_path, backlog=50000, chunk_size=1000):
+    """每日任务: 构造节假日后大量积压的爽约记录，测量分批处理耗时与期间预约的最长等待"""
+    print(f"\n--- 每日任务: {backlog} 条积压爽约，每批 {chunk_size} 条 ---")
+    conn = sqlite3.connect(db_path)
+    yesterday = (datetime.date.today() - datetime.timedelta(days=1)).strftime('%Y-%m-%d')
+    cursor = conn.cursor()
+    cursor.execute("""
+        INSERT INTO time_slots (court_id, date, start_time, end_time, max_reservations, current_reservations, is_hot)
+        VALUES (1, ?, '06:00:00', '07:00:00', ?, ?, 0)
+    """, (yesterday, backlog, backlog))
+    slot_id = cursor.lastrowid
+    # 积压记录全部挂在同一个历史时段上 (只关心行数)，需去掉同用户同时段唯一索引
+    cursor.execute("DROP INDEX IF EXISTS uq_reservations_user_slot_confirmed")
+    cursor.executemany("""
+        INSERT INTO reservations (user_account, slot_id, status, create_time) VALUES (?, ?, 'confirmed', ?)
+    """, ((f"s{i % 200:05d}", slot_id, yesterday) for i in range(backlog)))
+    conn.commit()
+
+    db = DBManager(db_path, pool_size=4)
+    done = threading.Event()
+    waits = []
+
+    probe_slot = conn.execute("SELECT MAX(slot_id) FROM time_slots WHERE date > ?", (yesterday,)).fetchone()[0]
+
+    def booker():
+        # 任务执行期间持续预约/取消同一时段，记录每次写请求的最长等待
+        while not done.is_set():
+            start = time.perf_counter()
+            ok, _ = db.create_reservation('s00199', probe_slot)
+            waits.append((time.perf_counter() - start) * 1000)
+            if ok:
+                probe = db.get_connection()
+                try:
+                    row = probe.execute("SELECT reservation_id FROM reservations WHERE user_account='s00199' AND slot_id=? AND status='confirmed'",
+                                      (probe_slot,)).fetchone()
+                finally:
+                    probe.close()
+                db.cancel_reservation('s00199', row[0])
+
+    t = threading.Thread(target=booker)
+    t.start()
+    start = time.perf_counter()
+    count = db.process_no_shows(datetime.datetime.now(), chunk_size)
+    elapsed = (time.perf_counter() - start) * 1000
+    done.set()
+    t.join()
+    db.close()
+
+    no_show = conn.execute("SELECT COUNT(*) FROM reservations WHERE slot_id=? AND status='no_show'", (slot_id,)).fetchone()[0]
+    logs = conn.execute("SELECT COUNT(*) FROM credit_logs WHERE reason='爽约扣分'").fetchone()[0]
+    conn.close()
+    print(f"    process_no_shows             {elapsed:8.1f} ms   (处理 {count} 条，no_show {no_show}，扣分日志 {logs})")
+    if waits:
+        print(f"    并发请求 {len(waits)} 次，最长等待 {max(waits):8.3f} ms")
+    check(no_show == backlog and count >= backlog, "积压爽约全部处理",
+          f"爽约处理不完整: 处理 {count} 条，no_show {no_show}/{backlog}")
+
+
+def check_slot_rollout(db_path):
+    """号源维护: 已有同开始时间 (结束时间不同) 的号源时不再生成重叠号源，重复执行不新增"""
+    print("\n--- 号源维护: 去重与幂等 ---")
+    today = datetime.date.today()
+    date_str = (today + datetime.timedelta(days=3)).strftime('%Y-%m-%d')
+    conn = sqlite3.connect(db_path)
+    # 场馆1 的 10:00 时段已被教师课表占用，取最后一个场地
+    court_id = conn.execute("SELECT MAX(court_id) FROM courts").fetchone()[0]
+    conn.execute("""
+        INSERT INTO time_slots (court_id, date, start_time, end_time, max_reservations, current_reservations, is_hot)
+        VALUES (?, ?, '10:00:00', '12:00:00', 8, 8, 0)
+    """, (court_id, date_str))
+    conn.commit()
+
+    db = DBManager(db_path, pool_size=4)
+    first = db.maintain_slots(today)
+    second = db.maintain_slots(today)
+    db.close()
+
+    overlapping = conn.execute("SELECT COUNT(*) FROM time_slots WHERE court_id = ? AND date = ? AND start_time = '10:00:00'",
+                               (court_id, date_str)).fetchone()[0]
+    conn.close()
+    print(f"    maintain_slots               首次生成 {first.get('inserted')} 条，再次生成 {second.get('inserted')} 条")
+    check(overlapping == 1 and first.get('inserted', 0) > 0 and second.get('inserted') == 0, "号源生成不重叠且可重复执行",
+          f"号源维护: 10:00 开始的号源 {overlapping} 条，再次执行新增 {second.get('inserted')} 条")
+
+
+def insert_user(cursor, account, role='student', credit_score=100):
+    cursor.execute("""
+        INSERT INTO users (user_account, password, name, role, phone, credit_score, create_time)
+        VALUES (?, '123456', ?, ?, '', ?, datetime('now', 'localtime'))
+    """, (account, account, role, credit_score))
+
+
+def check_migrations(work_dir):
+    """历史重复数据升级: 重复有效预约 (迁移 2)、重复号源合并 (迁移 3) 后人数一致且不超过容量"""
+    print("\n--- 迁移: 历史重复数据 ---")
+    db_path = os.path.join(work_dir, 'migrate.db')
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+    with open(SCHEMA_PATH, 'r', encoding='utf-8') as f:
+        cursor.executescript(f.read())
+    for account in ('u1', 'u2', 'u3'):
+        insert_user(cursor, account)
+    insert_user(cursor, 't1', role='teacher')
+    cursor.execute("INSERT INTO venues (venue_name, is_outdoor, location, description) VALUES ('场馆', 0, '', '')")
+    cursor.execute("INSERT INTO courts (venue_id, court_name) VALUES (1, '1号场')")
+    slots = [
+        ('09:00:00', '10:00:00', 4, 2),  # 1: u1 重复预约两次 (迁移 2)
+        ('10:00:00', '11:00:00', 2, 2),  # 2、3: 重复号源，合并后 3 人 > 容量 2 (迁移 3)
+        ('10:00:00', '11:00:00', 2, 1),
+        ('11:00:00', '12:00:00', 2, 2),  # 4: 教师锁定，教师重复预约
+    ]
+    cursor.executemany("""
+        INSERT INTO time_slots (court_id, date, start_time, end_time, max_reservations, current_reservations, is_hot)
+        VALUES (1, '2099-01-01', ?, ?, ?, ?, 0)
+    """, slots)
+    cursor.executemany("""
+        INSERT INTO reservations (user_account, slot_id, status, create_time)
+        VALUES (?, ?, 'confirmed', datetime('now', 'localtime'))
+    """, [('u1', 1), ('u1', 1), ('u1', 2), ('u2', 2), ('u3', 3), ('t1', 4), ('t1', 4)])
+    conn.commit()
+    conn.close()
+
+    migrate(db_path)
+    conn = sqlite3.connect(db_path)
+    violations = count_slot_violations(conn)
+    counters = dict(conn.execute("SELECT slot_id, current_reservations FROM time_slots").fetchall())
+    trimmed = conn.execute("SELECT user_account FROM reservations WHERE status='cancelled_by_admin'").fetchall()
+    conn.close()
+    check(violations == 0 and counters == {1: 1, 2: 2, 4: 2} and trimmed == [('u3',)],
+          "重复预约释放名额，合并号源不超过容量",
+          f"迁移后计数不一致: 时段人数 {counters}，不一致时段 {violations}，超额取消 {trimmed}")
+
+
+def check_waitlist(db_path):
+    """
+    候补递补: 容量 2 的时段 u1、u2 预约，u3、u4 候补；u1 取消后 u3 递补；
+    管理员再次取消 u1 已取消的预约不能释放名额，u4 仍在候补
+    """
+    print("\n--- 候补递补: 取消 / 管理员取消 ---")
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+    date_str = (datetime.date.today() + datetime.timedelta(days=2)).strftime('%Y-%m-%d')
+    cursor.execute("""
+        INSERT INTO time_slots (court_id, date, start_time, end_time, max_reservations, current_reservations, is_hot)
+        VALUES (1, ?, '22:00:00', '23:00:00', 2, 0, 0)
+    """, (date_str,))
+    slot_id = cursor.lastrowid
+    conn.commit()
+    users = [f"s{i:05d}" for i in range(150, 154)]
+
+    db = DBManager(db_path, pool_size=4, slot_cache_size=0)
+    booked = [db.create_reservation(user, slot_id)[0] for user in users[:2]]
+    joined = [db.join_waitlist(user, slot_id)[0] for user in users[2:]]
+    first = conn.execute("SELECT reservation_id FROM reservations WHERE user_account=? AND slot_id=?",
+                         (users[0], slot_id)).fetchone()[0]
+    cancelled, _ = db.cancel_reservation(users[0], first)
+    repeated, repeat_msg = db.admin_cancel_reservation(first)
+
+    def state():
+        violations = count_slot_violations(conn, "ts.slot_id = ?", (slot_id,))
+        waiting = dict(conn.execute("SELECT user_account, status FROM waitlist WHERE slot_id=?", (slot_id,)).fetchall())
+        return violations, waiting
+
+    violations, waiting = state()
+    check(all(booked) and all(joined) and cancelled and not repeated and violations == 0
+          and waiting == {users[2]: 'promoted', users[3]: 'waiting'},
+          f"取消后按顺序递补，重复取消被拒绝 ({repeat_msg})",
+          f"候补状态错误: 重复取消 {repeated}，不一致时段 {violations}，候补 {waiting}")
+
+    second = conn.execute("SELECT reservation_id FROM reservations WHERE user_account=? AND slot_id=?",
+                          (users[1], slot_id)).fetchone()[0]
+    admin_cancelled, _ = db.admin_cancel_reservation(second)
+    db.close()
+    violations, waiting = state()
+    conn.close()
+    check(admin_cancelled and violations == 0 and waiting == {users[2]: 'promoted', users[3]: 'promoted'},
+          "管理员取消后递补下一位", f"管理员取消后候补状态错误: 不一致时段 {violations}，候补 {waiting}")
+
+
+def check_slot_deltas(work_dir):
+    """
+    增量游标: 预约后只返回人数变化的时段，没有变化时为空；
+    游标无效或场馆缓存被批量作废 (教师课表) 后返回全量
+    """
+    print("\n--- 增量游标: get_slot_changes ---")
+    db_path = os.path.join(work_dir, 'delta.db')
+    create_bench_db(db_path)
+    conn = sqlite3.connect(db_path)
+    date_value = datetime.date.today() + datetime.timedelta(days=1)
+    date_str = date_value.strftime('%Y-%m-%d')
+    slot_id, total = conn.execute("""
+        SELECT MIN(ts.slot_id), COUNT(*) FROM time_slots ts JOIN courts c ON ts.court_id = c.court_id
+        WHERE c.venue_id = 2 AND ts.date = ?
+    """, (date_str,)).fetchone()
+    conn.close()
+
+    db = DBManager(db_path, pool_size=4)
+    _, first = db.get_slot_changes(2, date_str)
+    booked, _ = db.create_reservation('s00010', slot_id)
+    _, delta = db.get_slot_changes(2, date_str, first["cursor"])
+    _, idle = db.get_slot_changes(2, date_str, delta["cursor"])
+    _, bogus = db.get_slot_changes(2, date_str, "bogus")
+    locked, _ = db.add_teacher_schedule('t0001', 2, date_value.weekday(), '10:00:00', '11:00:00')
+    _, stale = db.get_slot_changes(2, date_str, delta["cursor"])
+    db.close()
+
+    print(f"    全量 {len(first['slots'])} 条，预约后增量 {len(delta['slots'])} 条，无变化 {len(idle['slots'])} 条")
+    check(first["full"] and len(first["slots"]) == total and booked
+          and not delta["full"] and [(s["slot_id"], s["current"]) for s in delta["slots"]] == [(slot_id, 1)]
+          and not idle["full"] and not idle["slots"]
+          and bogus["full"] and len(bogus["slots"]) == total,
+          "游标之后只返回变化的时段",
+          f"增量游标: 增量 {delta['slots']}，无变化时 {len(idle['slots'])} 条，无效游标全量 {bogus['full']}")
+    check(locked and stale["full"] and len(stale["slots"]) == total and stale["cursor"] != delta["cursor"],
+          "场馆缓存作废后旧游标返回全量",
+          f"增量游标: 教师课表 {locked}，作废后旧游标全量 {stale['full']} ({len(stale['slots'])}/{total} 条)")
+
+
+def check_push_hub(work_dir):
+    """
+    号源推送: 两个连接订阅同一频道，预约后收到只含变化时段的增量帧；
+    不读数据的连接发送卡住后被断开，另一个连接不受影响；
+    教师课表作废场馆缓存后推送全量帧重新同步，之后继续推送增量
+    """
+    print("\n--- 号源推送: 订阅 / 增量 / 慢消费者 / 重新同步 ---")
+    db_path = os.path.join(work_dir, 'push.db')
+    create_bench_db(db_path)
+    conn = sqlite3.connect(db_path)
+    date_value = datetime.date.today() + datetime.timedelta(days=1)
+    date_str = date_value.strftime('%Y-%m-%d')
+    slots = dict(conn.execute("""
+        SELECT ts.start_time, MIN(ts.slot_id) FROM time_slots ts JOIN courts c ON ts.court_id = c.court_id
+        WHERE c.venue_id = 1 AND ts.date = ? GROUP BY ts.start_time
+    """, (date_str,)).fetchall())
+    conn.close()
+
+    db = DBManager(db_path, pool_size=8)
+    hub = PushHub(db, max_pending=4, send_timeout=0.2)
+    hub.start()
+    reader_sock, reader_peer = socket.socketpair()
+    stalled_sock, stalled_peer = socket.socketpair()
+    # 缩小缓冲区: 不读数据的一端收满一帧全量推送后发送即阻塞
+    stalled_sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 4096)
+    stalled_peer.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096)
+    reader = SocketConnection(reader_sock, hub)
+    stalled = SocketConnection(stalled_sock, hub)
+    frames = []
+
+    def read_frames():
+        try:
+            while True:
+                body = read_message_bytes(reader_peer)
+                if body is None:
+                    return
+                frames.append(json.loads(body))
+        except OSError:
+            pass
+
+    t = threading.Thread(target=read_frames)
+    t.daemon = True
+    t.start()
+
+    def received(full, slot_id=None):
+        return lambda: any(f["full"] == full and (slot_id is None or any(s["slot_id"] == slot_id for s in f["data"]))
+                           for f in frames)
+
+    subscribed = [hub.subscribe(c, 1, date_str)[0] for c in (reader, stalled)]
+    db.create_reservation('s00020', slots['12:00:00'])
+    delta = wait_until(received(False, slots['12:00:00']))
+    delta_frame = next((f for f in frames if not f["full"]), None)
+    locked, _ = db.add_teacher_schedule('t0001', 1, date_value.weekday(), '10:00:00', '11:00:00')
+    resync = wait_until(received(True))
+    # 卡住的连接由分发线程断开 socket，其订阅在下一次推送失败时移除
+    dropped = wait_until(lambda: hub.stats()["dropped_consumers"] == 1)
+    db.create_reservation('s00021', slots['14:00:00'])
+    after = wait_until(received(False, slots['14:00:00']))
+    stats = hub.stats()
+    hub.stop()
+    for sock in (reader_sock, reader_peer, stalled_sock, stalled_peer):
+        sock.close()
+    db.close()
+
+    print(f"    收到推送 {len(frames)} 帧，断开慢消费者 {stats['dropped_consumers']} 个，剩余订阅连接 {stats['connections']}")
+    check(all(subscribed) and delta and delta_frame is not None
+          and [(s["slot_id"], s["current"]) for s in delta_frame["data"]] == [(slots['12:00:00'], 1)],
+          "预约后推送只含变化时段的增量帧",
+          f"号源推送: 订阅 {subscribed}，增量帧 {delta_frame}")
+    check(locked and resync and dropped and after and stats["connections"] == 1 and stalled not in hub.subscriptions,
+          "慢消费者被断开，缓存作废后全量重新同步并继续推送增量",
+          f"号源推送: 全量重新同步 {resync}，断开慢消费者 {dropped}，之后的增量 {after}，订阅连接 {stats['connections']}")
+
+
+def check_waiting_room(db_path):
+    """
+    虚拟排队 (假时钟): 场馆1 在 22:00-22:10 按 2 人/秒放行，5 人同时到达按到达顺序放行；
+    放行前、他人的排队号都不能预约；放行后超过 admit_ttl 未预约需重新排到队尾；其他场馆不排队
+    """
+    print("\n--- 虚拟排队: 放行顺序 ---")
+    conn = sqlite3.connect(db_path)
+    venue_slot, other_slot = (conn.execute("""
+        SELECT MIN(ts.slot_id) FROM time_slots ts JOIN courts c ON ts.court_id = c.court_id WHERE c.venue_id = ?
+    """, (venue_id,)).fetchone()[0] for venue_id in (1, 2))
+    conn.close()
+
+    db = DBManager(db_path, pool_size=2, slot_cache_size=0)
+    now = [0.0]
+    room = WaitingRoom(db, [{"venue_id": 1, "start": "22:00", "end": "22:10", "rate": 2}], admit_ttl=60,
+                       clock=lambda: now[0],
+                       wall_clock=lambda: datetime.datetime.combine(datetime.date.today(), datetime.time(22, 5)))
+    users = [f"s{i:05d}" for i in range(5)]
+    queued = [room.check(user, venue_slot)[1] for user in users]
+    positions = [q["position"] for q in queued]
+    tokens = {user: q["token"] for user, q in zip(users, queued)}
+
+    def allowed(user, token=None):
+        return room.check(user, venue_slot, token or tokens[user])[0]
+
+    now[0] = 1.2  # 已放行 1 + 2.4 -> 前 3 个排队号
+    first_round = [allowed(user) for user in users]
+    borrowed = allowed(users[4], tokens[users[0]])
+    now[0] = 2.0
+    last = allowed(users[4])
+    now[0] = 100.0
+    expired, requeued = room.check(users[3], venue_slot, tokens[users[3]])
+    free = room.check(users[0], other_slot)[0]
+    db.close()
+
+    print(f"    排队位置 {positions}，t=1.2s 放行 {first_round}")
+    check(positions == [0, 1, 2, 3, 4] and first_round == [True, True, True, False, False]
+          and not borrowed and last,
+          "按到达顺序放行，放行前与他人的排队号不能预约",
+          f"虚拟排队: 位置 {positions}，t=1.2s 放行 {first_round}，借用排队号 {borrowed}，t=2s 放行 {last}")
+    check(not expired and requeued and requeued["token"] != tokens[users[3]] and requeued["position"] == 0 and free,
+          "放行超时后重新排队，未配置的场馆直接预约",
+          f"虚拟排队: 超时后 {expired} {requeued}，其他场馆 {free}")
+
+
+def wait_until(condition, timeout=5.0):
+    """轮询等待后台线程完成 (超时返回 False)"""
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.02)
+    return True
+
+
+def check_noshow_monitor(work_dir):
+    """
+    爽约检测 (最小堆): 时钟拨到 10:00 时段结束之后，只判定该时段仍待签到的预约；
+    已取消的预约 (堆中惰性删除) 与 12:00 时段的预约不受影响
+    """
+    print("\n--- 爽约检测: 按时段结束时间出堆 ---")
+    db_path = os.path.join(work_dir, 'noshow.db')
+    create_bench_db(db_path)
+    conn = sqlite3.connect(db_path)
+    date_value = datetime.date.today() + datetime.timedelta(days=2)
+    date_str = date_value.strftime('%Y-%m-%d')
+    early, late = (conn.execute("SELECT slot_id FROM time_slots WHERE court_id = 1 AND date = ? AND start_time = ?",
+                                (date_str, start)).fetchone()[0] for start in ('10:00:00', '12:00:00'))
+
+    db = DBManager(db_path, pool_size=4, slot_cache_size=0)
+    now = [datetime.datetime.combine(date_value, datetime.time(10, 30))]
+    monitor = NoShowMonitor(db, grace_seconds=5, clock=lambda: now[0])
+    monitor.start()
+    booked = [db.create_reservation(f"s{i:05d}", early)[0] for i in range(3)] + [db.create_reservation('s00003', late)[0]]
+    cancelled_id = conn.execute("SELECT reservation_id FROM reservations WHERE user_account='s00000' AND slot_id=?",
+                                (early,)).fetchone()[0]
+    cancelled, _ = db.cancel_reservation('s00000', cancelled_id)
+    # 预约与取消都在时段结束前完成，再把时钟拨到结束 30 秒后唤醒检测线程
+    with monitor.cond:
+        now[0] = datetime.datetime.combine(date_value, datetime.time(11, 0, 30))
+        monitor.cond.notify()
+    marked = wait_until(lambda: monitor.stats()["marked"] >= 2)
+    stats = monitor.stats()
+    monitor.stop()
+    db.close()
+
+    statuses = dict(conn.execute("SELECT user_account, status FROM reservations WHERE slot_id IN (?, ?)",
+                                 (early, late)).fetchall())
+    conn.close()
+    expected = {'s00000': 'cancelled', 's00001': 'no_show', 's00002': 'no_show', 's00003': 'confirmed'}
+    print(f"    判定爽约 {stats['marked']} 条，待签到 {stats['pending']} 条，下一个到期 {stats['next_expiry']}")
+    check(all(booked) and cancelled and marked and stats["marked"] == 2 and stats["pending"] == 1
+          and statuses == expected and stats["next_expiry"] == f"{date_str} 13:00:00",
+          "只判定已结束时段的待签到预约",
+          f"爽约检测: 判定 {stats['marked']} 条，待签到 {stats['pending']} 条，预约状态 {statuses}")
+
+
+def main(check_only=False):
+    """
+    :param check_only: 只运行不变量检查 (--check)，跳过纯性能测量
+    :return: int - 退出状态，有不变量检查失败时为 1
+    """
+    work_dir = tempfile.mkdtemp(prefix='venue_bench_')
+    db_path = os.path.join(work_dir, 'bench.db')
+    try:
+        print(f"[*] 创建基准数据库: {db_path}")
+        create_bench_db(db_path)
+        check_migrations(work_dir)
+        if not check_only:
+            bench_connection_pool(db_path)
+            bench_slot_cache(db_path)
+        stress_booking(db_path)
+        bench_inventory(db_path)
+        check_waitlist(db_path)
+        bench_group_commit(db_path)
+        bench_lottery(db_path, entrants=5000 if check_only else 50000)
+        bench_teacher_schedule(db_path)
+        bench_daily_tasks(db_path, backlog=5000 if check_only else 50000)
+        check_slot_rollout(db_path)
+        check_noshow_monitor(work_dir)
+        check_slot_deltas(work_dir)
+        check_push_hub(work_dir)
+        check_waiting_room(db_path)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    if FAILURES:
+        print(f"\n[!] {len(FAILURES)} 项不变量检查失败:")
+        for message in FAILURES:
+            print(f"    - {message}")
+        return 1
+    print("\n[*] 不变量检查全部通过")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(check_only='--check' in sys.argv[1:]))
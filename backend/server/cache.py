@@ -0,0 +1,301 @@
+import datetime
+import threading
+import time
+from collections import OrderedDict
+
+
+class _SlotEntry:
+    """缓存的一个 (venue_id, date)"""
+    __slots__ = ('slots', 'positions', 'versions', 'epoch', 'seq', 'changed')
+
+    def __init__(self, slots, positions, versions, epoch):
+        self.slots = slots          # 号源列表 (只整体替换)
+        self.positions = positions  # slot_id -> 下标
+        self.versions = versions    # slot_id -> time_slots.version
+        self.epoch = epoch          # 本条缓存的标识，重新填充后改变 (增量游标随之失效)
+        self.seq = 0                # 本条缓存内的变更序号
+        self.changed = {}           # slot_id -> 最后一次变更的序号
+
+
+class AvailabilityCache:
+    """
+    号源余量缓存 (get_available_slots 的结果)，键为 (venue_id, date)
+    - 最多缓存 max_entries 个键，超出时淘汰最久未使用的 (LRU)
+    - 写穿透: 预约/取消提交后按 time_slots.version 更新单个时段的人数，版本号只增不减，
+      多个写请求的事件乱序到达也不会用旧值覆盖新值
+    - 批量变更 (教师课表、号源维护) 直接作废整个场馆或全部缓存
+    - 缓存内的列表只整体替换、不原地修改，调用方拿到的结果可以安全地序列化
+    - 增量同步: 每个键维护变更序号，游标 "epoch:seq" 之后人数变化过的时段可由 get_changes 单独取出
+    填充流程: token = begin_fill() -> 查询数据库 -> fill(key, slots, versions, token)
+    查询期间发生的单时段变更在 fill 时补上，发生的批量作废使本次填充作废，避免把旧数据写入缓存
+    """
+
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()  # key -> _SlotEntry
+        self.slot_keys = {}           # slot_id -> key
+        self.pinned = {}              # key -> 引用计数，被订阅的键不参与 LRU 淘汰
+        # 填充期间的变更记录 (没有进行中的填充时清空)
+        self.seq = 0
+        self.fills_in_flight = 0
+        self.recent_slots = {}        # slot_id -> (version, current)
+        self.dirty_venues = {}        # venue_id -> seq
+        self.cleared_seq = 0
+        # 游标中的 epoch: 启动时间 + 填充序号，服务器重启或缓存重新填充后旧游标都会失效
+        self.instance = format(int(time.time() * 1000), 'x')
+        self.fills = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.updates = 0
+        self.invalidations = 0
+        self.stale_fills = 0
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry.slots
+
+    def get_changes(self, key, since=None):
+        """
+        增量读取: 返回游标 since 之后人数变化过的时段
+        since 为空、格式不对或已失效 (缓存被重新填充) 时返回全部时段
+        :return: (slots, cursor, full) 或 None (未缓存)
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            cursor = f"{entry.epoch}:{entry.seq}"
+            epoch, _, seq = (since or '').rpartition(':')
+            if epoch != entry.epoch or not seq.isdigit() or int(seq) > entry.seq:
+                return entry.slots, cursor, True
+            seq = int(seq)
+            changed = sorted(entry.positions[slot_id] for slot_id, s in entry.changed.items() if s > seq)
+            return [entry.slots[i] for i in changed], cursor, False
+
+    def begin_fill(self):
+        with self.lock:
+            self.fills_in_flight += 1
+            return self.seq
+
+    def fill(self, key, slots, versions, token):
+        """
+        :param slots: 查询结果，None 表示查询失败 (只结束本次填充)
+        :param versions: {slot_id: version}
+        """
+        with self.lock:
+            self.fills_in_flight -= 1
+            try:
+                if slots is None:
+                    return
+                if token < self.cleared_seq or self.dirty_venues.get(int(key[0]), -1) > token:
+                    self.stale_fills += 1
+                    return
+                slots = list(slots)
+                versions = dict(versions)
+                positions = {}
+                for i, slot in enumerate(slots):
+                    slot_id = slot["slot_id"]
+                    positions[slot_id] = i
+                    recent = self.recent_slots.get(slot_id)
+                    if recent and recent[0] > versions.get(slot_id, -1):
+                        versions[slot_id] = recent[0]
+                        slots[i] = dict(slot, current=recent[1])
+                self.fills += 1
+                self._store(key, _SlotEntry(slots, positions, versions, f"{self.instance}-{self.fills}"))
+            finally:
+                if self.fills_in_flight == 0:
+                    self.recent_slots.clear()
+                    self.dirty_venues.clear()
+
+    def _store(self, key, entry):
+        self._drop(key)
+        self.entries[key] = entry
+        for slot_id in entry.positions:
+            self.slot_keys[slot_id] = key
+        for _ in range(len(self.entries)):
+            if len(self.entries) <= self.max_entries:
+                break
+            old_key, old = self.entries.popitem(last=False)
+            if old_key in self.pinned:
+                self.entries[old_key] = old
+                continue
+            for slot_id in old.positions:
+                self.slot_keys.pop(slot_id, None)
+            self.evictions += 1
+
+    def _drop(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            for slot_id in entry.positions:
+                self.slot_keys.pop(slot_id, None)
+
+    def pin(self, key):
+        with self.lock:
+            self.pinned[key] = self.pinned.get(key, 0) + 1
+
+    def unpin(self, key):
+        with self.lock:
+            count = self.pinned.get(key, 0) - 1
+            if count > 0:
+                self.pinned[key] = count
+            else:
+                self.pinned.pop(key, None)
+
+    def key_of(self, slot_id):
+        """时段所在的缓存键 (未缓存时为 None)"""
+        with self.lock:
+            return self.slot_keys.get(slot_id)
+
+    def update_slot(self, slot_id, current, version):
+        """写穿透: 时段人数变为 current (版本号 version)"""
+        with self.lock:
+            self.seq += 1
+            if self.fills_in_flight:
+                recent = self.recent_slots.get(slot_id)
+                if recent is None or version > recent[0]:
+                    self.recent_slots[slot_id] = (version, current)
+            key = self.slot_keys.get(slot_id)
+            if key is None:
+                return
+            entry = self.entries[key]
+            if version <= entry.versions.get(slot_id, -1):
+                return
+            i = entry.positions[slot_id]
+            slots = list(entry.slots)
+            slots[i] = dict(slots[i], current=current)
+            entry.slots = slots
+            entry.versions[slot_id] = version
+            entry.seq += 1
+            entry.changed[slot_id] = entry.seq
+            self.updates += 1
+
+    def invalidate_venue(self, venue_id):
+        venue_id = int(venue_id)    # 缓存键为 int，事件可能携带请求里的字符串
+        with self.lock:
+            self.seq += 1
+            if self.fills_in_flight:
+                self.dirty_venues[venue_id] = self.seq
+            for key in [k for k in self.entries if k[0] == venue_id]:
+                self._drop(key)
+            self.invalidations += 1
+
+    def clear(self):
+        with self.lock:
+            self.seq += 1
+            self.cleared_seq = self.seq
+            self.entries.clear()
+            self.slot_keys.clear()
+            self.invalidations += 1
+
+    def on_event(self, event, data):
+        """DBManager 数据变更监听器"""
+        if event in ('reservation_booked', 'reservation_released'):
+            if data.get('version') is not None:
+                self.update_slot(data['slot_id'], data['current'], data['version'])
+        elif event == 'reservations_changed':
+            self.invalidate_venue(data['venue_id'])
+        elif event == 'slots_changed':
+            if data.get('venue_id') is not None:
+                self.invalidate_venue(data['venue_id'])
+            else:
+                self.clear()
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self.entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0,
+                "evictions": self.evictions,
+                "updates": self.updates,
+                "invalidations": self.invalidations,
+                "stale_fills": self.stale_fills
+            }
+
+
+class ReferenceCache:
+    """
+    版本化参考数据缓存 (场馆、场地、公告)，这些数据一个学期只改几次
+    - 全局版本号单调递增，任意参考数据被修改 (管理员增删改) 时加 1 并清空缓存
+    - 版本号初值取启动时间 (毫秒)，服务器重启后不会与客户端手里的旧版本号相同
+    - 有效公告按日期过滤，跨天时版本号也加 1
+    客户端带上 if_version 请求，版本号未变时服务器只回复 not_modified
+    """
+
+    def __init__(self, clock=time.time):
+        self.lock = threading.Lock()
+        self.version = int(clock() * 1000)
+        self.day = datetime.date.today()
+        self.entries = {}  # key -> data
+        self.hits = 0
+        self.misses = 0
+        self.bumps = 0
+
+    def _check_day(self):
+        today = datetime.date.today()
+        if today != self.day:
+            self.day = today
+            self._bump()
+
+    def _bump(self):
+        self.version += 1
+        self.entries.clear()
+        self.bumps += 1
+
+    def current_version(self):
+        with self.lock:
+            self._check_day()
+            return self.version
+
+    def get(self, key, loader):
+        """
+        读取参考数据，未命中时调用 loader() (返回 (success, data)) 并缓存成功的结果
+        :return: (version, success, data)
+        """
+        with self.lock:
+            self._check_day()
+            version = self.version
+            if key in self.entries:
+                self.hits += 1
+                return version, True, self.entries[key]
+            self.misses += 1
+
+        success, data = loader()
+        with self.lock:
+            # 加载期间数据被修改过则不缓存，返回的版本号也保持加载前的值 (客户端下次会重新拉取)
+            if success and self.version == version:
+                self.entries[key] = data
+        return version, success, data
+
+    def bump(self):
+        with self.lock:
+            self._bump()
+
+    def on_event(self, event, data):
+        """DBManager 数据变更监听器"""
+        if event == 'reference_changed':
+            self.bump()
+
+    def stats(self):
+        with self.lock:
+            return {
+                "version": self.version,
+                "entries": len(self.entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "bumps": self.bumps
+            }
@@ -0,0 +1,249 @@
+import random
+import sqlite3
+import threading
+import time
+
+# 默认的 SQLite 性能配置 (每个新连接建立时应用)
+# - WAL: 读写互不阻塞，长时间写事务 (导课、每日任务) 期间查询照常进行
+# - synchronous=NORMAL: WAL 模式下仍保证数据库一致性，只在断电时可能丢失最近的提交
+# - busy_timeout: 遇到写锁时在 SQLite 内部等待，而不是立即报 database is locked
+#   (与 BusyRetryPolicy 的重试一起构成总等待时间，见 BusyRetryPolicy)
+DEFAULT_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'cache_size': -16000,       # 负数单位为 KB，约 16MB 页缓存
+    'mmap_size': 268435456,     # 256MB 内存映射读
+    'temp_store': 'MEMORY',
+    'busy_timeout': 1000,       # 毫秒
+}
+
+# 运行时可查看的配置项
+INSPECT_PRAGMAS = ('journal_mode', 'synchronous', 'cache_size', 'mmap_size', 'temp_store', 'busy_timeout')
+
+
+def apply_pragmas(conn, pragmas):
+    for name, value in pragmas.items():
+        conn.execute(f"PRAGMA {name}={value}").fetchall()
+
+
+def is_busy_error(e):
+    return isinstance(e, sqlite3.OperationalError) and (
+        'locked' in str(e) or 'busy' in str(e))
+
+
+class BusyRetryPolicy:
+    """
+    SQLITE_BUSY 重试策略: busy_timeout 耗尽后仍拿不到锁时，按指数退避 (带随机抖动) 重试
+    单条语句失败时 SQLite 不会应用其修改，因此重试该语句或 COMMIT 是安全的
+    一条语句最多等待 (attempts + 1) * busy_timeout + 退避时间，默认约 3.1 秒，
+    不超过原先单独使用 5 秒 busy_timeout 的上限，工作线程不会被长时间占住
+    (请求执行器饱和时仍能及时返回 busy)
+    """
+
+    def __init__(self, attempts=2, base_delay=0.02, max_delay=0.5):
+        self.attempts = attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        # 计数器被多个工作线程同时更新
+        self.lock = threading.Lock()
+        self.retries = 0
+
+    def call(self, func, *args):
+        for attempt in range(self.attempts + 1):
+            try:
+                return func(*args)
+            except sqlite3.OperationalError as e:
+                if attempt == self.attempts or not is_busy_error(e):
+                    raise
+                with self.lock:
+                    self.retries += 1
+                delay = min(self.max_delay, self.base_delay * (2 ** attempt))
+                time.sleep(delay * (0.5 + random.random()))
+
+
+class RetryingCursor:
+    """对 execute/executemany 应用 BusyRetryPolicy 的游标，其余接口与 sqlite3.Cursor 一致"""
+
+    def __init__(self, cursor, retry_policy):
+        self._cursor = cursor
+        self._retry = retry_policy
+
+    def execute(self, sql, parameters=()):
+        self._retry.call(self._cursor.execute, sql, parameters)
+        return self
+
+    def executemany(self, sql, seq_of_parameters):
+        # 参数可能是生成器，先物化以便重试
+        rows = list(seq_of_parameters)
+        self._retry.call(self._cursor.executemany, sql, rows)
+        return self
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+class PoolTimeout(Exception):
+    """等待空闲连接超时"""
+    pass
+
+
+class PooledConnection:
+    """
+    连接池中借出的连接
+    接口与 sqlite3.Connection 一致，close() 时归还连接池而不是真正关闭
+    """
+
+    def __init__(self, pool, conn):
+        self._pool = pool
+        self._conn = conn
+
+    def cursor(self):
+        return RetryingCursor(self._conn.cursor(), self._pool.retry_policy)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def commit(self):
+        self._pool.retry_policy.call(self._conn.commit)
+
+    def rollback(self):
+        self._conn.rollback()
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def close(self):
+        if self._conn is not None:
+            conn, self._conn = self._conn, None
+            self._pool.release(conn)
+
+
+class ConnectionPool:
+    """
+    SQLite 连接池
+    - 连接借出/归还复用，避免每个请求都重新打开数据库文件、解析 schema、预热页缓存
+    - 最多 max_size 个连接，全部借出时等待 timeout 秒
+    - 空闲超过 health_check_interval 秒的连接在借出前做一次健康检查
+    - 归还时回滚未提交的事务，保证下一个使用者拿到干净的连接
+    """
+
+    def __init__(self, db_path, max_size=16, timeout=10.0, health_check_interval=30.0,
+                 pragmas=None, retry_policy=None):
+        self.db_path = db_path
+        self.pragmas = pragmas if pragmas is not None else dict(DEFAULT_PRAGMAS)
+        self.retry_policy = retry_policy or BusyRetryPolicy()
+        self.max_size = max_size
+        self.timeout = timeout
+        self.health_check_interval = health_check_interval
+        self.idle = []  # [(connection, 归还时间)]，后进先出，优先复用最热的连接
+        self.size = 0   # 已创建 (空闲 + 借出) 的连接数
+        self.cond = threading.Condition()
+        self.created = 0
+        self.reused = 0
+        self.discarded = 0
+
+    def create_connection(self):
+        # 连接会在不同工作线程之间传递，由连接池保证同一时刻只有一个线程使用
+        conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        try:
+            apply_pragmas(conn, self.pragmas)
+        except Exception:
+            conn.close()
+            raise
+        return conn
+
+    def acquire(self):
+        deadline = time.monotonic() + self.timeout
+        with self.cond:
+            while True:
+                if self.idle:
+                    conn, released_at = self.idle.pop()
+                    break
+                if self.size < self.max_size:
+                    self.size += 1
+                    conn, released_at = None, None
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not self.cond.wait(remaining):
+                    raise PoolTimeout(f"等待数据库连接超时 ({self.timeout}s)")
+
+        if conn is not None and time.monotonic() - released_at > self.health_check_interval:
+            if not self._is_healthy(conn):
+                self._close_quietly(conn)
+                conn = None
+                with self.cond:
+                    self.discarded += 1
+
+        if conn is None:
+            try:
+                conn = self.create_connection()
+            except Exception:
+                with self.cond:
+                    self.size -= 1
+                    self.cond.notify()
+                raise
+            with self.cond:
+                self.created += 1
+        else:
+            with self.cond:
+                self.reused += 1
+        return PooledConnection(self, conn)
+
+    def release(self, conn):
+        healthy = True
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except Exception:
+            healthy = False
+
+        with self.cond:
+            if healthy:
+                self.idle.append((conn, time.monotonic()))
+            else:
+                self.size -= 1
+                self.discarded += 1
+            self.cond.notify()
+        if not healthy:
+            self._close_quietly(conn)
+
+    @staticmethod
+    def _is_healthy(conn):
+        try:
+            conn.execute("SELECT 1").fetchone()
+            return True
+        except Exception:
+            return False
+
+    @staticmethod
+    def _close_quietly(conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def close_all(self):
+        """关闭所有空闲连接 (借出中的连接归还后仍会进入空闲列表)"""
+        with self.cond:
+            idle, self.idle = self.idle, []
+            self.size -= len(idle)
+        for conn, _ in idle:
+            self._close_quietly(conn)
+
+    def stats(self):
+        with self.cond:
+            return {
+                "max_size": self.max_size,
+                "size": self.size,
+                "idle": len(self.idle),
+                "created": self.created,
+                "reused": self.reused,
+                "discarded": self.discarded,
+                "busy_retries": self.retry_policy.retries
+            }
@@ -1,16 +1,105 @@
 import sqlite3
 import os
+import sys
+import time
+
+try:
+    from server.connection_pool import ConnectionPool, DEFAULT_PRAGMAS, INSPECT_PRAGMAS, apply_pragmas
+    from server.cache import AvailabilityCache, ReferenceCache
+    from server.lottery import allocate
+except ImportError:
+    # Fallback for direct execution
+    sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+    from connection_pool import ConnectionPool, DEFAULT_PRAGMAS, INSPECT_PRAGMAS, apply_pragmas
+    from cache import AvailabilityCache, ReferenceCache
+    from lottery import allocate
 
 # 获取项目根目录 (假设此文件在 server/ 目录下)
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 DB_PATH = os.path.join(BASE_DIR, 'database', 'sports_venue.db')
 
+# 热门时段抽签每人最多填写的志愿数
+MAX_LOTTERY_PREFERENCES = 5
+
+if BASE_DIR not in sys.path:
+    sys.path.append(BASE_DIR)
+from database.init_db import migrate
+
 class DBManager:
-    def __init__(self, db_path=DB_PATH):
+    def __init__(self, db_path=DB_PATH, pool_size=16, pragmas=None, auto_migrate=True, slot_cache_size=256):
+        """
+        :param pool_size: 连接池大小，0 表示不使用连接池 (每次调用都新建连接)
+        :param pragmas: 覆盖默认 SQLite 性能配置 (DEFAULT_PRAGMAS) 的项，如 {"synchronous": "FULL"}
+        :param auto_migrate: 启动时将数据库升级到最新 schema 版本 (索引等)
+        :param slot_cache_size: 号源余量缓存最多缓存的 (场馆, 日期) 数，0 表示不缓存
+        """
         self.db_path = db_path
+        if auto_migrate:
+            migrate(db_path)
+        self.pragmas = dict(DEFAULT_PRAGMAS)
+        if pragmas:
+            self.pragmas.update(pragmas)
+        self.pool = ConnectionPool(db_path, pool_size, pragmas=self.pragmas) if pool_size else None
+        # 数据变更监听器 callback(event, data)，见 add_listener
+        self.listeners = []
+        self.slot_cache = None
+        if slot_cache_size:
+            self.slot_cache = AvailabilityCache(slot_cache_size)
+            self.add_listener(self.slot_cache.on_event)
+        # 场馆、场地、公告的版本化缓存
+        self.ref_cache = ReferenceCache()
+        self.add_listener(self.ref_cache.on_event)
+        # 热门时段内存库存引擎 (InventoryEngine.start 时设置)，为 None 时所有预约直接写数据库
+        self.inventory = None
+        # 写操作组提交协调器 (GroupCommit.start 时设置)，为 None 时每个写操作单独提交，见 run_write
+        self.group_commit = None
 
     def get_connection(self):
-        return sqlite3.connect(self.db_path)
+        """
+        获取数据库连接
+        使用连接池时返回借出的连接，调用方 conn.close() 即归还连接池
+        """
+        if self.pool:
+            return self.pool.acquire()
+        conn = sqlite3.connect(self.db_path)
+        apply_pragmas(conn, self.pragmas)
+        return conn
+
+    def get_db_settings(self):
+        """
+        查看当前连接实际生效的 SQLite 配置
+        :return: dict - {pragma: 当前值}
+        """
+        conn = self.get_connection()
+        try:
+            return {name: conn.execute(f"PRAGMA {name}").fetchone()[0] for name in INSPECT_PRAGMAS}
+        finally:
+            conn.close()
+
+    def close(self):
+        if self.pool:
+            self.pool.close_all()
+
+    def add_listener(self, callback):
+        """
+        注册数据变更监听器，事务提交后在调用线程中同步回调 callback(event, data)
+        事件:
+        - reservation_booked: 新预约 {reservation_id, user_account, slot_id, date, end_time, current, version}
+        - reservation_released: 预约取消并释放名额 {reservation_id, user_account, slot_id, current, version}
+        - reservation_closed: 预约结束但不释放名额 (签到) {reservation_id, user_account, slot_id}
+        - reservations_changed: 批量变更预约 (教师课表) {venue_id}
+        - slots_changed: 批量变更号源 (号源维护、删除场馆/场地) {}
+        - reference_changed: 场馆、场地或公告被修改 {}
+        """
+        self.listeners.append(callback)
+
+    def _emit(self, event, **data):
+        # 监听器异常不影响已提交的业务结果
+        for callback in self.listeners:
+            try:
+                callback(event, data)
+            except Exception as e:
+                print(f"[!] 数据变更监听器处理 {event} 失败: {e}")
 
     def validate_login(self, account, password):
         """
@@ -40,6 +129,49 @@ class DBManager:
         finally:
             conn.close()
 
+    def get_user_role(self, account):
+        """
+        查询用户角色
+        :return: str/None - 角色 (student/teacher/admin)，用户不存在或出错时为 None
+        """
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        try:
+            cursor.execute("SELECT role FROM users WHERE user_account=?", (account,))
+            user = cursor.fetchone()
+            return user[0] if user else None
+        except Exception:
+            return None
+        finally:
+            conn.close()
+
+    def get_credit_score(self, account):
+        """
+        查询用户信用分
+        :return: int/None - 用户不存在时为 None
+        """
+        conn = self.get_connection()
+        try:
+            row = conn.execute("SELECT credit_score FROM users WHERE user_account=?", (account,)).fetchone()
+            return row[0] if row else None
+        finally:
+            conn.close()
+
+    def get_slot_venue(self, slot_id):
+        """
+        查询时段所属场馆
+        :return: int/None - 时段不存在时为 None
+        """
+        conn = self.get_connection()
+        try:
+            row = conn.execute("""
+                SELECT c.venue_id FROM time_slots ts JOIN courts c ON ts.court_id = c.court_id
+                WHERE ts.slot_id = ?
+            """, (slot_id,)).fetchone()
+            return row[0] if row else None
+        finally:
+            conn.close()
+
     def register_user(self, account, password, name, role, phone):
         """
         注册新用户
@@ -72,9 +204,8 @@ class DBManager:
     def get_available_slots(self, venue_id, date_str):
         """
         查询某场馆某天的可用时间段
+        结果缓存在 slot_cache 中，预约/取消时写穿透更新
         """
-        conn = self.get_connection()
-        cursor = conn.cursor()
         try:
             import datetime
             # 校验日期范围：只能查询未来3天 (Today ~ Today+2)
@@ -86,11 +217,63 @@ class DBManager:
             if query_date < today or query_date > max_date:
                 return False, "只能查询未来3天内的号源"
 
+            if not self.slot_cache:
+                return True, self._query_available_slots(venue_id, date_str)[0]
+            
+            # 先查缓存，未命中时查询数据库并填充
+            key = (int(venue_id), date_str)
+            slots = self.slot_cache.get(key)
+            if slots is None:
+                token = self.slot_cache.begin_fill()
+                result = (None, None)
+                try:
+                    result = self._query_available_slots(venue_id, date_str)
+                finally:
+                    self.slot_cache.fill(key, result[0], result[1], token)
+                slots = result[0]
+            return True, slots
+        except Exception as e:
+            return False, str(e)
+
+    def get_slot_changes(self, venue_id, date_str, since=None):
+        """
+        增量查询号源: 只返回游标 since 之后人数发生变化的时段
+        since 为空或已失效 (服务器重启、缓存被重新填充) 时返回全部时段，full=True
+        :return: (bool, dict) - {"slots": [...], "cursor": 新游标, "full": 是否为全量}
+        """
+        if self.slot_cache:
+            try:
+                result = self.slot_cache.get_changes((int(venue_id), date_str), since)
+            except ValueError as e:
+                return False, str(e)
+            if result is not None:
+                slots, cursor, full = result
+                return True, {"slots": slots, "cursor": cursor, "full": full}
+        
+        # 未缓存: 走普通查询 (包括日期校验) 并填充缓存，再取一次游标
+        success, slots = self.get_available_slots(venue_id, date_str)
+        if not success:
+            return False, slots
+        result = self.slot_cache.get_changes((int(venue_id), date_str)) if self.slot_cache else None
+        if result is None:
+            # 不使用缓存或本次填充被作废: 返回全量，不带游标
+            return True, {"slots": slots, "cursor": None, "full": True}
+        slots, cursor, _ = result
+        return True, {"slots": slots, "cursor": cursor, "full": True}
+
+    def _query_available_slots(self, venue_id, date_str):
+        """
+        内部方法：从数据库查询号源
+        :return: (slots, {slot_id: version})
+        """
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        try:
             # 关联查询：时间段 -> 场地 -> 场馆
             # 查询所有时间段（包括已满），由前端判断是否可预约
             sql = """
                 SELECT ts.slot_id, c.court_name, ts.start_time, ts.end_time, 
-                       ts.current_reservations, ts.max_reservations, ts.is_hot
+                       ts.current_reservations, ts.max_reservations, ts.is_hot, ts.version
                 FROM time_slots ts
                 JOIN courts c ON ts.court_id = c.court_id
                 WHERE c.venue_id = ? AND ts.date = ?
@@ -100,6 +283,7 @@ class DBManager:
             rows = cursor.fetchall()
             
             slots = []
+            versions = {}
             for row in rows:
                 slots.append({
                     "slot_id": row[0],
@@ -110,78 +294,110 @@ class DBManager:
                     "max": row[5],
                     "is_hot": row[6]
                 })
-            return True, slots
-        except Exception as e:
-            return False, str(e)
+                versions[row[0]] = row[7]
+            return slots, versions
         finally:
             conn.close()
 
     def create_reservation(self, user_account, slot_id):
         """
         创建预约 (核心事务逻辑)
+        容量检查与名额占用由一条条件 UPDATE 完成，重复预约由唯一索引兜底，
+        并发预约同一热门时段时不会超卖
+        开启内存库存引擎时，热门时段的预约由引擎在内存中判定、批量写入
         """
-        conn = self.get_connection()
-        cursor = conn.cursor()
+        if self.inventory:
+            result = self.inventory.book(user_account, slot_id)
+            if result is not None:
+                return result
         try:
-            import datetime
-            # 1. 检查用户信用分
-            cursor.execute("SELECT credit_score FROM users WHERE user_account=?", (user_account,))
-            user_res = cursor.fetchone()
-            if not user_res:
-                return False, "用户不存在"
-            credit_score = user_res[0]
-            
-            # 逻辑：信用分限制 (低于60分禁止预约)
-            if credit_score <= 60:
-                return False, "您的信用分过低(≤60)，已被禁止预约。请等待一周后恢复。"
-            
-            # 2. 检查时间段状态 (容量、是否热门)
-            cursor.execute("SELECT current_reservations, max_reservations, is_hot, start_time FROM time_slots WHERE slot_id=?", (slot_id,))
+            return self.run_write(lambda cursor: self._book_in_transaction(cursor, user_account, slot_id))
+        except Exception as e:
+            return False, f"预约失败: {str(e)}"
+
+    def _book_in_transaction(self, cursor, user_account, slot_id):
+        import datetime
+        # 1. 检查用户信用分
+        cursor.execute("SELECT credit_score FROM users WHERE user_account=?", (user_account,))
+        user_res = cursor.fetchone()
+        if not user_res:
+            return (False, "用户不存在"), []
+        credit_score = user_res[0]
+
+        # 逻辑：信用分限制 (低于60分禁止预约)
+        if credit_score <= 60:
+            return (False, "您的信用分过低(≤60)，已被禁止预约。请等待一周后恢复。"), []
+
+        # 2. 占用名额: 容量检查与当前预约人数 +1 在同一条语句中完成
+        # 逻辑：满员或 (热门时段且信用分 ≤80) 时不更新任何行
+        cursor.execute("""
+            UPDATE time_slots 
+            SET current_reservations = current_reservations + 1, version = version + 1 
+            WHERE slot_id = ? AND current_reservations < max_reservations
+            AND (is_hot = 0 OR ? > 80)
+        """, (slot_id, credit_score))
+
+        if cursor.rowcount == 0:
+            # 失败路径上再查询一次，给出具体原因
+            cursor.execute("SELECT current_reservations, max_reservations, is_hot FROM time_slots WHERE slot_id=?", (slot_id,))
             slot_res = cursor.fetchone()
             if not slot_res:
-                return False, "时间段不存在"
-            current_res, max_res, is_hot, start_time = slot_res
-            # 逻辑：如果满了，无法预约
+                return (False, "时间段不存在"), []
+            current_res, max_res, is_hot = slot_res
             if current_res >= max_res:
-                return False, "该时段预约人数已满"
-            
-            # 逻辑：信用分限制 (示例：低于80分不能预约热门时段 - 可选)
-            if is_hot and credit_score <= 80:
-                 return False, "您的信用分低于80，无法预约热门时段"
-            
-            # 3. 检查用户是否在该时段已有预约 (防止冲突)
-            # 这里简化处理，假设一个 slot_id 代表一个具体场地的具体时段
-            # 如果是不同场地同一时间，可能需要更复杂的 SQL 判断 start_time
-            cursor.execute("""
-                SELECT r.reservation_id FROM reservations r
-                WHERE r.user_account = ? AND r.slot_id = ? AND r.status = 'confirmed'
-            """, (user_account, slot_id))
-            if cursor.fetchone():
-                return False, "您已预约过该时段，请勿重复预约"
+                return (False, "该时段预约人数已满"), []
+            return (False, "您的信用分低于80，无法预约热门时段"), []
 
-            # 4. 执行预约 (事务开始)
-            # 插入预约记录
-            create_time = datetime.datetime.now()
+        # 3. 插入预约记录
+        # 唯一索引 (user_account, slot_id, status='confirmed') 防止同一用户重复预约该时段
+        create_time = datetime.datetime.now()
+        try:
             cursor.execute("""
                 INSERT INTO reservations (user_account, slot_id, status, create_time)
                 VALUES (?, ?, 'confirmed', ?)
             """, (user_account, slot_id, create_time))
-            
-            # 更新时间段的当前预约人数 (+1)
-            cursor.execute("""
-                UPDATE time_slots 
-                SET current_reservations = current_reservations + 1 
-                WHERE slot_id = ?
-            """, (slot_id,))
-            
-            conn.commit() # 提交事务
-            return True, "预约成功"
-            
-        except Exception as e:
-            conn.rollback() # 发生错误回滚
-            return False, f"预约失败: {str(e)}"
+        except sqlite3.IntegrityError:
+            return (False, "您已预约过该时段，请勿重复预约"), []
+        reservation_id = cursor.lastrowid
+
+        slot_date = slot_end = current = version = None
+        if self.listeners:
+            # 仍持有写锁，读到的人数与版本号就是本次提交后的值
+            cursor.execute("SELECT date, end_time, current_reservations, version FROM time_slots WHERE slot_id=?", (slot_id,))
+            slot_date, slot_end, current, version = cursor.fetchone()
+        event = dict(reservation_id=reservation_id, user_account=user_account, slot_id=slot_id,
+                     date=slot_date, end_time=slot_end, current=current, version=version)
+        return (True, "预约成功"), [('reservation_booked', event)]
+
+    def run_write(self, operation):
+        """
+        执行一个写操作 operation(cursor) -> ((bool, msg), [(event, data), ...])
+        - 开启组提交 (GroupCommit) 时交给提交协调线程，与其他并发写操作合并在一个事务中提交
+        - 否则单独开启 BEGIN IMMEDIATE 事务
+        返回 False 的操作其修改全部回滚；事务提交后按顺序发出 operation 返回的事件
+        :raises Exception: operation 或提交失败 (已回滚)
+        """
+        if self.group_commit:
+            return self.group_commit.submit(operation)
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        try:
+            # BEGIN IMMEDIATE 一开始就拿到写锁，避免先读后写时升级锁失败 (database is locked)
+            cursor.execute("BEGIN IMMEDIATE")
+            result, events = operation(cursor)
+            if result[0]:
+                conn.commit()
+            else:
+                conn.rollback()
+        except Exception:
+            conn.rollback()
+            raise
         finally:
             conn.close()
+        if result[0]:
+            for event, data in events:
+                self._emit(event, **data)
+        return result
 
     def get_user_reservations(self, user_account):
         """
@@ -222,51 +438,53 @@ class DBManager:
         """
         取消预约
         """
-        conn = self.get_connection()
-        cursor = conn.cursor()
         try:
-            import datetime
-            
-            # 1. 检查预约是否存在且属于该用户，且状态为 confirmed
-            cursor.execute("""
-                SELECT slot_id, status FROM reservations 
-                WHERE reservation_id = ? AND user_account = ?
-            """, (reservation_id, user_account))
-            res = cursor.fetchone()
-            
-            if not res:
-                return False, "预约不存在或无权操作"
-            
-            slot_id, status = res
-            
-            if status != 'confirmed':
-                return False, f"当前状态({status})无法取消"
-            
-            # 2. 执行取消 (事务)
-            cancel_time = datetime.datetime.now()
-            
-            # 更新预约状态
-            cursor.execute("""
-                UPDATE reservations 
-                SET status = 'cancelled', cancel_time = ?
-                WHERE reservation_id = ?
-            """, (cancel_time, reservation_id))
-            
-            # 释放名额 (人数 -1)
-            cursor.execute("""
-                UPDATE time_slots 
-                SET current_reservations = current_reservations - 1 
-                WHERE slot_id = ?
-            """, (slot_id,))
-            
-            conn.commit()
-            return True, "取消成功"
-            
+            return self.run_write(lambda cursor: self._cancel_in_transaction(cursor, user_account, reservation_id))
         except Exception as e:
-            conn.rollback()
             return False, f"取消失败: {str(e)}"
-        finally:
-            conn.close()
+
+    def _cancel_in_transaction(self, cursor, user_account, reservation_id):
+        import datetime
+
+        # 1. 检查预约是否存在且属于该用户，且状态为 confirmed
+        cursor.execute("""
+            SELECT slot_id, status FROM reservations 
+            WHERE reservation_id = ? AND user_account = ?
+        """, (reservation_id, user_account))
+        res = cursor.fetchone()
+
+        if not res:
+            return (False, "预约不存在或无权操作"), []
+
+        slot_id, status = res
+
+        if status != 'confirmed':
+            return (False, f"当前状态({status})无法取消"), []
+
+        # 2. 执行取消
+        cancel_time = datetime.datetime.now()
+
+        # 更新预约状态
+        cursor.execute("""
+            UPDATE reservations 
+            SET status = 'cancelled', cancel_time = ?
+            WHERE reservation_id = ?
+        """, (cancel_time, reservation_id))
+
+        # 释放名额 (人数 -1)
+        cursor.execute("""
+            UPDATE time_slots 
+            SET current_reservations = current_reservations - 1, version = version + 1 
+            WHERE slot_id = ?
+        """, (slot_id,))
+        cursor.execute("SELECT current_reservations, version FROM time_slots WHERE slot_id=?", (slot_id,))
+        current, version = cursor.fetchone()
+
+        event = dict(reservation_id=reservation_id, user_account=user_account, slot_id=slot_id,
+                     current=current, version=version)
+        # 3. 空出的名额在同一事务中递补给候补队列
+        promoted = self._promote_waitlist(cursor, slot_id, cancel_time, freed=1)
+        return (True, "取消成功"), [('reservation_released', event)] + promoted
 
     def add_teacher_schedule(self, teacher_account, venue_id, day_of_week, start_time, end_time):
         """
@@ -274,6 +492,10 @@ class DBManager:
         :param venue_id: 场馆ID (锁定该场馆下所有场地)
         :param day_of_week: 0=周一 ... 6=周日
         """
+        # 内存库存引擎中已判定成功的预约先写入数据库，与其他有效预约一起被课表取消
+        # (在借出连接之前等待: 写线程写入也需要连接，连接池较小时持有连接等待可能互相卡住)
+        if self.inventory is not None and not self.inventory.flush():
+            return False, "服务器繁忙，请稍后重试"
         conn = self.get_connection()
         cursor = conn.cursor()
         try:
@@ -303,76 +525,55 @@ class DBManager:
             day = min(today.day, calendar.monthrange(year, month)[1])
             end_date_str = datetime.date(year, month, day).strftime('%Y-%m-%d')
 
-            # 4. 插入课表记录 (记录截止日期)
+            # 4. 计算所有目标日期 (今天起每周的 day_of_week，直到截止日期)
+            end_date = datetime.datetime.strptime(end_date_str, '%Y-%m-%d').date()
+            current_date = today + datetime.timedelta(days=(day_of_week - today.weekday()) % 7)
+            target_dates = []
+            while current_date <= end_date:
+                target_dates.append(current_date.strftime('%Y-%m-%d'))
+                current_date += datetime.timedelta(days=7)
+            now = datetime.datetime.now()
+            
+            cursor.execute("BEGIN IMMEDIATE")
+            
+            # 5. 插入课表记录 (记录截止日期)
             cursor.execute("""
                 INSERT INTO class_schedules (teacher_account, venue_id, day_of_week, start_time, end_time, end_date)
                 VALUES (?, ?, ?, ?, ?, ?)
             """, (teacher_account, venue_id, day_of_week, start_time, end_time, end_date_str))
             
-            # 5. 遍历未来4个月的每一天，按需生成或更新时间段
-            current_date = today
-            end_date = datetime.datetime.strptime(end_date_str, '%Y-%m-%d').date()
+            # 6. 批量锁定场地: 时间段不存在则按需生成 (直接设为满员)，已存在则锁定 (人数设为上限)
+            cursor.executemany("""
+                INSERT INTO time_slots (court_id, date, start_time, end_time, max_reservations, current_reservations, is_hot)
+                VALUES (?, ?, ?, ?, 1, 1, 0)
+                ON CONFLICT(court_id, date, start_time, end_time)
+                DO UPDATE SET current_reservations = max_reservations, version = version + 1
+            """, [(court_id, date_str, start_time, end_time) for date_str in target_dates for court_id in court_ids])
             
-            while current_date <= end_date:
-                if current_date.weekday() == day_of_week:
-                    date_str = current_date.strftime('%Y-%m-%d')
-                    
-                    # 对该场馆下的每一个场地进行锁定
-                    for court_id in court_ids:
-                        # 检查时间段是否存在
-                        cursor.execute("""
-                            SELECT slot_id, max_reservations, current_reservations 
-                            FROM time_slots 
-                            WHERE court_id = ? AND date = ? AND start_time = ? AND end_time = ?
-                        """, (court_id, date_str, start_time, end_time))
-                        
-                        slot_res = cursor.fetchone()
-                        
-                        if slot_res:
-                            # --- 情况A: 时间段已存在 ---
-                            s_id, s_max, s_curr = slot_res
-                            
-                            # A1. 取消冲突预约
-                            cursor.execute("""
-                                UPDATE reservations 
-                                SET status = 'cancelled_by_teacher', cancel_time = ?
-                                WHERE slot_id = ? AND user_account != ? AND status = 'confirmed'
-                            """, (datetime.datetime.now(), s_id, teacher_account))
-                            
-                            # A2. 锁定场地
-                            cursor.execute("""
-                                UPDATE time_slots 
-                                SET current_reservations = ? 
-                                WHERE slot_id = ?
-                            """, (s_max, s_id))
-                            
-                        else:
-                            # --- 情况B: 时间段不存在 (按需生成) ---
-                            s_max = 1 # 默认容量
-                            
-                            cursor.execute("""
-                                INSERT INTO time_slots (court_id, date, start_time, end_time, max_reservations, current_reservations, is_hot)
-                                VALUES (?, ?, ?, ?, ?, ?, 0)
-                            """, (court_id, date_str, start_time, end_time, s_max, s_max)) # 直接设为满员
-                            s_id = cursor.lastrowid
-
-                        # --- 公共步骤: 为教师创建预约 ---
-                        # 检查是否已预约
-                        cursor.execute("""
-                            SELECT reservation_id FROM reservations 
-                            WHERE slot_id = ? AND user_account = ? AND status = 'confirmed'
-                        """, (s_id, teacher_account))
-                        
-                        if not cursor.fetchone():
-                            cursor.execute("""
-                                INSERT INTO reservations (user_account, slot_id, status, create_time)
-                                VALUES (?, ?, 'confirmed', ?)
-                            """, (teacher_account, s_id, datetime.datetime.now()))
-
-                # 移动到下一天
-                current_date += datetime.timedelta(days=1)
+            # 受影响的时间段: 该场馆所有场地、日期范围内、星期匹配 (%w: 0=周日)、时间匹配
+            affected_slots = """
+                SELECT ts.slot_id FROM time_slots ts
+                JOIN courts c ON ts.court_id = c.court_id
+                WHERE c.venue_id = ? AND ts.date BETWEEN ? AND ?
+                AND strftime('%w', ts.date) = ? AND ts.start_time = ? AND ts.end_time = ?
+            """
+            slot_params = (venue_id, today_str, end_date_str, str((day_of_week + 1) % 7), start_time, end_time)
+            
+            # 7. 一条语句取消所有冲突预约
+            cursor.execute(f"""
+                UPDATE reservations 
+                SET status = 'cancelled_by_teacher', cancel_time = ?
+                WHERE status = 'confirmed' AND user_account != ? AND slot_id IN ({affected_slots})
+            """, (now, teacher_account) + slot_params)
+            
+            # 8. 为教师创建预约 (已有有效预约的时间段由唯一索引跳过)
+            cursor.execute(f"""
+                INSERT OR IGNORE INTO reservations (user_account, slot_id, status, create_time)
+                SELECT ?, slot_id, 'confirmed', ? FROM ({affected_slots})
+            """, (teacher_account, now) + slot_params)
 
             conn.commit()
+            self._emit('reservations_changed', venue_id=int(venue_id))
             return True, "课表导入成功，未来4个月的相关场地已锁定"
             
         except Exception as e:
@@ -384,6 +585,7 @@ class DBManager:
     def remove_teacher_schedule(self, teacher_account, schedule_id):
         """
         教师移除课表 (解锁场地)
+        按 场馆 + 星期 (strftime('%w')) + 时间 在 SQL 中匹配受影响的时间段，批量释放
         """
         conn = self.get_connection()
         cursor = conn.cursor()
@@ -393,17 +595,14 @@ class DBManager:
             
             # 1. 获取课表详情以用于查找受影响的 slot
             # 注意：这里需要获取 end_date，以便知道当初锁定了多久
-            cursor.execute("SELECT court_id, day_of_week, start_time, end_time, end_date FROM class_schedules WHERE schedule_id=?", (schedule_id,))
+            cursor.execute("SELECT venue_id, day_of_week, start_time, end_time, end_date FROM class_schedules WHERE schedule_id=?", (schedule_id,))
             schedule = cursor.fetchone()
             if not schedule:
                 return False, "课表不存在"
             
-            court_id, day_of_week, start_time, end_time, end_date_str = schedule
+            venue_id, day_of_week, start_time, end_time, end_date_str = schedule
             
-            # 2. 删除课表记录
-            cursor.execute("DELETE FROM class_schedules WHERE schedule_id=?", (schedule_id,))
-            
-            # 3. 解锁未来受影响的时间段 (使用当初记录的 end_date)
+            # 2. 解锁未来受影响的时间段 (使用当初记录的 end_date)
             today = datetime.date.today()
             today_str = today.strftime('%Y-%m-%d')
             
@@ -414,58 +613,71 @@ class DBManager:
                 month = (today.month + 4 - 1) % 12 + 1
                 day = min(today.day, calendar.monthrange(year, month)[1])
                 end_date_str = datetime.date(year, month, day).strftime('%Y-%m-%d')
-
+            
+            # 如果该时间段在未来3天之外，直接删除该 time_slot 记录
+            # 如果在3天内，则保留（因为普通用户可见可约）
+            max_rolling_date = (today + datetime.timedelta(days=2)).strftime('%Y-%m-%d')
+            
+            cursor.execute("BEGIN IMMEDIATE")
+            
+            # 3. 删除课表记录
+            cursor.execute("DELETE FROM class_schedules WHERE schedule_id=?", (schedule_id,))
+            
+            # 4. 找出需要释放的时间段: 场馆匹配、日期范围内、星期匹配 (%w: 0=周日)、时间匹配，
+            #    且确实被该教师预约了 (避免误操作其他人的预约)
+            cursor.execute("CREATE TEMP TABLE IF NOT EXISTS released_slots (slot_id INTEGER PRIMARY KEY, date TEXT)")
+            cursor.execute("DELETE FROM released_slots")
             cursor.execute("""
-                SELECT slot_id, date, start_time, end_time 
-                FROM time_slots 
-                WHERE court_id = ? AND date >= ? AND date <= ?
-            """, (court_id, today_str, end_date_str))
+                INSERT INTO released_slots (slot_id, date)
+                SELECT ts.slot_id, ts.date FROM time_slots ts
+                JOIN courts c ON ts.court_id = c.court_id
+                WHERE c.venue_id = ? AND ts.date BETWEEN ? AND ?
+                AND strftime('%w', ts.date) = ?
+                AND substr(ts.start_time, 1, 5) = substr(?, 1, 5) AND substr(ts.end_time, 1, 5) = substr(?, 1, 5)
+                AND EXISTS (
+                    SELECT 1 FROM reservations r
+                    WHERE r.slot_id = ts.slot_id AND r.user_account = ? AND r.status = 'confirmed'
+                )
+            """, (venue_id, today_str, end_date_str, str((day_of_week + 1) % 7), start_time, end_time, teacher_account))
             
-            slots = cursor.fetchall()
+            # A. 取消教师的预约
+            cursor.execute("""
+                UPDATE reservations 
+                SET status = 'cancelled', cancel_time = ?
+                WHERE user_account = ? AND status = 'confirmed'
+                AND slot_id IN (SELECT slot_id FROM released_slots)
+            """, (datetime.datetime.now(), teacher_account))
             
-            for slot in slots:
-                s_id, s_date_str, s_start, s_end = slot
-                
-                if s_start[:5] != start_time[:5] or s_end[:5] != end_time[:5]:
-                    continue
-                
-                s_date = datetime.datetime.strptime(s_date_str, '%Y-%m-%d').date()
-                if s_date.weekday() != day_of_week:
-                    continue
-                
-                # --- 匹配成功，执行解锁逻辑 ---
-                
-                # 检查该时间段是否确实被该教师预约了 (避免误操作其他人的预约)
-                cursor.execute("""
-                    SELECT reservation_id FROM reservations 
-                    WHERE slot_id = ? AND user_account = ? AND status = 'confirmed'
-                """, (s_id, teacher_account))
-                
-                if cursor.fetchone():
-                    # A. 取消教师的预约
-                    cursor.execute("""
-                        UPDATE reservations 
-                        SET status = 'cancelled', cancel_time = ?
-                        WHERE slot_id = ? AND user_account = ? AND status = 'confirmed'
-                    """, (datetime.datetime.now(), s_id, teacher_account))
-                    
-                    # B. 重置场地状态
-                    # 只有在确认是教师锁定的情况下才重置
-                    cursor.execute("""
-                        UPDATE time_slots 
-                        SET current_reservations = 0 
-                        WHERE slot_id = ?
-                    """, (s_id,))
-
-                    # 如果该时间段在未来3天之外，直接删除该 time_slot 记录
-                    # 如果在3天内，则保留（因为普通用户可见可约）
-                    max_rolling_date = today + datetime.timedelta(days=2)
-                    s_date_obj = datetime.datetime.strptime(s_date_str, '%Y-%m-%d').date()
-                    
-                    if s_date_obj > max_rolling_date:
-                        cursor.execute("DELETE FROM time_slots WHERE slot_id = ?", (s_id,))
+            # B. 重置场地状态
+            cursor.execute("""
+                UPDATE time_slots 
+                SET current_reservations = 0, version = version + 1 
+                WHERE slot_id IN (SELECT slot_id FROM released_slots)
+            """)
+            
+            # C. 候补递补: 即将删除的时段上的候补直接过期，其余释放的时段按候补顺序递补
+            now = datetime.datetime.now()
+            cursor.execute("""
+                UPDATE waitlist SET status = 'expired', update_time = ?
+                WHERE status = 'waiting' AND slot_id IN (SELECT slot_id FROM released_slots WHERE date > ?)
+            """, (now, max_rolling_date))
+            cursor.execute("""
+                SELECT DISTINCT w.slot_id FROM waitlist w JOIN released_slots rs ON w.slot_id = rs.slot_id
+                WHERE w.status = 'waiting'
+            """)
+            for (slot_id,) in cursor.fetchall():
+                # 批量变更由 reservations_changed 事件通知，不再逐条发出事件
+                self._promote_waitlist(cursor, slot_id, now)
+
+            # D. 删除未来3天之外的时间段
+            cursor.execute("""
+                DELETE FROM time_slots 
+                WHERE slot_id IN (SELECT slot_id FROM released_slots WHERE date > ?)
+            """, (max_rolling_date,))
             
+            cursor.execute("DELETE FROM released_slots")
             conn.commit()
+            self._emit('reservations_changed', venue_id=int(venue_id))
             return True, "课表移除成功，场地已释放"
             
         except Exception as e:
@@ -509,189 +721,613 @@ class DBManager:
         """
         用户签到 (防止爽约)
         """
+        try:
+            return self.run_write(lambda cursor: self._check_in_in_transaction(cursor, user_account, reservation_id))
+        except Exception as e:
+            return False, str(e)
+
+    def _check_in_in_transaction(self, cursor, user_account, reservation_id):
+        # 检查预约状态
+        cursor.execute("SELECT status, slot_id FROM reservations WHERE reservation_id=? AND user_account=?", (reservation_id, user_account))
+        res = cursor.fetchone()
+        if not res:
+            return (False, "预约不存在"), []
+        if res[0] != 'confirmed':
+            return (False, f"当前状态({res[0]})无法签到"), []
+
+        # 更新状态为 checked_in
+        cursor.execute("UPDATE reservations SET status='checked_in' WHERE reservation_id=?", (reservation_id,))
+        event = dict(reservation_id=reservation_id, user_account=user_account, slot_id=res[1])
+        return (True, "签到成功"), [('reservation_closed', event)]
+
+    def join_waitlist(self, user_account, slot_id):
+        """
+        加入时段候补队列 (仅限已满的时段)
+        有人取消预约、管理员取消预约或教师移除课表释放名额时，按加入顺序自动递补为正式预约
+        """
+        try:
+            return self.run_write(lambda cursor: self._join_waitlist_in_transaction(cursor, user_account, slot_id))
+        except Exception as e:
+            return False, f"候补失败: {str(e)}"
+
+    def _join_waitlist_in_transaction(self, cursor, user_account, slot_id):
+        import datetime
+        cursor.execute("SELECT credit_score FROM users WHERE user_account=?", (user_account,))
+        user_res = cursor.fetchone()
+        if not user_res:
+            return (False, "用户不存在"), []
+        credit_score = user_res[0]
+        if credit_score <= 60:
+            return (False, "您的信用分过低(≤60)，已被禁止预约。请等待一周后恢复。"), []
+
+        cursor.execute("""
+            SELECT date, end_time, current_reservations, max_reservations, is_hot FROM time_slots WHERE slot_id=?
+        """, (slot_id,))
+        slot = cursor.fetchone()
+        if not slot:
+            return (False, "时间段不存在"), []
+        slot_date, slot_end, current, max_res, is_hot = slot
+        if is_hot and credit_score <= 80:
+            return (False, "您的信用分低于80，无法预约热门时段"), []
+        now = datetime.datetime.now()
+        if (str(slot_date), str(slot_end)) < (now.strftime('%Y-%m-%d'), now.strftime('%H:%M:%S')):
+            return (False, "该时段已结束"), []
+        if current < max_res:
+            return (False, "该时段尚有名额，请直接预约"), []
+        cursor.execute("SELECT 1 FROM reservations WHERE user_account=? AND slot_id=? AND status='confirmed'",
+                       (user_account, slot_id))
+        if cursor.fetchone():
+            return (False, "您已预约过该时段，请勿重复预约"), []
+
+        try:
+            cursor.execute("""
+                INSERT INTO waitlist (user_account, slot_id, status, create_time) VALUES (?, ?, 'waiting', ?)
+            """, (user_account, slot_id, now))
+        except sqlite3.IntegrityError:
+            return (False, "您已在该时段的候补队列中"), []
+        cursor.execute("SELECT COUNT(*) FROM waitlist WHERE slot_id=? AND status='waiting' AND waitlist_id <= ?",
+                       (slot_id, cursor.lastrowid))
+        position = cursor.fetchone()[0]
+        return (True, f"已加入候补，当前排第{position}位，有名额时将自动为您预约"), []
+
+    def leave_waitlist(self, user_account, slot_id):
+        """退出时段候补队列"""
+        def operation(cursor):
+            import datetime
+            cursor.execute("""
+                UPDATE waitlist SET status = 'cancelled', update_time = ?
+                WHERE user_account = ? AND slot_id = ? AND status = 'waiting'
+            """, (datetime.datetime.now(), user_account, slot_id))
+            if cursor.rowcount == 0:
+                return (False, "您不在该时段的候补队列中"), []
+            return (True, "已退出候补"), []
+        try:
+            return self.run_write(operation)
+        except Exception as e:
+            return False, f"操作失败: {str(e)}"
+
+    def _promote_waitlist(self, cursor, slot_id, now, freed=None):
+        """
+        内部方法：时段有空余名额时按候补顺序 (FIFO) 递补为正式预约 (需在写事务中调用)
+        不再满足预约条件的候补 (信用分不足、已持有该时段的预约) 标记为 skipped，继续看下一位
+        :param freed: 本事务释放的名额数。内存库存引擎管理的热门时段，数据库人数不含引擎队列中
+                      尚未写入的预约，只递补本事务释放的名额 (引擎内存人数先减后加，不会放出新名额)；
+                      为 None 时按数据库人数递补 (引擎随后会整体重新加载)
+        :return: list - 递补产生的 reservation_booked 事件 [(event, data)]
+        """
+        cursor.execute("""
+            SELECT date, end_time, current_reservations, max_reservations, is_hot FROM time_slots WHERE slot_id=?
+        """, (slot_id,))
+        slot = cursor.fetchone()
+        if not slot:
+            return []
+        slot_date, slot_end, current, max_res, is_hot = slot
+        # 已结束的时段不再递补 (候补由爽约判定任务统一过期)
+        if (str(slot_date), str(slot_end)) < (now.strftime('%Y-%m-%d'), now.strftime('%H:%M:%S')):
+            return []
+
+        if freed is not None and self.inventory is not None and self.inventory.manages(slot_id):
+            max_res = min(max_res, current + freed)
+
+        events = []
+        while current < max_res:
+            cursor.execute("""
+                SELECT w.waitlist_id, w.user_account, u.credit_score FROM waitlist w
+                JOIN users u ON w.user_account = u.user_account
+                WHERE w.slot_id = ? AND w.status = 'waiting'
+                ORDER BY w.waitlist_id LIMIT 1
+            """, (slot_id,))
+            head = cursor.fetchone()
+            if not head:
+                break
+            waitlist_id, user_account, credit_score = head
+
+            reservation_id = None
+            if credit_score > 60 and (not is_hot or credit_score > 80):
+                try:
+                    cursor.execute("""
+                        INSERT INTO reservations (user_account, slot_id, status, create_time)
+                        VALUES (?, ?, 'confirmed', ?)
+                    """, (user_account, slot_id, now))
+                    reservation_id = cursor.lastrowid
+                except sqlite3.IntegrityError:
+                    pass
+            if reservation_id is None:
+                cursor.execute("UPDATE waitlist SET status = 'skipped', update_time = ? WHERE waitlist_id = ?",
+                               (now, waitlist_id))
+                continue
+
+            cursor.execute("""
+                UPDATE time_slots SET current_reservations = current_reservations + 1, version = version + 1
+                WHERE slot_id = ?
+            """, (slot_id,))
+            cursor.execute("""
+                UPDATE waitlist SET status = 'promoted', update_time = ?, reservation_id = ? WHERE waitlist_id = ?
+            """, (now, reservation_id, waitlist_id))
+            cursor.execute("SELECT current_reservations, version FROM time_slots WHERE slot_id=?", (slot_id,))
+            current, version = cursor.fetchone()
+            events.append(('reservation_booked', dict(reservation_id=reservation_id, user_account=user_account,
+                                                      slot_id=slot_id, date=slot_date, end_time=slot_end,
+                                                      current=current, version=version)))
+        if events:
+            print(f"[Waitlist] 时段 {slot_id} 递补 {len(events)} 人")
+        return events
+
+    def submit_lottery_entries(self, user_account, slot_ids):
+        """
+        提交热门时段抽签志愿
+        :param slot_ids: 同一天的热门时段，按志愿顺序，最多 MAX_LOTTERY_PREFERENCES 个
+        重复提交时覆盖该用户当天的志愿
+        """
+        if not isinstance(slot_ids, list) or not slot_ids:
+            return False, "请至少选择一个志愿时段"
+        if len(slot_ids) > MAX_LOTTERY_PREFERENCES:
+            return False, f"最多填写{MAX_LOTTERY_PREFERENCES}个志愿"
+        try:
+            slot_ids = [int(slot_id) for slot_id in slot_ids]
+        except (TypeError, ValueError):
+            return False, "时间段ID无效"
+        if len(set(slot_ids)) != len(slot_ids):
+            return False, "志愿时段不能重复"
+        try:
+            return self.run_write(lambda cursor: self._lottery_submit_in_transaction(cursor, user_account, slot_ids))
+        except Exception as e:
+            return False, f"提交失败: {str(e)}"
+
+    def _lottery_submit_in_transaction(self, cursor, user_account, slot_ids):
+        import datetime
+        cursor.execute("SELECT credit_score FROM users WHERE user_account=?", (user_account,))
+        user_res = cursor.fetchone()
+        if not user_res:
+            return (False, "用户不存在"), []
+        if user_res[0] <= 80:
+            return (False, "您的信用分低于80，无法参加热门时段抽签"), []
+
+        placeholders = ','.join('?' * len(slot_ids))
+        cursor.execute(f"SELECT slot_id, date, is_hot FROM time_slots WHERE slot_id IN ({placeholders})", slot_ids)
+        rows = cursor.fetchall()
+        if len(rows) != len(slot_ids):
+            return (False, "时间段不存在"), []
+        if not all(row[2] for row in rows):
+            return (False, "只有热门时段需要抽签"), []
+        dates = {row[1] for row in rows}
+        if len(dates) > 1:
+            return (False, "志愿时段必须是同一天"), []
+        date_str = dates.pop()
+        if date_str < datetime.date.today().strftime('%Y-%m-%d'):
+            return (False, "该日期已过"), []
+        cursor.execute("SELECT 1 FROM lottery_draws WHERE date=?", (date_str,))
+        if cursor.fetchone():
+            return (False, "该日期已开奖"), []
+
+        cursor.execute("""
+            DELETE FROM lottery_entries WHERE user_account = ? AND status = 'pending'
+            AND slot_id IN (SELECT slot_id FROM time_slots WHERE date = ? AND is_hot = 1)
+        """, (user_account, date_str))
+        now = datetime.datetime.now()
+        cursor.executemany("""
+            INSERT INTO lottery_entries (user_account, slot_id, preference, status, create_time)
+            VALUES (?, ?, ?, 'pending', ?)
+        """, [(user_account, slot_id, i + 1, now) for i, slot_id in enumerate(slot_ids)])
+        return (True, f"已提交{len(slot_ids)}个志愿，开奖后中签结果见我的预约"), []
+
+    def is_lottery_slot(self, slot_id):
+        """时段是否为尚未开奖的热门时段 (抽签模式下不能直接预约)"""
+        conn = self.get_connection()
+        try:
+            row = conn.execute("""
+                SELECT ts.is_hot, EXISTS (SELECT 1 FROM lottery_draws d WHERE d.date = ts.date)
+                FROM time_slots ts WHERE ts.slot_id = ?
+            """, (slot_id,)).fetchone()
+            return bool(row and row[0] and not row[1])
+        finally:
+            conn.close()
+
+    def run_lottery(self, date_str, seed=None):
+        """
+        热门时段批量抽签 (每天一次)
+        - 按信用分加权随机排序 (Efraimidis-Spirakis)，依次为每人分配排名最高且仍有名额的志愿，每人最多中一个
+        - 提交后信用分降到 80 及以下的、已持有该时段有效预约的志愿不参与
+        - 预约记录、号源人数、志愿状态与开奖记录在一个事务中写入
+        :return: (bool, dict/str) - 开奖报告 {entrants, winners, seats, seed, elapsed_ms}
+        """
+        import datetime
+        import random
+        from collections import Counter
+
+        if seed is None:
+            seed = random.SystemRandom().randrange(2 ** 31)
+        start = time.perf_counter()
         conn = self.get_connection()
         cursor = conn.cursor()
         try:
-            # 检查预约状态
-            cursor.execute("SELECT status FROM reservations WHERE reservation_id=? AND user_account=?", (reservation_id, user_account))
-            res = cursor.fetchone()
-            if not res:
-                return False, "预约不存在"
-            if res[0] != 'confirmed':
-                return False, f"当前状态({res[0]})无法签到"
-            
-            # 更新状态为 checked_in
-            cursor.execute("UPDATE reservations SET status='checked_in' WHERE reservation_id=?", (reservation_id,))
+            cursor.execute("BEGIN IMMEDIATE")
+            cursor.execute("SELECT 1 FROM lottery_draws WHERE date=?", (date_str,))
+            if cursor.fetchone():
+                conn.rollback()
+                return False, "该日期已开奖"
+
+            # 1. 剩余名额
+            cursor.execute("""
+                SELECT ts.slot_id, ts.max_reservations - ts.current_reservations, c.venue_id
+                FROM time_slots ts JOIN courts c ON ts.court_id = c.court_id
+                WHERE ts.date = ? AND ts.is_hot = 1
+            """, (date_str,))
+            capacity = {}
+            slot_venues = {}
+            for slot_id, remaining, venue_id in cursor.fetchall():
+                capacity[slot_id] = max(0, remaining)
+                slot_venues[slot_id] = venue_id
+            seats = sum(capacity.values())
+
+            # 2. 志愿 (按用户、志愿顺序)
+            cursor.execute("""
+                SELECT le.entry_id, le.user_account, le.slot_id, u.credit_score
+                FROM lottery_entries le
+                JOIN time_slots ts ON le.slot_id = ts.slot_id
+                JOIN users u ON le.user_account = u.user_account
+                WHERE ts.date = ? AND ts.is_hot = 1 AND le.status = 'pending'
+                ORDER BY le.user_account, le.preference
+            """, (date_str,))
+            preferences = {}
+            weights = {}
+            entry_ids = {}
+            for entry_id, user_account, slot_id, credit_score in cursor.fetchall():
+                preferences.setdefault(user_account, []).append(slot_id)
+                weights[user_account] = credit_score
+                entry_ids[(user_account, slot_id)] = entry_id
+            entrants = len(preferences)
+
+            cursor.execute("""
+                SELECT r.user_account, r.slot_id FROM reservations r
+                JOIN time_slots ts ON r.slot_id = ts.slot_id
+                WHERE ts.date = ? AND ts.is_hot = 1 AND r.status = 'confirmed'
+            """, (date_str,))
+            held = set(cursor.fetchall())
+            eligible = {user: weight for user, weight in weights.items() if weight > 80}
+            choices = {user: [s for s in preferences[user] if (user, s) not in held] for user in eligible}
+
+            # 3. 抽签
+            winners = allocate(choices, eligible, capacity, random.Random(seed))
+
+            # 4. 批量写入
+            now = datetime.datetime.now()
+            cursor.executemany("""
+                INSERT INTO reservations (user_account, slot_id, status, create_time)
+                VALUES (?, ?, 'confirmed', ?)
+            """, [(user, slot_id, now) for user, slot_id in winners])
+            won = Counter(slot_id for _, slot_id in winners)
+            cursor.executemany("""
+                UPDATE time_slots SET current_reservations = current_reservations + ?, version = version + 1
+                WHERE slot_id = ?
+            """, [(count, slot_id) for slot_id, count in won.items()])
+            cursor.executemany("UPDATE lottery_entries SET status = 'won' WHERE entry_id = ?",
+                               [(entry_ids[winner],) for winner in winners])
+            cursor.execute("""
+                UPDATE lottery_entries SET status = 'lost'
+                WHERE status = 'pending' AND slot_id IN (SELECT slot_id FROM time_slots WHERE date = ? AND is_hot = 1)
+            """, (date_str,))
+            cursor.execute("""
+                INSERT INTO lottery_draws (date, seed, entrants, winners, draw_time) VALUES (?, ?, ?, ?, ?)
+            """, (date_str, seed, entrants, len(winners), now))
             conn.commit()
-            return True, "签到成功"
         except Exception as e:
             conn.rollback()
-            return False, str(e)
+            return False, f"开奖失败: {str(e)}"
         finally:
             conn.close()
 
-    def process_daily_tasks(self):
+        elapsed_ms = round((time.perf_counter() - start) * 1000, 1)
+        print(f"[Lottery] {date_str} 开奖: 参与 {entrants} 人，名额 {seats}，中签 {len(winners)} 人，耗时 {elapsed_ms} ms")
+        for venue_id in sorted({slot_venues[slot_id] for slot_id in won}):
+            self._emit('reservations_changed', venue_id=int(venue_id))
+        return True, {"entrants": entrants, "winners": len(winners), "seats": seats,
+                      "seed": seed, "elapsed_ms": elapsed_ms}
+
+    def process_daily_tasks(self, chunk_size=1000):
         """
         每日定时任务 (建议每晚10点执行)
         1. 扫描爽约记录 (已结束且未签到 -> 扣10分)
         2. 恢复信用分 (被禁用户一周后恢复)
         3. 维护号源 (滚动生成未来3天号源，删除过期号源)
+        各步骤使用独立的短事务，爽约按 chunk_size 分批提交，避免长时间持有写锁阻塞预约
         """
-        conn = self.get_connection()
-        cursor = conn.cursor()
         try:
             import datetime
             now = datetime.datetime.now()
-            today_date = now.date()
-            current_time_str = now.strftime('%H:%M:%S')
             
             # --- 任务1: 判定爽约 ---
-            # 查找所有: 
-            # 1. 状态为 'confirmed' (未签到)
-            # 2. 对应的 slot 日期 < 今天 OR (日期=今天 AND 结束时间 < 当前时间)
-            # 注意: 这里简化逻辑，假设只要结束时间过了且没签到就算爽约
-            
-            # 构造查询: 找出所有已结束但状态仍为 confirmed 的预约
-            # 关联 time_slots 表比较时间
-            sql_find_noshow = """
-                SELECT r.reservation_id, r.user_account, ts.date, ts.end_time
-                FROM reservations r
-                JOIN time_slots ts ON r.slot_id = ts.slot_id
-                WHERE r.status = 'confirmed'
-                AND (ts.date < ? OR (ts.date = ? AND ts.end_time < ?))
-            """
-            cursor.execute(sql_find_noshow, (today_date, today_date, current_time_str))
-            noshow_list = cursor.fetchall()
-            
-            for row in noshow_list:
-                res_id, user_acc, r_date, r_end = row
-                print(f"[Task] 发现爽约: 用户{user_acc} 预约ID{res_id} ({r_date} {r_end})")
-                
-                # 1. 更新预约状态
-                cursor.execute("UPDATE reservations SET status='no_show' WHERE reservation_id=?", (res_id,))
-                
-                # 2. 扣除信用分 (10分)
-                cursor.execute("UPDATE users SET credit_score = credit_score - 10 WHERE user_account=?", (user_acc,))
-                
-                # 3. 记录日志
-                cursor.execute("""
-                    INSERT INTO credit_logs (user_account, change_amount, reason, time)
-                    VALUES (?, -10, '爽约扣分', ?)
-                """, (user_acc, now))
+            noshow_count = self.process_no_shows(now, chunk_size)
             
             # --- 任务2: 恢复信用分 ---
-            # 规则: 一周后用户信用分恢复100分
-            # 逻辑: 查找当前信用分 <= 60 的用户
-            # 检查他们最后一次扣分记录是否在 7 天前
+            self.restore_credit_scores(now)
             
-            cursor.execute("SELECT user_account, credit_score FROM users WHERE credit_score <= 60")
-            banned_users = cursor.fetchall()
+            # --- 任务3: 自动维护号源 (滚动3天) ---
+            self.maintain_slots(now.date())
             
-            seven_days_ago = now - datetime.timedelta(days=7)
+            return True, f"任务执行完毕. 处理爽约:{noshow_count}人"
             
-            for u_row in banned_users:
-                u_acc, u_score = u_row
-                
-                # 查找该用户最后一次扣分时间
+        except Exception as e:
+            print(f"[Task Error] {e}")
+            return False, str(e)
+
+    def process_no_shows(self, now, chunk_size=1000, chunk_pause=0.02):
+        """
+        判定爽约: 状态为 'confirmed' (未签到) 且对应 slot 已结束
+        (日期 < 今天 OR (日期=今天 AND 结束时间 < 当前时间))
+        每批最多 chunk_size 条，批内全部为集合操作，每批单独提交
+        批与批之间暂停 chunk_pause 秒，让等待写锁的预约请求先执行 (SQLite 的写锁不排队)
+        :return: int - 处理的爽约条数
+        """
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        try:
+            today_date = now.date()
+            current_time_str = now.strftime('%H:%M:%S')
+            total = 0
+            cursor.execute("CREATE TEMP TABLE IF NOT EXISTS noshow_batch (reservation_id INTEGER PRIMARY KEY, user_account TEXT)")
+            
+            while True:
+                cursor.execute("BEGIN IMMEDIATE")
+                cursor.execute("DELETE FROM noshow_batch")
+                # 本批: 找出已结束但状态仍为 confirmed 的预约 (关联 time_slots 表比较时间)
                 cursor.execute("""
-                    SELECT MAX(time) FROM credit_logs 
-                    WHERE user_account = ? AND change_amount < 0
-                """, (u_acc,))
-                last_deduct_res = cursor.fetchone()
+                    INSERT INTO noshow_batch (reservation_id, user_account)
+                    SELECT r.reservation_id, r.user_account
+                    FROM reservations r
+                    JOIN time_slots ts ON r.slot_id = ts.slot_id
+                    WHERE r.status = 'confirmed'
+                    AND (ts.date < ? OR (ts.date = ? AND ts.end_time < ?))
+                    LIMIT ?
+                """, (today_date, today_date, current_time_str, chunk_size))
+                batch_size = cursor.rowcount
+                if batch_size <= 0:
+                    conn.rollback()
+                    break
                 
-                should_restore = False
-                if last_deduct_res and last_deduct_res[0]:
-                    last_time_str = last_deduct_res[0]
-                    # SQLite datetime 可能是字符串，需解析
-                    # 假设格式为 YYYY-MM-DD HH:MM:SS.ssssss 或 YYYY-MM-DD HH:MM:SS
-                    try:
-                        # 尝试解析 (简化处理，直接比较字符串通常也行，如果格式标准)
-                        last_time = datetime.datetime.strptime(last_time_str.split('.')[0], "%Y-%m-%d %H:%M:%S")
-                        if last_time < seven_days_ago:
-                            should_restore = True
-                    except Exception as e:
-                        print(f"[Task] 解析时间出错: {e}")
-                else:
-                    # 如果没有扣分记录但分低(可能是手动改的?)，或者记录丢失，默认恢复? 
-                    # 为了安全，暂不恢复，或者直接恢复
-                    pass
+                self._apply_no_shows(cursor, now)
+                conn.commit()
+                total += batch_size
+                time.sleep(chunk_pause)
+            
+            if total:
+                print(f"[Task] 处理爽约 {total} 条 (每批最多 {chunk_size} 条)")
 
-                if should_restore:
-                    print(f"[Task] 用户 {u_acc} 封禁期已过，恢复信用分至 100")
-                    cursor.execute("UPDATE users SET credit_score = 100 WHERE user_account=?", (u_acc,))
-                    cursor.execute("""
-                        INSERT INTO credit_logs (user_account, change_amount, reason, time)
-                        VALUES (?, ?, '封禁期满恢复', ?)
-                    """, (u_acc, 100 - u_score, now))
+            # 已结束 (或已被删除) 的时段上仍在等待的候补过期
+            cursor.execute("BEGIN IMMEDIATE")
+            cursor.execute("""
+                UPDATE waitlist SET status = 'expired', update_time = ?
+                WHERE status = 'waiting' AND NOT EXISTS (
+                    SELECT 1 FROM time_slots ts WHERE ts.slot_id = waitlist.slot_id
+                    AND (ts.date > ? OR (ts.date = ? AND ts.end_time >= ?))
+                )
+            """, (now, today_date, today_date, current_time_str))
+            expired = cursor.rowcount
+            conn.commit()
+            if expired > 0:
+                print(f"[Task] 候补过期 {expired} 条")
+            return total
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
 
-            # --- 任务3: 自动维护号源 (滚动3天) ---
-            self._auto_manage_slots(cursor, today_date)
+    def _apply_no_shows(self, cursor, now):
+        """
+        内部方法：对临时表 noshow_batch 中的预约执行爽约处理 (需在写事务中调用)
+        1. 更新预约状态  2. 扣除信用分 (每次10分)  3. 记录日志
+        """
+        cursor.execute("""
+            UPDATE reservations SET status = 'no_show'
+            WHERE reservation_id IN (SELECT reservation_id FROM noshow_batch)
+        """)
+        cursor.execute("""
+            UPDATE users 
+            SET credit_score = credit_score - 10 * (
+                SELECT COUNT(*) FROM noshow_batch b WHERE b.user_account = users.user_account
+            )
+            WHERE user_account IN (SELECT user_account FROM noshow_batch)
+        """)
+        cursor.execute("""
+            INSERT INTO credit_logs (user_account, change_amount, reason, time)
+            SELECT user_account, -10, '爽约扣分', ? FROM noshow_batch ORDER BY reservation_id
+        """, (now,))
 
+    def get_pending_reservation_ends(self):
+        """
+        所有待签到 (confirmed) 预约及其时段的日期、结束时间 (走 reservations(status, slot_id) 索引)
+        :return: list - [(reservation_id, date, end_time)]
+        """
+        conn = self.get_connection()
+        try:
+            return conn.execute("""
+                SELECT r.reservation_id, ts.date, ts.end_time
+                FROM reservations r
+                JOIN time_slots ts ON r.slot_id = ts.slot_id
+                WHERE r.status = 'confirmed'
+            """).fetchall()
+        finally:
+            conn.close()
+
+    def mark_no_shows(self, reservation_ids, now):
+        """
+        将指定预约判定为爽约 (只处理仍为 confirmed 且时段已结束的，已签到/取消的自动跳过)
+        :return: int - 实际判定为爽约的条数
+        """
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        try:
+            cursor.execute("CREATE TEMP TABLE IF NOT EXISTS noshow_candidates (reservation_id INTEGER PRIMARY KEY)")
+            cursor.execute("CREATE TEMP TABLE IF NOT EXISTS noshow_batch (reservation_id INTEGER PRIMARY KEY, user_account TEXT)")
+            cursor.execute("BEGIN IMMEDIATE")
+            cursor.execute("DELETE FROM noshow_candidates")
+            cursor.execute("DELETE FROM noshow_batch")
+            cursor.executemany("INSERT OR IGNORE INTO noshow_candidates (reservation_id) VALUES (?)",
+                               [(rid,) for rid in reservation_ids])
+            cursor.execute("""
+                INSERT INTO noshow_batch (reservation_id, user_account)
+                SELECT r.reservation_id, r.user_account
+                FROM noshow_candidates c
+                JOIN reservations r ON r.reservation_id = c.reservation_id
+                JOIN time_slots ts ON r.slot_id = ts.slot_id
+                WHERE r.status = 'confirmed'
+                AND (ts.date < ? OR (ts.date = ? AND ts.end_time < ?))
+            """, (now.date(), now.date(), now.strftime('%H:%M:%S')))
+            marked = cursor.rowcount
+            if marked > 0:
+                self._apply_no_shows(cursor, now)
             conn.commit()
-            return True, f"任务执行完毕. 处理爽约:{len(noshow_list)}人"
+            return marked
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+    def restore_credit_scores(self, now):
+        """
+        恢复信用分
+        规则: 一周后用户信用分恢复100分
+        逻辑: 当前信用分 <= 60 且最后一次扣分记录在 7 天前的用户
+        :return: int - 恢复的用户数
+        """
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        try:
+            import datetime
+            seven_days_ago = now - datetime.timedelta(days=7)
             
-        except Exception as e:
+            cursor.execute("BEGIN IMMEDIATE")
+            cursor.execute("CREATE TEMP TABLE IF NOT EXISTS restore_batch (user_account TEXT PRIMARY KEY, credit_score INTEGER)")
+            cursor.execute("DELETE FROM restore_batch")
+            # 最后一次扣分时间通过 (user_account, time) 索引逐个被禁用户查找
+            # 没有扣分记录但分低的用户 (可能是手动改的) 暂不恢复
+            cursor.execute("""
+                INSERT INTO restore_batch (user_account, credit_score)
+                SELECT u.user_account, u.credit_score FROM users u
+                WHERE u.credit_score <= 60
+                AND (
+                    SELECT MAX(cl.time) FROM credit_logs cl
+                    WHERE cl.user_account = u.user_account AND cl.change_amount < 0
+                ) < ?
+            """, (seven_days_ago,))
+            restored = cursor.rowcount
+            
+            if restored > 0:
+                cursor.execute("""
+                    INSERT INTO credit_logs (user_account, change_amount, reason, time)
+                    SELECT user_account, 100 - credit_score, '封禁期满恢复', ? FROM restore_batch
+                """, (now,))
+                cursor.execute("""
+                    UPDATE users SET credit_score = 100
+                    WHERE user_account IN (SELECT user_account FROM restore_batch)
+                """)
+                print(f"[Task] {restored} 名用户封禁期已过，恢复信用分至 100")
+            
+            cursor.execute("DELETE FROM restore_batch")
+            conn.commit()
+            return restored
+        except Exception:
             conn.rollback()
-            print(f"[Task Error] {e}")
-            return False, str(e)
+            raise
+        finally:
+            conn.close()
+
+    def maintain_slots(self, today_date):
+        """
+        维护号源 (独立事务)
+        :return: dict - 各阶段处理条数与耗时 (毫秒)，见 _auto_manage_slots
+        """
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        try:
+            cursor.execute("BEGIN IMMEDIATE")
+            report = self._auto_manage_slots(cursor, today_date)
+            conn.commit()
+            self._emit('slots_changed')
+            return report
+        except Exception:
+            conn.rollback()
+            raise
         finally:
             conn.close()
 
-    def _auto_manage_slots(self, cursor, today_date):
+    def _auto_manage_slots(self, cursor, today_date, days_ahead=3, open_hour=9, close_hour=22, capacity=8):
         """
         内部方法：自动维护号源
         1. 删除过期号源 (date <= today)
         2. 确保未来3天 (today+1, today+2, today+3) 的号源存在
+        同一场地同一天已有相同开始时间的号源 (如教师课表锁定的时段) 时跳过，与原逐条检查一致，重复执行结果不变
+        :return: dict - 各阶段处理条数与耗时 (毫秒)
         """
         import datetime
         print("[Task] 开始维护time_slots...")
+        report = {}
         
         # 1. 清理过期号源
         # 策略修改：仅删除“过去且未被预约”的号源，保留有预约记录的号源以供历史查询
         # 这样既能清理垃圾数据，又能保证用户能查到历史订单
+        # NOT EXISTS 按 slot_id 走 reservations(slot_id, status) 索引逐条判断，不再物化整张预约表
+        phase_start = time.perf_counter()
         cursor.execute("""
             DELETE FROM time_slots 
             WHERE date <= ? 
-            AND slot_id NOT IN (SELECT DISTINCT slot_id FROM reservations)
+            AND NOT EXISTS (SELECT 1 FROM reservations r WHERE r.slot_id = time_slots.slot_id)
         """, (today_date,))
-        deleted_count = cursor.rowcount
-        print(f"[Task] 已清理未使用的过期号源: {deleted_count} 条 (保留了有历史订单的号源)")
+        report["deleted"] = cursor.rowcount
+        report["cleanup_ms"] = round((time.perf_counter() - phase_start) * 1000, 3)
+        print(f"[Task] 已清理未使用的过期号源: {report['deleted']} 条 (保留了有历史订单的号源), 耗时 {report['cleanup_ms']} ms")
         
         # 2. 生成未来3天号源
-        # 获取所有场地
+        phase_start = time.perf_counter()
         cursor.execute("SELECT court_id FROM courts")
-        courts = cursor.fetchall()
-        court_ids = [c[0] for c in courts]
+        court_ids = [c[0] for c in cursor.fetchall()]
         
         if not court_ids:
             print("[Task] 无场地，跳过生成")
-            return
+            return report
 
-        # 遍历未来3天 (1, 2, 3)
-        for i in range(1, 4):
-            target_date = today_date + datetime.timedelta(days=i)
-            date_str = target_date.strftime("%Y-%m-%d")
-            
-            # 遍历时间 9:00 - 22:00
-            for h in range(9, 22):
-                start_time = f"{h:02d}:00:00"
-                end_time = f"{h+1:02d}:00:00"
-                
-                for cid in court_ids:
-                    # 检查是否存在
-                    cursor.execute("""
-                        SELECT slot_id FROM time_slots 
-                        WHERE court_id=? AND date=? AND start_time=?
-                    """, (cid, date_str, start_time))
-                    
-                    if not cursor.fetchone():
-                        # 插入新号源
-                        cursor.execute("""
-                            INSERT INTO time_slots (court_id, date, start_time, end_time, max_reservations, current_reservations, is_hot)
-                            VALUES (?, ?, ?, ?, 8, 0, 0)
-                        """, (cid, date_str, start_time, end_time))
+        # 未来 days_ahead 天 × 营业时间每小时 × 所有场地，一次 executemany 提交
+        # 去重仍按 (court_id, date, start_time)：结束时间不同的已有号源也算占用该时段，避免生成重叠号源
+        # 该条件走唯一索引 (court_id, date, start_time, end_time) 的前缀
+        rows = [
+            (cid, (today_date + datetime.timedelta(days=i)).strftime("%Y-%m-%d"), f"{h:02d}:00:00", f"{h+1:02d}:00:00", capacity)
+            for i in range(1, days_ahead + 1)
+            for h in range(open_hour, close_hour)
+            for cid in court_ids
+        ]
+        cursor.executemany("""
+            INSERT OR IGNORE INTO time_slots (court_id, date, start_time, end_time, max_reservations, current_reservations, is_hot)
+            SELECT ?1, ?2, ?3, ?4, ?5, 0, 0
+            WHERE NOT EXISTS (SELECT 1 FROM time_slots WHERE court_id = ?1 AND date = ?2 AND start_time = ?3)
+        """, rows)
+        report["inserted"] = cursor.rowcount
+        report["rollout_ms"] = round((time.perf_counter() - phase_start) * 1000, 3)
+        print(f"[Task] 已生成号源: {report['inserted']} 条 (检查 {len(rows)} 条), 耗时 {report['rollout_ms']} ms")
         
         print("[Task] time_slots自动生成&删除维护已完成")
+        return report
 
     # 管理员功能↓--- Admin Functions ---
 
@@ -725,6 +1361,7 @@ class DBManager:
             cursor.execute("INSERT INTO venues (venue_name, is_outdoor, location, description) VALUES (?, ?, ?, ?)",
                            (name, is_outdoor, location, description))
             conn.commit()
+            self._emit('reference_changed')
             return True, "添加成功"
         except Exception as e:
             return False, str(e)
@@ -739,6 +1376,7 @@ class DBManager:
             cursor.execute("UPDATE venues SET venue_name=?, is_outdoor=?, location=?, description=? WHERE venue_id=?",
                            (name, is_outdoor, location, description, venue_id))
             conn.commit()
+            self._emit('reference_changed')
             return True, "更新成功"
         except Exception as e:
             return False, str(e)
@@ -753,6 +1391,8 @@ class DBManager:
             # 级联删除场地? 或者检查是否有场地
             cursor.execute("DELETE FROM venues WHERE venue_id=?", (venue_id,))
             conn.commit()
+            self._emit('slots_changed')
+            self._emit('reference_changed')
             return True, "删除成功"
         except Exception as e:
             return False, str(e)
@@ -786,6 +1426,7 @@ class DBManager:
         try:
             cursor.execute("INSERT INTO courts (venue_id, court_name) VALUES (?, ?)", (venue_id, name))
             conn.commit()
+            self._emit('reference_changed')
             return True, "添加成功"
         except Exception as e:
             return False, str(e)
@@ -799,6 +1440,8 @@ class DBManager:
         try:
             cursor.execute("DELETE FROM courts WHERE court_id=?", (court_id,))
             conn.commit()
+            self._emit('slots_changed')
+            self._emit('reference_changed')
             return True, "删除成功"
         except Exception as e:
             return False, str(e)
@@ -887,32 +1530,44 @@ class DBManager:
             conn.close()
 
     def admin_cancel_reservation(self, reservation_id):
-        """管理员强制取消预约"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
+        """管理员强制取消预约 (只能取消有效预约，空出的名额递补给候补队列)"""
         try:
-            import datetime
-            # 获取 slot_id
-            cursor.execute("SELECT slot_id FROM reservations WHERE reservation_id=?", (reservation_id,))
+            return self.run_write(lambda cursor: self._admin_cancel_in_transaction(cursor, reservation_id))
+        except Exception as e:
+            return False, f"取消失败: {str(e)}"
+
+    def _admin_cancel_in_transaction(self, cursor, reservation_id):
+        import datetime
+        cancel_time = datetime.datetime.now()
+
+        # 条件更新: 只有 confirmed 的预约会被取消 (已取消、已签到、爽约的预约不再释放名额)
+        cursor.execute("""
+            UPDATE reservations SET status = 'cancelled_by_admin', cancel_time = ?
+            WHERE reservation_id = ? AND status = 'confirmed'
+        """, (cancel_time, reservation_id))
+        if cursor.rowcount != 1:
+            cursor.execute("SELECT status FROM reservations WHERE reservation_id=?", (reservation_id,))
             res = cursor.fetchone()
             if not res:
-                return False, "预约不存在"
-            slot_id = res[0]
+                return (False, "预约不存在"), []
+            return (False, f"当前状态({res[0]})无法取消"), []
 
-            # 更新状态
-            cursor.execute("UPDATE reservations SET status='cancelled_by_admin', cancel_time=? WHERE reservation_id=?", 
-                           (datetime.datetime.now(), reservation_id))
-            
-            # 释放名额
-            cursor.execute("UPDATE time_slots SET current_reservations = current_reservations - 1 WHERE slot_id=?", (slot_id,))
-            
-            conn.commit()
-            return True, "取消成功"
-        except Exception as e:
-            conn.rollback()
-            return False, str(e)
-        finally:
-            conn.close()
+        cursor.execute("SELECT slot_id, user_account FROM reservations WHERE reservation_id=?", (reservation_id,))
+        slot_id, user_account = cursor.fetchone()
+
+        # 释放名额
+        cursor.execute("""
+            UPDATE time_slots SET current_reservations = current_reservations - 1, version = version + 1
+            WHERE slot_id = ?
+        """, (slot_id,))
+        cursor.execute("SELECT current_reservations, version FROM time_slots WHERE slot_id=?", (slot_id,))
+        current, version = cursor.fetchone()
+
+        event = dict(reservation_id=reservation_id, user_account=user_account, slot_id=slot_id,
+                     current=current, version=version)
+        # 候补递补
+        promoted = self._promote_waitlist(cursor, slot_id, cancel_time, freed=1)
+        return (True, "取消成功"), [('reservation_released', event)] + promoted
 
     def admin_add_announcement(self, title, content, start_date, end_date):
         """发布公告"""
@@ -924,6 +1579,7 @@ class DBManager:
             cursor.execute("INSERT INTO announcements (title, content, start_date, end_date, create_time) VALUES (?, ?, ?, ?, ?)",
                            (title, content, start_date, end_date, create_time))
             conn.commit()
+            self._emit('reference_changed')
             return True, "发布成功"
         except Exception as e:
             return False, str(e)
@@ -961,6 +1617,7 @@ class DBManager:
         try:
             cursor.execute("DELETE FROM announcements WHERE announcement_id=?", (ann_id,))
             conn.commit()
+            self._emit('reference_changed')
             return True, "删除成功"
         except Exception as e:
             return False, str(e)
@@ -0,0 +1,127 @@
+import queue
+import threading
+from concurrent.futures import Future
+
+# 默认的单 action 并发上限 (排队 + 执行中)
+# 写操作持有 sqlite 写锁时间长，限制并发可以避免大量请求挤在同一个数据库文件上
+DEFAULT_ACTION_LIMITS = {
+    'add_schedule': 2,
+    'remove_schedule': 2,
+    'admin_get_all_reservations': 2,
+    'admin_get_users': 2,
+    'book_venue': 32,
+    'cancel_booking': 16,
+}
+
+BUSY_RESPONSE = {"status": "busy", "message": "服务器繁忙，请稍后重试"}
+
+
+class ServerBusy(Exception):
+    """请求执行器已饱和，请求被快速拒绝"""
+    pass
+
+
+class RequestExecutor:
+    """
+    有界请求执行器
+    - 固定数量的工作线程执行数据库请求
+    - 等待队列有上限，队列满时立即拒绝 (ServerBusy) 而不是无限堆积
+    - 每个 action 可单独配置并发上限
+    """
+
+    def __init__(self, max_workers=16, max_queue=256, action_limits=None):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.action_limits = dict(DEFAULT_ACTION_LIMITS)
+        if action_limits:
+            self.action_limits.update(action_limits)
+
+        self.tasks = queue.Queue(maxsize=max_queue)
+        self.lock = threading.Lock()
+        self.inflight = {}  # action -> 排队 + 执行中的请求数
+        self.rejected = 0
+        self.running = True
+
+        self.workers = []
+        for i in range(max_workers):
+            t = threading.Thread(target=self._worker, name=f"request-worker-{i}")
+            t.daemon = True
+            t.start()
+            self.workers.append(t)
+
+    def submit(self, action, fn, *args):
+        """
+        提交请求，返回 concurrent.futures.Future
+        :raises ServerBusy: 队列已满或该 action 已达并发上限
+        """
+        self.acquire(action)
+        future = Future()
+        try:
+            self.tasks.put_nowait((action, future, fn, args))
+        except queue.Full:
+            self._release(action)
+            with self.lock:
+                self.rejected += 1
+            raise ServerBusy("请求队列已满")
+        return future
+
+    def acquire(self, action):
+        """
+        占用一个 action 并发名额 (不经过工作队列、在调用方线程中执行的请求，如 batch 子请求，
+        也要计入 action 并发上限)，执行完后调用 release
+        :raises ServerBusy: 该 action 已达并发上限
+        """
+        with self.lock:
+            limit = self.action_limits.get(action)
+            count = self.inflight.get(action, 0)
+            if limit is not None and count >= limit:
+                self.rejected += 1
+                raise ServerBusy(f"{action} 并发已达上限 {limit}")
+            self.inflight[action] = count + 1
+
+    def release(self, action):
+        self._release(action)
+
+    def run(self, action, fn, *args):
+        """同步执行: 提交并等待结果"""
+        return self.submit(action, fn, *args).result()
+
+    def _release(self, action):
+        with self.lock:
+            self.inflight[action] -= 1
+            if not self.inflight[action]:
+                del self.inflight[action]
+
+    def _worker(self):
+        while self.running:
+            item = self.tasks.get()
+            if item is None:
+                break
+            action, future, fn, args = item
+            try:
+                if not future.set_running_or_notify_cancel():
+                    continue
+                try:
+                    future.set_result(fn(*args))
+                except Exception as e:
+                    future.set_exception(e)
+            finally:
+                self._release(action)
+
+    def stats(self):
+        with self.lock:
+            return {
+                "max_workers": self.max_workers,
+                "max_queue": self.max_queue,
+                "queued": self.tasks.qsize(),
+                "inflight": dict(self.inflight),
+                "rejected": self.rejected
+            }
+
+    def shutdown(self):
+        self.running = False
+        for _ in self.workers:
+            try:
+                self.tasks.put_nowait(None)
+            except queue.Full:
+                break
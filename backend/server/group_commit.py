@@ -0,0 +1,168 @@
+import collections
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+
+try:
+    from server.metrics import LatencyHistogram
+except ImportError:
+    from metrics import LatencyHistogram
+
+
+class GroupCommit:
+    """
+    写操作组提交协调器
+    - 多个客户端线程并发提交的写操作 (预约、取消、签到) 由一个提交线程合并到同一个事务中，
+      每批只提交一次 (一次 WAL 写入/fsync)，写锁也只获取一次
+    - 每个操作在自己的 SAVEPOINT 中执行，返回 False 或抛出异常时只回滚该操作，不影响同批其他操作
+    - 提交成功后按顺序发出各操作的数据变更事件，再把结果交还给各自的调用线程
+    - 没有排队的操作时提交线程立即执行 (低负载下不增加延迟)；window 秒的等待可以进一步凑批
+    - 调用方最多等待 timeout 秒，超时且操作尚未开始执行时撤回该操作并返回服务器繁忙；
+      整批失败 (包括拿不到数据库连接) 时该批所有操作都返回异常，提交线程继续处理后续批次
+    """
+
+    def __init__(self, db_manager, max_batch=256, window=0.0, timeout=30.0):
+        self.db = db_manager
+        self.max_batch = max_batch
+        self.window = window
+        self.timeout = timeout
+        self.cond = threading.Condition()
+        self.queue = collections.deque()  # (operation, Future)
+        self.running = False
+        self.thread = None
+        self.batches = 0
+        self.operations = 0
+        self.rolled_back = 0
+        self.failed_batches = 0
+        self.timed_out = 0
+        self.batch_sizes = collections.Counter()
+        self.commit_latency = LatencyHistogram()
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self._run, name='group-commit')
+        self.thread.daemon = True
+        self.thread.start()
+        self.db.group_commit = self
+
+    def stop(self):
+        """不再接收新操作，处理完队列中剩余的操作后退出"""
+        self.db.group_commit = None
+        with self.cond:
+            self.running = False
+            self.cond.notify()
+        if self.thread:
+            self.thread.join()
+
+    def submit(self, operation):
+        """
+        提交写操作并等待所在批次提交
+        :param operation: operation(cursor) -> ((bool, msg), [(event, data), ...])
+        :return: (bool, msg)
+        :raises Exception: 操作本身或整批提交失败
+        """
+        future = Future()
+        with self.cond:
+            if not self.running:
+                raise RuntimeError("组提交已停止")
+            self.queue.append((operation, future))
+            self.cond.notify()
+        try:
+            return future.result(self.timeout)
+        except FutureTimeout:
+            # 还在队列中的操作撤回 (不会再执行)；已在执行的批次很快结束，等它的结果
+            if future.cancel():
+                with self.cond:
+                    self.timed_out += 1
+                return False, "服务器繁忙，请稍后重试"
+            return future.result()
+
+    def _run(self):
+        while True:
+            with self.cond:
+                while self.running and not self.queue:
+                    self.cond.wait()
+                if not self.queue:
+                    return
+            if self.window:
+                time.sleep(self.window)
+            with self.cond:
+                batch = [self.queue.popleft() for _ in range(min(self.max_batch, len(self.queue)))]
+            # 已被调用方撤回 (等待超时) 的操作跳过
+            batch = [(operation, future) for operation, future in batch if future.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            try:
+                self._commit(batch)
+            except Exception as e:
+                # 不能让提交线程退出，否则之后所有写操作都会一直等待
+                print(f"[GroupCommit] 提交线程异常: {e}")
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+
+    def _commit(self, batch):
+        start = time.perf_counter()
+        outcomes = []  # (future, result, events, error)
+        conn = None
+        try:
+            conn = self.db.get_connection()
+            cursor = conn.cursor()
+            cursor.execute("BEGIN IMMEDIATE")
+            for operation, future in batch:
+                cursor.execute("SAVEPOINT operation")
+                try:
+                    result, events = operation(cursor)
+                except Exception as e:
+                    cursor.execute("ROLLBACK TO operation")
+                    cursor.execute("RELEASE operation")
+                    outcomes.append((future, None, None, e))
+                    continue
+                if not result[0]:
+                    cursor.execute("ROLLBACK TO operation")
+                cursor.execute("RELEASE operation")
+                outcomes.append((future, result, events, None))
+            conn.commit()
+        except Exception as e:
+            # 整批失败 (如拿不到连接、busy_timeout 内拿不到写锁)，所有操作都未生效
+            if conn is not None:
+                conn.rollback()
+            with self.cond:
+                self.failed_batches += 1
+            print(f"[GroupCommit] 批量提交 {len(batch)} 个写操作失败: {e}")
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        finally:
+            if conn is not None:
+                conn.close()
+
+        with self.cond:
+            self.batches += 1
+            self.operations += len(batch)
+            self.rolled_back += sum(1 for _, result, _, error in outcomes if error or not result[0])
+            self.batch_sizes[len(batch)] += 1
+            self.commit_latency.record(time.perf_counter() - start)
+        for future, result, events, error in outcomes:
+            if error is None and result[0]:
+                for event, data in events:
+                    self.db._emit(event, **data)
+        for future, result, _, error in outcomes:
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(error)
+
+    def stats(self):
+        with self.cond:
+            return {
+                "queued": len(self.queue),
+                "batches": self.batches,
+                "operations": self.operations,
+                "avg_batch": round(self.operations / self.batches, 2) if self.batches else 0,
+                "max_batch": max(self.batch_sizes) if self.batch_sizes else 0,
+                "rolled_back": self.rolled_back,
+                "failed_batches": self.failed_batches,
+                "timed_out": self.timed_out,
+                "commit_latency": self.commit_latency.snapshot()
+            }
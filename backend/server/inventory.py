@@ -0,0 +1,384 @@
+import collections
+import datetime
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+
+try:
+    from server.metrics import LatencyHistogram
+except ImportError:
+    from metrics import LatencyHistogram
+
+
+class _SlotState:
+    """内存中的一个热门时段"""
+    __slots__ = ('current', 'max', 'date', 'end_time', 'holders')
+
+    def __init__(self, current, max_reservations, date_value, end_time):
+        self.current = current            # 已占用名额 (含尚未写入数据库的预约)
+        self.max = max_reservations
+        self.date = date_value
+        self.end_time = end_time
+        self.holders = set()              # 持有有效预约的用户
+
+
+class InventoryEngine:
+    """
+    热门时段 (is_hot=1) 内存库存预约引擎
+    - 启动时从数据库加载今天及以后的热门时段人数与有效预约，之后在内存中判定预约 (名额、重复预约、信用分)
+    - 判定成功的预约按顺序进入写队列，由写线程合并成一个事务批量写入 (group commit)，
+      写入后再发出 reservation_booked 事件 (号源缓存、推送、爽约检测随之更新)
+    - 预约请求等到所在批次提交后才返回成功 (拒绝在内存中立即返回)，客户端收到的成功一定已经落库
+    - 写入时仍使用条件 UPDATE，数据库拒绝的预约 (如教师刚锁定该时段) 撤销内存占用、计入 conflicts，
+      并把失败原因返回给仍在等待的预约请求
+    - 取消、签到走原有数据库路径，引擎通过数据变更事件同步；教师课表、号源维护后整体重新加载
+    - 候补递补只占用同一事务中释放的名额 (见 DBManager._promote_waitlist)，教师锁定前先写出队列，
+      这两条数据库路径不会与队列中的预约争抢名额
+    - 信用分缓存 credit_ttl 秒，扣分/恢复最多延迟这么久生效
+    - 预约请求最多等待 write_timeout 秒，超时且尚未开始写入的预约撤回 (不再写入) 并按失败返回；
+      整批写入失败 (包括拿不到数据库连接) 时该批预约全部撤销内存占用并返回失败，写线程继续运行
+    注意: 进程崩溃时尚未写入的预约没有返回成功，客户端按失败处理，重启后以数据库为准重建
+    """
+
+    def __init__(self, db_manager, max_batch=500, linger=0.002, credit_ttl=30, write_timeout=30.0,
+                 clock=time.monotonic):
+        self.db = db_manager
+        self.max_batch = max_batch
+        self.linger = linger
+        self.credit_ttl = credit_ttl
+        self.write_timeout = write_timeout
+        self.clock = clock
+        # 可重入: 重新加载时在持锁状态下写出队列
+        self.cond = threading.Condition(threading.RLock())
+        self.slots = {}                   # slot_id -> _SlotState
+        self.queue = collections.deque()  # 待写入的预约 (user_account, slot_id, create_time, Future)
+        self.writing = 0
+        self.reload_requested = False
+        self.running = False
+        self.thread = None
+        self.credit_lock = threading.Lock()
+        self.credits = {}                 # user_account -> (credit_score, 过期时间)
+        self.booked = 0
+        self.rejected = 0
+        self.persisted = 0
+        self.conflicts = 0
+        self.batches = 0
+        self.errors = 0
+        self.timed_out = 0
+        self.reloads = 0
+        self.commit_latency = LatencyHistogram()
+
+    def start(self):
+        # 先注册监听器再加载，加载期间的变更事件按持有人集合去重
+        self.db.add_listener(self.on_event)
+        self.load()
+        print(f"[Inventory] 内存库存引擎已启动，热门时段 {len(self.slots)} 个")
+        self.running = True
+        self.thread = threading.Thread(target=self._run, name='inventory-writer')
+        self.thread.daemon = True
+        self.thread.start()
+        self.db.inventory = self
+
+    def stop(self):
+        """停止接收预约，写出队列中剩余的预约"""
+        self.db.inventory = None
+        with self.cond:
+            self.running = False
+            self.cond.notify_all()
+        if self.thread:
+            self.thread.join()
+
+    def load(self):
+        """从数据库重建内存状态 (人数与持有人在同一个读事务中读取)"""
+        today = datetime.date.today().strftime('%Y-%m-%d')
+        conn = self.db.get_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute("BEGIN")
+            cursor.execute("""
+                SELECT slot_id, current_reservations, max_reservations, date, end_time
+                FROM time_slots WHERE is_hot = 1 AND date >= ?
+            """, (today,))
+            slots = {row[0]: _SlotState(row[1], row[2], row[3], row[4]) for row in cursor.fetchall()}
+            cursor.execute("""
+                SELECT r.user_account, r.slot_id FROM reservations r
+                JOIN time_slots ts ON r.slot_id = ts.slot_id
+                WHERE ts.is_hot = 1 AND ts.date >= ? AND r.status = 'confirmed'
+            """, (today,))
+            for user_account, slot_id in cursor.fetchall():
+                slots[slot_id].holders.add(user_account)
+            conn.rollback()
+        finally:
+            conn.close()
+        with self.cond:
+            self.slots = slots
+            self.reloads += 1
+
+    def get_credit(self, user_account):
+        """信用分 (缓存 credit_ttl 秒)，用户不存在时返回 None"""
+        now = self.clock()
+        with self.credit_lock:
+            cached = self.credits.get(user_account)
+            if cached and cached[1] > now:
+                return cached[0]
+        score = self.db.get_credit_score(user_account)
+        if score is not None:
+            with self.credit_lock:
+                self.credits[user_account] = (score, now + self.credit_ttl)
+        return score
+
+    def manages(self, slot_id):
+        """时段是否由引擎管理 (其预约人数以内存为准)"""
+        with self.cond:
+            return self.running and slot_id in self.slots
+
+    def book(self, user_account, slot_id):
+        """
+        在内存中判定预约，判定成功后等待写入数据库
+        :return: (bool, str)，时段不由引擎管理时返回 None (走数据库路径)
+        """
+        try:
+            slot_id = int(slot_id)
+        except (TypeError, ValueError):
+            return None
+        if slot_id not in self.slots:
+            return None
+
+        try:
+            credit_score = self.get_credit(user_account)
+        except Exception as e:
+            return False, f"预约失败: {str(e)}"
+        with self.cond:
+            slot = self.slots.get(slot_id)
+            if slot is None or not self.running:
+                return None
+            if credit_score is None:
+                result = False, "用户不存在"
+            elif credit_score <= 60:
+                result = False, "您的信用分过低(≤60)，已被禁止预约。请等待一周后恢复。"
+            elif slot.current >= slot.max:
+                result = False, "该时段预约人数已满"
+            elif credit_score <= 80:
+                result = False, "您的信用分低于80，无法预约热门时段"
+            elif user_account in slot.holders:
+                result = False, "您已预约过该时段，请勿重复预约"
+            else:
+                slot.current += 1
+                slot.holders.add(user_account)
+                future = Future()
+                self.queue.append((user_account, slot_id, datetime.datetime.now(), future))
+                self.booked += 1
+                self.cond.notify()
+                result = None
+            if result is not None:
+                self.rejected += 1
+                return result
+        # 等待所在批次提交 (数据库拒绝时返回拒绝原因)
+        try:
+            return future.result(self.write_timeout)
+        except FutureTimeout:
+            # 还在队列中的预约撤回 (写线程跳过并撤销内存占用)；已在写入的批次很快结束，等它的结果
+            if future.cancel():
+                with self.cond:
+                    self.timed_out += 1
+                return False, "服务器繁忙，请稍后重试"
+            return future.result()
+
+    def flush(self, timeout=30.0):
+        """
+        等待队列中的预约全部写入数据库
+        :return: bool - 超时返回 False
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self.cond:
+            while self.queue or self.writing:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self.cond.wait(remaining)
+        return True
+
+    def on_event(self, event, data):
+        """DBManager 数据变更监听器"""
+        if event == 'reservation_booked':
+            # 只处理走数据库路径的预约 (引擎接管前)，引擎自己写入的预约已在内存中
+            if data.get('inventory'):
+                return
+            with self.cond:
+                slot = self.slots.get(data['slot_id'])
+                if slot is not None and data['user_account'] not in slot.holders:
+                    slot.holders.add(data['user_account'])
+                    slot.current += 1
+        elif event in ('reservation_released', 'reservation_closed'):
+            with self.cond:
+                slot = self.slots.get(data['slot_id'])
+                if slot is not None and data.get('user_account') in slot.holders:
+                    slot.holders.discard(data['user_account'])
+                    if event == 'reservation_released':
+                        slot.current -= 1
+        elif event in ('reservations_changed', 'slots_changed'):
+            with self.cond:
+                self.reload_requested = True
+                self.cond.notify_all()
+
+    def _run(self):
+        while True:
+            try:
+                if not self._run_once():
+                    return
+            except Exception as e:
+                # 写线程不能退出，否则之后的预约都会等到超时
+                print(f"[Inventory] 写线程异常: {e}")
+                time.sleep(0.1)
+
+    def _run_once(self):
+        """:return: bool - False 表示已停止且队列已写完"""
+        with self.cond:
+            while self.running and not self.queue and not self.reload_requested:
+                self.cond.wait()
+            if self.reload_requested:
+                self._reload()
+                return True
+            if not self.running and not self.queue:
+                return False
+        # 稍等片刻，让同一时刻的预约合并进一个事务
+        if self.linger:
+            time.sleep(self.linger)
+        with self.cond:
+            batch = self._take_batch()
+            self.writing += 1
+        try:
+            if batch:
+                self._write(batch)
+        finally:
+            with self.cond:
+                self.writing -= 1
+                self.cond.notify_all()
+        return True
+
+    def _take_batch(self):
+        """
+        从队列取出一批预约 (需持有 self.cond)
+        已被撤回 (等待超时) 的预约不再写入，撤销其内存占用
+        """
+        batch = []
+        for _ in range(min(self.max_batch, len(self.queue))):
+            entry = self.queue.popleft()
+            if entry[3].set_running_or_notify_cancel():
+                batch.append(entry)
+            else:
+                self._release_hold(entry[0], entry[1])
+        return batch
+
+    def _release_hold(self, user_account, slot_id):
+        """撤销未写入的预约占用的内存名额 (需持有 self.cond)"""
+        slot = self.slots.get(slot_id)
+        if slot is not None and user_account in slot.holders:
+            slot.holders.discard(user_account)
+            slot.current -= 1
+
+    def _reload(self):
+        """持锁写出全部队列后从数据库重新加载 (期间新的预约等待)"""
+        self.reload_requested = False
+        while self.queue:
+            batch = self._take_batch()
+            if batch:
+                self._write(batch)
+        try:
+            self.load()
+        except Exception as e:
+            print(f"[Inventory] 重新加载库存失败: {e}")
+
+    def _write(self, batch):
+        """
+        一个事务写入一批预约，每条预约一个 SAVEPOINT，单条被拒绝不影响其他预约
+        整个事务失败 (如拿不到连接、数据库长时间被锁) 时整批按失败返回，不会抛出异常
+        """
+        start = time.perf_counter()
+        booked = []
+        refused = []
+        conn = None
+        try:
+            conn = self.db.get_connection()
+            cursor = conn.cursor()
+            cursor.execute("BEGIN IMMEDIATE")
+            for user_account, slot_id, create_time, future in batch:
+                cursor.execute("SAVEPOINT booking")
+                cursor.execute("""
+                    UPDATE time_slots
+                    SET current_reservations = current_reservations + 1, version = version + 1
+                    WHERE slot_id = ? AND current_reservations < max_reservations
+                """, (slot_id,))
+                if cursor.rowcount == 0:
+                    reason = "该时段预约人数已满"
+                else:
+                    try:
+                        cursor.execute("""
+                            INSERT INTO reservations (user_account, slot_id, status, create_time)
+                            VALUES (?, ?, 'confirmed', ?)
+                        """, (user_account, slot_id, create_time))
+                        reason = None
+                    except sqlite3.IntegrityError:
+                        reason = "您已预约过该时段，请勿重复预约"
+                if reason is not None:
+                    cursor.execute("ROLLBACK TO booking")
+                    cursor.execute("RELEASE booking")
+                    refused.append((user_account, slot_id, future, reason))
+                    continue
+                reservation_id = cursor.lastrowid
+                cursor.execute("RELEASE booking")
+                cursor.execute("SELECT date, end_time, current_reservations, version FROM time_slots WHERE slot_id=?",
+                               (slot_id,))
+                booked.append((future, reservation_id, user_account, slot_id) + tuple(cursor.fetchone()))
+            conn.commit()
+        except Exception as e:
+            if conn is not None:
+                try:
+                    conn.rollback()
+                except Exception:
+                    pass
+            with self.cond:
+                self.errors += 1
+                for user_account, slot_id, _, _ in batch:
+                    self._release_hold(user_account, slot_id)
+            print(f"[Inventory] 批量写入 {len(batch)} 条预约失败: {e}")
+            for _, _, _, future in batch:
+                future.set_result((False, f"预约失败: {str(e)}"))
+            return
+        finally:
+            if conn is not None:
+                conn.close()
+
+        with self.cond:
+            self.batches += 1
+            self.persisted += len(booked)
+            self.conflicts += len(refused)
+            self.commit_latency.record(time.perf_counter() - start)
+            for user_account, slot_id, _, _ in refused:
+                self._release_hold(user_account, slot_id)
+        for user_account, slot_id, future, reason in refused:
+            print(f"[Inventory] 预约写入被数据库拒绝: 用户 {user_account}, 时段 {slot_id}")
+            future.set_result((False, reason))
+        for future, reservation_id, user_account, slot_id, slot_date, slot_end, current, version in booked:
+            self.db._emit('reservation_booked', reservation_id=reservation_id, user_account=user_account,
+                          slot_id=slot_id, date=slot_date, end_time=slot_end, current=current, version=version,
+                          inventory=True)
+            future.set_result((True, "预约成功"))
+
+    def stats(self):
+        with self.cond:
+            return {
+                "slots": len(self.slots),
+                "queued": len(self.queue),
+                "booked": self.booked,
+                "rejected": self.rejected,
+                "persisted": self.persisted,
+                "conflicts": self.conflicts,
+                "batches": self.batches,
+                "avg_batch": round(self.persisted / self.batches, 2) if self.batches else 0,
+                "errors": self.errors,
+                "timed_out": self.timed_out,
+                "reloads": self.reloads,
+                "commit_latency": self.commit_latency.snapshot()
+            }
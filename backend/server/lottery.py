@@ -0,0 +1,38 @@
+import math
+import random
+
+
+def weighted_order(weights, rng=random):
+    """
+    按权重随机排列 (Efraimidis-Spirakis 加权无放回抽样)
+    每个参与者取 key = ln(U) / w，按 key 从大到小排列，等价于按权重依次不放回抽取
+    (取对数避免 U ** (1 / w) 在权重较大时的精度问题)
+    :param weights: {参与者: 权重 (> 0)}
+    :return: list - 参与者的抽签顺序
+    """
+    keys = []
+    for participant, weight in weights.items():
+        u = rng.random()
+        while u == 0.0:
+            u = rng.random()
+        keys.append((math.log(u) / weight, participant))
+    keys.sort(reverse=True)
+    return [participant for _, participant in keys]
+
+
+def allocate(preferences, weights, capacity, rng=random):
+    """
+    抽签分配: 按加权随机顺序依次为每人分配其志愿中排名最高且仍有名额的时段 (每人最多中一个)
+    :param preferences: {参与者: [slot_id, ...] (按志愿顺序)}
+    :param weights: {参与者: 权重}
+    :param capacity: {slot_id: 剩余名额}，会被原地扣减
+    :return: list - [(参与者, slot_id)]，按抽签顺序
+    """
+    winners = []
+    for participant in weighted_order(weights, rng):
+        for slot_id in preferences[participant]:
+            if capacity.get(slot_id, 0) > 0:
+                capacity[slot_id] -= 1
+                winners.append((participant, slot_id))
+                break
+    return winners
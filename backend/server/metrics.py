@@ -0,0 +1,137 @@
+import json
+import os
+import threading
+import time
+
+
+class LatencyHistogram:
+    """
+    HDR 风格的对数-线性分桶延迟直方图 (单位: 微秒)
+    - 0~31us 每 1us 一个桶
+    - 之后每个 2 的幂区间再均分为 16 个子桶，相对误差不超过 1/16
+    记录为 O(1)，内存固定 (不保存原始样本)
+    """
+    LINEAR_LIMIT = 32
+    SUB_BUCKETS = 16
+    MAX_BUCKETS = 32 + 40 * 16
+
+    def __init__(self):
+        self.counts = [0] * self.MAX_BUCKETS
+        self.total = 0
+        self.sum_us = 0
+        self.min_us = None
+        self.max_us = 0
+
+    @classmethod
+    def bucket_index(cls, value_us):
+        if value_us < cls.LINEAR_LIMIT:
+            return value_us
+        shift = value_us.bit_length() - 5
+        index = cls.LINEAR_LIMIT + (shift - 1) * cls.SUB_BUCKETS + ((value_us >> shift) - cls.SUB_BUCKETS)
+        return min(index, cls.MAX_BUCKETS - 1)
+
+    @classmethod
+    def bucket_value(cls, index):
+        """返回桶的代表值 (桶区间中点)"""
+        if index < cls.LINEAR_LIMIT:
+            return index
+        shift = (index - cls.LINEAR_LIMIT) // cls.SUB_BUCKETS + 1
+        sub = (index - cls.LINEAR_LIMIT) % cls.SUB_BUCKETS
+        lower = (cls.SUB_BUCKETS + sub) << shift
+        return lower + ((1 << shift) >> 1)
+
+    def record(self, seconds):
+        value_us = max(0, int(seconds * 1_000_000))
+        self.counts[self.bucket_index(value_us)] += 1
+        self.total += 1
+        self.sum_us += value_us
+        if self.min_us is None or value_us < self.min_us:
+            self.min_us = value_us
+        if value_us > self.max_us:
+            self.max_us = value_us
+
+    def percentile(self, p):
+        if not self.total:
+            return 0
+        target = max(1, int(round(self.total * p / 100.0)))
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= target:
+                return min(self.bucket_value(index), self.max_us)
+        return self.max_us
+
+    def snapshot(self):
+        """以毫秒为单位输出统计摘要"""
+        return {
+            "count": self.total,
+            "min_ms": (self.min_us or 0) / 1000.0,
+            "mean_ms": (self.sum_us / self.total / 1000.0) if self.total else 0,
+            "p50_ms": self.percentile(50) / 1000.0,
+            "p90_ms": self.percentile(90) / 1000.0,
+            "p99_ms": self.percentile(99) / 1000.0,
+            "p999_ms": self.percentile(99.9) / 1000.0,
+            "max_ms": self.max_us / 1000.0
+        }
+
+
+class ActionMetrics:
+    """单个 action 的计数器与延迟直方图"""
+
+    def __init__(self):
+        self.requests = 0
+        self.failures = 0  # 业务失败 (status=fail/busy)
+        self.errors = 0    # 参数错误或服务器异常 (status=error / 抛出异常)
+        self.latency = LatencyHistogram()
+
+    def snapshot(self):
+        return {
+            "requests": self.requests,
+            "failures": self.failures,
+            "errors": self.errors,
+            "latency": self.latency.snapshot()
+        }
+
+
+class MetricsRegistry:
+    """
+    按 action 汇总请求指标，线程安全
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.actions = {}
+        self.started_at = time.time()
+
+    def record(self, action, seconds, outcome='success'):
+        """
+        :param outcome: success / fail / error
+        """
+        with self.lock:
+            metrics = self.actions.get(action)
+            if metrics is None:
+                metrics = self.actions[action] = ActionMetrics()
+            metrics.requests += 1
+            if outcome == 'error':
+                metrics.errors += 1
+            elif outcome != 'success':
+                metrics.failures += 1
+            metrics.latency.record(seconds)
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                "uptime_seconds": round(time.time() - self.started_at, 1),
+                "actions": {name: m.snapshot() for name, m in sorted(self.actions.items())}
+            }
+
+    def dump(self, path, extra=None):
+        """将当前快照写入本地文件 (先写临时文件再替换，避免读到半个文件)"""
+        data = self.snapshot()
+        data["dump_time"] = time.strftime('%Y-%m-%d %H:%M:%S')
+        if extra:
+            data.update(extra)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, path)
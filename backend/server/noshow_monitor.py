@@ -0,0 +1,155 @@
+import datetime
+import heapq
+import threading
+
+try:
+    from server.metrics import LatencyHistogram
+except ImportError:
+    from metrics import LatencyHistogram
+
+
+def parse_slot_end(date_value, end_time):
+    """时段结束时间 -> datetime (兼容 'HH:MM' 与 'HH:MM:SS')"""
+    return datetime.datetime.fromisoformat(f"{date_value} {end_time}")
+
+
+class NoShowMonitor:
+    """
+    近实时爽约检测
+    - 内存中维护待签到预约的最小堆 (按时段结束时间排序)，启动时从数据库加载
+    - 通过 DBManager 的数据变更事件增量维护: 新预约入堆，取消/签到从待处理表中移除 (堆中惰性删除)
+    - 后台线程在时段结束 grace_seconds 秒后批量判定爽约并扣分，不扫描整张预约表
+    - 每日/定时的 process_no_shows 仍作为兜底 (处理监听器遗漏或服务器停机期间的预约)
+    """
+
+    def __init__(self, db_manager, grace_seconds=5, max_batch=500, clock=datetime.datetime.now):
+        self.db = db_manager
+        self.grace = datetime.timedelta(seconds=grace_seconds)
+        self.max_batch = max_batch
+        self.clock = clock
+        self.heap = []     # [(结束时间, reservation_id)]
+        self.pending = {}  # reservation_id -> 结束时间 (不在其中的堆元素已失效)
+        self.cond = threading.Condition()
+        self.reload_requested = False
+        self.running = False
+        self.thread = None
+        self.marked = 0
+        self.batches = 0
+        self.errors = 0
+        self.lag = LatencyHistogram()  # 时段结束到判定爽约的延迟
+
+    def start(self):
+        # 先注册监听器再加载，加载期间产生的新预约不会遗漏 (重复入堆无影响)
+        self.db.add_listener(self.on_event)
+        self.load()
+        print(f"[NoShow] 爽约检测已启动，待签到预约 {len(self.pending)} 条")
+        self.running = True
+        self.thread = threading.Thread(target=self._run, name='noshow-monitor')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        with self.cond:
+            self.running = False
+            self.cond.notify()
+
+    def load(self):
+        rows = self.db.get_pending_reservation_ends()
+        entries = []
+        for reservation_id, date_value, end_time in rows:
+            try:
+                entries.append((parse_slot_end(date_value, end_time), reservation_id))
+            except ValueError:
+                print(f"[NoShow] 预约 {reservation_id} 的时段时间格式无效: {date_value} {end_time}")
+        with self.cond:
+            heapq.heapify(entries)
+            self.heap = entries
+            self.pending = {reservation_id: end for end, reservation_id in entries}
+            self.cond.notify()
+
+    def track(self, reservation_id, end):
+        with self.cond:
+            self.pending[reservation_id] = end
+            heapq.heappush(self.heap, (end, reservation_id))
+            if self.heap[0][1] == reservation_id:
+                self.cond.notify()
+
+    def on_event(self, event, data):
+        if event == 'reservation_booked':
+            if data.get('date') and data.get('end_time'):
+                self.track(data['reservation_id'], parse_slot_end(data['date'], data['end_time']))
+        elif event in ('reservation_released', 'reservation_closed'):
+            with self.cond:
+                self.pending.pop(data['reservation_id'], None)
+                # 惰性删除积累过多时重建堆
+                if len(self.heap) > 2 * len(self.pending) + 1024:
+                    self.heap = [(end, rid) for rid, end in self.pending.items()]
+                    heapq.heapify(self.heap)
+        elif event == 'reservations_changed':
+            # 教师课表批量创建/取消预约，重新加载 (在检测线程中执行)
+            with self.cond:
+                self.reload_requested = True
+                self.cond.notify()
+
+    def _take_due(self, now):
+        due = []
+        while self.heap and self.heap[0][0] + self.grace <= now and len(due) < self.max_batch:
+            end, reservation_id = heapq.heappop(self.heap)
+            if self.pending.get(reservation_id) == end:
+                del self.pending[reservation_id]
+                due.append((reservation_id, end))
+        return due
+
+    def _run(self):
+        while True:
+            due = []
+            with self.cond:
+                while self.running and not self.reload_requested:
+                    now = self.clock()
+                    due = self._take_due(now)
+                    if due:
+                        break
+                    timeout = 60
+                    if self.heap:
+                        timeout = min(timeout, max(0.0, (self.heap[0][0] + self.grace - now).total_seconds()))
+                    self.cond.wait(timeout)
+                if not self.running:
+                    return
+                reload, self.reload_requested = self.reload_requested, False
+
+            if due:
+                self._mark(due, now)
+            if reload:
+                try:
+                    self.load()
+                except Exception as e:
+                    print(f"[NoShow] 重新加载待签到预约失败: {e}")
+
+    def _mark(self, due, now):
+        try:
+            marked = self.db.mark_no_shows([rid for rid, _ in due], now)
+        except Exception as e:
+            # 未处理的预约交给定时兜底任务
+            with self.cond:
+                self.errors += 1
+            print(f"[NoShow] 判定爽约失败: {e}")
+            return
+        with self.cond:
+            self.batches += 1
+            self.marked += marked
+            for _, end in due:
+                self.lag.record((now - end).total_seconds())
+        if marked:
+            print(f"[NoShow] 判定爽约 {marked} 条")
+
+    def stats(self):
+        with self.cond:
+            return {
+                "pending": len(self.pending),
+                "heap_size": len(self.heap),
+                "next_expiry": self.heap[0][0].strftime('%Y-%m-%d %H:%M:%S') if self.heap else None,
+                "marked": self.marked,
+                "batches": self.batches,
+                "errors": self.errors,
+                "detection_lag": self.lag.snapshot()
+            }
@@ -0,0 +1,67 @@
+import json
+import struct
+
+# 通信协议: 每条消息 = 4 字节大端长度头 + UTF-8 编码的 JSON 正文
+# 解决单次 recv(4096) 截断大响应、以及 TCP 粘包导致 json.loads 失败的问题
+HEADER = struct.Struct('!I')
+MAX_MESSAGE_SIZE = 64 * 1024 * 1024  # 单条消息上限 64MB，防止恶意长度头耗尽内存
+RECV_CHUNK_SIZE = 64 * 1024
+
+
+class ProtocolError(Exception):
+    """消息帧格式错误 (长度头非法等)"""
+    pass
+
+
+def encode_message(obj):
+    """
+    将对象编码为一帧完整的字节流 (长度头 + JSON)
+    ensure_ascii=False 允许直接输出中文，而不是 Unicode 编码
+    """
+    body = json.dumps(obj, ensure_ascii=False).encode('utf-8')
+    return HEADER.pack(len(body)) + body
+
+
+def recv_exact(sock, size):
+    """
+    循环读取直到收满 size 字节
+    :return: bytes；对端在帧开始前正常关闭时返回 None
+    """
+    buf = bytearray()
+    while len(buf) < size:
+        chunk = sock.recv(min(size - len(buf), RECV_CHUNK_SIZE))
+        if not chunk:
+            if not buf:
+                return None
+            raise ConnectionResetError("连接在消息中途关闭")
+        buf.extend(chunk)
+    return bytes(buf)
+
+
+def read_message_bytes(sock):
+    """
+    读取一帧消息的正文字节
+    :return: bytes；连接关闭时返回 None
+    """
+    header = recv_exact(sock, HEADER.size)
+    if header is None:
+        return None
+    (length,) = HEADER.unpack(header)
+    if length > MAX_MESSAGE_SIZE:
+        raise ProtocolError(f"消息长度超出上限: {length}")
+    body = recv_exact(sock, length)
+    if body is None:
+        raise ConnectionResetError("连接在消息中途关闭")
+    return body
+
+
+def send_frame(sock, frame):
+    """
+    发送已编码的帧 (长度头需要正文长度，整帧在内存中编码完成后一次写出)
+    sendall 内部循环直到全部写入，不会出现只发送一部分的情况
+    """
+    sock.sendall(frame)
+
+
+def send_message(sock, obj):
+    send_frame(sock, encode_message(obj))
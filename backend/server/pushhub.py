@@ -0,0 +1,347 @@
+import collections
+import queue
+import socket
+import threading
+import time
+
+try:
+    from server.protocol import encode_message, send_frame
+except ImportError:
+    from protocol import encode_message, send_frame
+
+
+class SocketConnection:
+    """
+    线程版服务器的一个客户端连接
+    - 响应与推送共用一个 socket，发送时持有 send_lock，保证帧不会交错
+    - 推送帧先进入有界的待发送队列，由推送线程写出；队列满或单次发送超时视为慢消费者，断开连接
+    """
+
+    def __init__(self, sock, hub):
+        self.sock = sock
+        self.hub = hub
+        self.send_lock = threading.Lock()
+        self.lock = threading.Lock()
+        self.pending = collections.deque()
+        self.scheduled = False
+        self.sending_since = None
+        self.dropped = False
+
+    def send(self, frame):
+        """发送请求的响应 (在连接线程中调用)"""
+        with self.send_lock:
+            send_frame(self.sock, frame)
+
+    def push(self, frame):
+        """
+        推送一帧 (在分发线程中调用，不阻塞)
+        :return: bool - False 表示连接已被断开
+        """
+        with self.lock:
+            if self.dropped:
+                return False
+            if len(self.pending) >= self.hub.max_pending or self.is_stalled():
+                self._drop_locked()
+                return False
+            self.pending.append(frame)
+            if self.scheduled:
+                return True
+            self.scheduled = True
+        self.hub.ready.put(self)
+        return True
+
+    def is_stalled(self):
+        since = self.sending_since
+        return since is not None and time.monotonic() - since > self.hub.send_timeout
+
+    def flush(self):
+        """推送线程: 写出待发送队列中的全部帧"""
+        while True:
+            with self.lock:
+                if self.dropped or not self.pending:
+                    self.scheduled = False
+                    return
+                frame = self.pending.popleft()
+            try:
+                with self.send_lock:
+                    self.sending_since = time.monotonic()
+                    send_frame(self.sock, frame)
+                    self.sending_since = None
+                self.hub.count_sent()
+            except OSError:
+                self.drop()
+                return
+
+    def drop(self):
+        with self.lock:
+            self._drop_locked()
+
+    def _drop_locked(self):
+        if self.dropped:
+            return
+        self.dropped = True
+        self.pending.clear()
+        self.hub.count_dropped()
+        # 关闭读写两端: 阻塞中的 sendall / recv 立即返回，连接线程随后清理订阅
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+
+class StreamConnection:
+    """
+    asyncio 版服务器的一个客户端连接
+    推送在事件循环中写出，写缓冲超过 max_buffer 字节或排队的推送超过 max_pending 帧时断开连接
+    """
+
+    def __init__(self, writer, loop, hub, max_buffer=1024 * 1024):
+        self.writer = writer
+        self.loop = loop
+        self.hub = hub
+        self.max_buffer = max_buffer
+        self.lock = threading.Lock()
+        self.queued = 0
+        self.dropped = False
+
+    def push(self, frame):
+        with self.lock:
+            if self.dropped:
+                return False
+            if self.queued >= self.hub.max_pending:
+                self._drop_locked()
+                return False
+            self.queued += 1
+        try:
+            self.loop.call_soon_threadsafe(self._write, frame)
+        except RuntimeError:
+            # 事件循环已关闭
+            self.drop()
+            return False
+        return True
+
+    def _write(self, frame):
+        with self.lock:
+            self.queued -= 1
+            if self.dropped:
+                return
+        if self.writer.transport.get_write_buffer_size() > self.max_buffer:
+            self.drop()
+            return
+        self.writer.write(frame)
+        self.hub.count_sent()
+
+    def is_stalled(self):
+        return False
+
+    def drop(self):
+        with self.lock:
+            self._drop_locked()
+
+    def _drop_locked(self):
+        if self.dropped:
+            return
+        self.dropped = True
+        self.hub.count_dropped()
+        try:
+            self.loop.call_soon_threadsafe(self.writer.close)
+        except RuntimeError:
+            pass
+
+
+class PushHub:
+    """
+    号源变更推送中心
+    - 客户端在已有连接上 subscribe (venue_id, date) 频道，服务器在号源人数变化时主动推送
+    - 数据变更事件 (预约/取消/教师锁定/号源维护) 只把受影响的频道标记为待推送，由分发线程
+      按频道用增量游标 (get_slot_changes) 取出变化的时段，编码一次后发给频道内所有订阅者
+      (同一时刻的多次变更自然合并为一帧)
+    - 每个连接的待发送推送有上限，慢消费者直接断开，不拖慢其他订阅者
+    推送帧格式: {"type": "push", "channel": {"venue_id", "date"}, "data": [...], "cursor", "full"}
+    """
+
+    def __init__(self, db_manager, max_pending=64, pushers=4, send_timeout=5.0):
+        self.db = db_manager
+        self.max_pending = max_pending
+        self.send_timeout = send_timeout
+        self.lock = threading.Condition()
+        self.channels = {}      # (venue_id, date) -> {"subscribers": set, "cursor": str}
+        self.subscriptions = {}  # connection -> set(key)
+        self.dirty = set()
+        self.ready = queue.Queue()
+        self.pusher_count = pushers
+        self.running = False
+        # 计数器单独加锁: 连接在持有自身锁时也会计数，避免与 self.lock 形成锁顺序死锁
+        self.stats_lock = threading.Lock()
+        self.published = 0
+        self.sent = 0
+        self.dropped = 0
+
+    def start(self):
+        self.db.add_listener(self.on_event)
+        self.running = True
+        dispatcher = threading.Thread(target=self._dispatch, name='push-dispatcher')
+        dispatcher.daemon = True
+        dispatcher.start()
+        for i in range(self.pusher_count):
+            t = threading.Thread(target=self._push_worker, name=f'pusher-{i}')
+            t.daemon = True
+            t.start()
+
+    def stop(self):
+        with self.lock:
+            self.running = False
+            self.lock.notify_all()
+        for _ in range(self.pusher_count):
+            self.ready.put(None)
+
+    def count_sent(self):
+        with self.stats_lock:
+            self.sent += 1
+
+    def count_dropped(self):
+        with self.stats_lock:
+            self.dropped += 1
+
+    def subscribe(self, conn, venue_id, date_str):
+        """
+        订阅频道，返回当前全部时段与游标 (之后的变化通过推送下发)
+        :return: (bool, dict 或 错误信息)
+        """
+        if not self.db.slot_cache:
+            return False, "服务器未开启号源缓存，不支持订阅"
+        try:
+            key = (int(venue_id), date_str)
+        except (TypeError, ValueError):
+            return False, "场馆ID无效"
+        # 先登记订阅再取快照: 快照之后的变化一定会被推送 (推送内容为绝对人数，重复推送无影响)
+        with self.lock:
+            channel = self.channels.get(key)
+            if channel is None:
+                channel = self.channels[key] = {"subscribers": set(), "cursor": None}
+                self.db.slot_cache.pin(key)
+            channel["subscribers"].add(conn)
+            self.subscriptions.setdefault(conn, set()).add(key)
+        success, result = self.db.get_slot_changes(venue_id, date_str)
+        if not success:
+            self.unsubscribe(conn, venue_id, date_str)
+            return False, result
+        with self.lock:
+            if channel["cursor"] is None:
+                channel["cursor"] = result["cursor"]
+        return True, result
+
+    def unsubscribe(self, conn, venue_id, date_str):
+        try:
+            key = (int(venue_id), date_str)
+        except (TypeError, ValueError):
+            return False
+        with self.lock:
+            keys = self.subscriptions.get(conn)
+            if not keys or key not in keys:
+                return False
+            keys.discard(key)
+            if not keys:
+                del self.subscriptions[conn]
+            self._leave(conn, key)
+        return True
+
+    def drop(self, conn):
+        """连接关闭: 取消该连接的全部订阅"""
+        with self.lock:
+            for key in self.subscriptions.pop(conn, ()):
+                self._leave(conn, key)
+
+    def _leave(self, conn, key):
+        channel = self.channels.get(key)
+        if channel is None:
+            return
+        channel["subscribers"].discard(conn)
+        if not channel["subscribers"]:
+            del self.channels[key]
+            self.dirty.discard(key)
+            self.db.slot_cache.unpin(key)
+
+    def on_event(self, event, data):
+        """DBManager 数据变更监听器: 标记受影响的频道"""
+        with self.lock:
+            if not self.channels:
+                return
+            if event in ('reservation_booked', 'reservation_released'):
+                key = self.db.slot_cache.key_of(data['slot_id'])
+                if key in self.channels:
+                    self.dirty.add(key)
+            elif event == 'reservations_changed':
+                venue_id = int(data['venue_id'])
+                self.dirty.update(k for k in self.channels if k[0] == venue_id)
+            elif event == 'slots_changed':
+                self.dirty.update(self.channels)
+            else:
+                return
+            if self.dirty:
+                self.lock.notify()
+
+    def _dispatch(self):
+        while True:
+            with self.lock:
+                while self.running and not self.dirty:
+                    if not self.lock.wait(1.0):
+                        break
+                if not self.running:
+                    return
+                work = [(key, self.channels[key]["cursor"]) for key in self.dirty if key in self.channels]
+                self.dirty.clear()
+                # 发送卡住的连接 (客户端不读数据) 即使没有新推送也要断开，释放推送线程
+                stalled = [conn for conn in self.subscriptions if conn.is_stalled()]
+            for conn in stalled:
+                conn.drop()
+            for key, cursor in work:
+                self._publish(key, cursor)
+
+    def _publish(self, key, cursor):
+        venue_id, date_str = key
+        try:
+            success, result = self.db.get_slot_changes(venue_id, date_str, cursor)
+        except Exception as e:
+            print(f"[Push] 读取频道 {key} 的变更失败: {e}")
+            return
+        if not success:
+            return
+        with self.lock:
+            channel = self.channels.get(key)
+            if channel is None:
+                return
+            channel["cursor"] = result["cursor"]
+            subscribers = list(channel["subscribers"])
+        if not result["slots"] and not result["full"]:
+            return
+        frame = encode_message({
+            "type": "push",
+            "channel": {"venue_id": venue_id, "date": date_str},
+            "data": result["slots"],
+            "cursor": result["cursor"],
+            "full": result["full"]
+        })
+        with self.stats_lock:
+            self.published += 1
+        for conn in subscribers:
+            if not conn.push(frame):
+                self.drop(conn)
+
+    def _push_worker(self):
+        while True:
+            conn = self.ready.get()
+            if conn is None:
+                break
+            conn.flush()
+
+    def stats(self):
+        with self.lock, self.stats_lock:
+            return {
+                "channels": len(self.channels),
+                "subscribers": sum(len(c["subscribers"]) for c in self.channels.values()),
+                "connections": len(self.subscriptions),
+                "published": self.published,
+                "frames_sent": self.sent,
+                "dropped_consumers": self.dropped
+            }
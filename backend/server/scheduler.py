@@ -0,0 +1,241 @@
+import datetime
+import heapq
+import json
+import os
+import queue
+import threading
+import time
+
+try:
+    from server.metrics import LatencyHistogram
+except ImportError:
+    from metrics import LatencyHistogram
+
+
+class Job:
+    """
+    定时任务
+    - daily: 每天 hour:minute 一个执行窗口
+    - interval: 每隔 seconds 秒执行一次
+    """
+
+    def __init__(self, name, func, kind, hour=0, minute=0, seconds=0):
+        self.name = name
+        self.func = func
+        self.kind = kind
+        self.hour = hour
+        self.minute = minute
+        self.seconds = seconds
+        self.last_run = None     # 最近一次成功执行所属的窗口 (datetime，持久化)
+        self.next_run = None     # 下一次触发的窗口 (datetime)
+        self.running = False
+        self.runs = 0
+        self.failures = 0
+        self.last_error = None
+        self.last_result = None
+        self.latency = LatencyHistogram()
+
+    def describe(self):
+        if self.kind == 'daily':
+            return f"daily {self.hour:02d}:{self.minute:02d}"
+        return f"every {self.seconds}s"
+
+    def window_at_or_before(self, now):
+        """daily 任务: 不晚于 now 的最近一个执行窗口"""
+        window = now.replace(hour=self.hour, minute=self.minute, second=0, microsecond=0)
+        if window > now:
+            window -= datetime.timedelta(days=1)
+        return window
+
+    def first_run(self, now):
+        """
+        启动时计算第一次触发的窗口
+        - 已错过的窗口 (停机期间) 且尚未执行过: 立即补执行一次
+        - 从未执行过的 daily 任务只补当天的窗口 (避免首次部署时补跑昨天的任务)
+        """
+        if self.kind == 'daily':
+            missed = self.window_at_or_before(now)
+            if self.last_run is None:
+                if missed.date() == now.date():
+                    return missed
+            elif self.last_run < missed:
+                return missed
+            return missed + datetime.timedelta(days=1)
+
+        if self.last_run is None:
+            return now + datetime.timedelta(seconds=self.seconds)
+        return max(now, self.last_run + datetime.timedelta(seconds=self.seconds))
+
+    def following(self, window, now):
+        """本次窗口之后的下一个窗口 (跳过已经过去的窗口，不会连续补跑)"""
+        if self.kind == 'daily':
+            return max(window, self.window_at_or_before(now)) + datetime.timedelta(days=1)
+        return max(window, now) + datetime.timedelta(seconds=self.seconds)
+
+    def snapshot(self):
+        return {
+            "schedule": self.describe(),
+            "next_run": self.next_run.strftime('%Y-%m-%d %H:%M:%S') if self.next_run else None,
+            "last_run": self.last_run.strftime('%Y-%m-%d %H:%M:%S') if self.last_run else None,
+            "running": self.running,
+            "runs": self.runs,
+            "failures": self.failures,
+            "last_error": self.last_error,
+            "last_result": self.last_result,
+            "duration": self.latency.snapshot()
+        }
+
+
+class JobScheduler:
+    """
+    基于定时器堆的任务调度器
+    - 定时线程按最早的触发时间休眠，到点后把任务交给专用的执行线程 (任务之间串行，不占用请求工作线程)
+    - 每个任务成功执行后把所属窗口写入 state_path，重启后同一窗口不会重复执行，停机错过的窗口会补执行一次
+    - 同一任务上一次还没执行完时，到点的触发直接跳过
+    - 返回 (False, msg) 或抛出异常视为失败，不更新执行标记
+    """
+    # 最长休眠时间，防止系统时间被调整后长时间不醒
+    MAX_SLEEP = 60
+
+    def __init__(self, state_path=None, clock=datetime.datetime.now):
+        self.state_path = state_path
+        self.clock = clock
+        self.jobs = {}
+        self.heap = []  # [(触发时间, 序号, 任务名)]
+        self.seq = 0
+        self.cond = threading.Condition()
+        self.work = queue.Queue()
+        self.running = False
+        self.timer_thread = None
+        self.worker_thread = None
+
+    def add_daily(self, name, func, hour, minute=0):
+        self._add(Job(name, func, 'daily', hour=hour, minute=minute))
+
+    def add_interval(self, name, func, seconds):
+        self._add(Job(name, func, 'interval', seconds=seconds))
+
+    def _add(self, job):
+        with self.cond:
+            if job.name in self.jobs:
+                raise ValueError(f"任务 {job.name} 已存在")
+            self.jobs[job.name] = job
+            if self.running:
+                self._schedule(job, job.first_run(self.clock()))
+
+    def _schedule(self, job, when):
+        job.next_run = when
+        self.seq += 1
+        heapq.heappush(self.heap, (when, self.seq, job.name))
+        self.cond.notify()
+
+    def load_state(self):
+        if not self.state_path or not os.path.exists(self.state_path):
+            return {}
+        try:
+            with open(self.state_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except Exception as e:
+            print(f"[Scheduler] 读取任务执行记录失败，将按首次运行处理: {e}")
+            return {}
+
+    def save_state(self):
+        if not self.state_path:
+            return
+        with self.cond:
+            data = {name: job.last_run.isoformat() for name, job in self.jobs.items() if job.last_run}
+        tmp_path = self.state_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.state_path)
+
+    def start(self):
+        state = self.load_state()
+        now = self.clock()
+        with self.cond:
+            self.running = True
+            for name, job in self.jobs.items():
+                if name in state:
+                    job.last_run = datetime.datetime.fromisoformat(state[name])
+                self._schedule(job, job.first_run(now))
+
+        self.timer_thread = threading.Thread(target=self._run_timer, name='scheduler-timer')
+        self.timer_thread.daemon = True
+        self.timer_thread.start()
+        self.worker_thread = threading.Thread(target=self._run_worker, name='scheduler-worker')
+        self.worker_thread.daemon = True
+        self.worker_thread.start()
+        print("[Scheduler] 定时任务已启动: " + ", ".join(
+            f"{job.name}({job.describe()})" for job in self.jobs.values()))
+
+    def stop(self):
+        with self.cond:
+            self.running = False
+            self.cond.notify_all()
+        self.work.put(None)
+
+    def _run_timer(self):
+        with self.cond:
+            while self.running:
+                now = self.clock()
+                if self.heap and self.heap[0][0] <= now:
+                    when, _, name = heapq.heappop(self.heap)
+                    job = self.jobs[name]
+                    if job.running:
+                        print(f"[Scheduler] 任务 {name} 上一次尚未结束，跳过本次触发")
+                    else:
+                        job.running = True
+                        self.work.put((job, when))
+                    self._schedule(job, job.following(when, now))
+                    continue
+                timeout = self.MAX_SLEEP
+                if self.heap:
+                    timeout = min(timeout, max(0.0, (self.heap[0][0] - now).total_seconds()))
+                self.cond.wait(timeout)
+
+    def _run_worker(self):
+        while True:
+            item = self.work.get()
+            if item is None:
+                break
+            job, window = item
+            self._execute(job, window)
+
+    def _execute(self, job, window):
+        print(f"[Scheduler] 开始执行任务 {job.name} (窗口 {window.strftime('%Y-%m-%d %H:%M:%S')})")
+        start = time.perf_counter()
+        error = None
+        result = None
+        try:
+            result = job.func()
+            if isinstance(result, tuple) and len(result) == 2 and result[0] is False:
+                error = str(result[1])
+        except Exception as e:
+            error = str(e)
+        elapsed = time.perf_counter() - start
+
+        with self.cond:
+            job.running = False
+            job.runs += 1
+            job.latency.record(elapsed)
+            if error is None:
+                job.last_error = None
+                job.last_result = result if isinstance(result, (int, float, str, dict, list, tuple)) else None
+                if job.last_run is None or window > job.last_run:
+                    job.last_run = window
+            else:
+                job.failures += 1
+                job.last_error = error
+
+        if error is None:
+            print(f"[Scheduler] 任务 {job.name} 完成，耗时 {elapsed * 1000:.1f} ms")
+            try:
+                self.save_state()
+            except Exception as e:
+                print(f"[Scheduler] 保存任务执行记录失败: {e}")
+        else:
+            print(f"[Scheduler] 任务 {job.name} 失败 ({elapsed * 1000:.1f} ms): {error}")
+
+    def stats(self):
+        with self.cond:
+            return {name: job.snapshot() for name, job in sorted(self.jobs.items())}
@@ -3,6 +3,8 @@ import threading
 import json
 import sys
 import os
+import time
+from concurrent.futures import ThreadPoolExecutor
 
 # 将项目根目录添加到 sys.path，以便导入 server.db_manager
 current_dir = os.path.dirname(os.path.abspath(__file__))
@@ -10,114 +12,282 @@ project_root = os.path.dirname(current_dir)
 if project_root not in sys.path:
     sys.path.append(project_root)
 
+# 服务器运行指标定期导出文件
+STATS_PATH = os.path.join(current_dir, 'server_stats.json')
+# 定时任务最近一次执行的窗口 (重启后不重复执行)
+SCHEDULER_STATE_PATH = os.path.join(current_dir, 'scheduler_state.json')
+
+# 只读请求: batch 中可以并行执行
+READ_ONLY_ACTIONS = {
+    'get_available_slots', 'get_my_reservations', 'get_my_schedules', 'get_announcements',
+    'admin_get_venues', 'admin_get_courts', 'admin_get_users', 'admin_get_all_reservations',
+    'server_stats'
+}
+MAX_BATCH_SIZE = 20
+
+# 可合并的只读请求: 同一时刻完全相同的请求只执行一次，共享编码好的响应
+COALESCED_ACTIONS = READ_ONLY_ACTIONS - {'server_stats'}
+
+# 虚拟排队规则: 规则生效期间预约这些场馆需要先排队，按 rate 人/秒放行
+# 例: [{"venue_id": 1, "start": "22:00", "end": "22:10", "rate": 20}]
+WAITING_ROOM_RULES = []
+
+# 抽签模式: 热门时段在当天开奖 (admin_run_lottery) 之前不能直接预约，只能提交抽签志愿
+LOTTERY_HOT_SLOTS = False
+
+# 需要连接上下文的请求 (订阅推送)，不进入 action 注册表，也不能放在 batch 中
+SUBSCRIPTION_ACTIONS = {'subscribe', 'unsubscribe'}
+
 try:
     from server.db_manager import DBManager
+    from server.protocol import encode_message, read_message_bytes, ProtocolError
+    from server.executor import RequestExecutor, ServerBusy, BUSY_RESPONSE
+    from server.metrics import MetricsRegistry
+    from server.scheduler import JobScheduler
+    from server.noshow_monitor import NoShowMonitor
+    from server.singleflight import SingleFlight
+    from server.pushhub import PushHub, SocketConnection
+    from server.inventory import InventoryEngine
+    from server.group_commit import GroupCommit
+    from server.waiting_room import WaitingRoom
 except ImportError:
     # Fallback for direct execution
     sys.path.append(current_dir)
     from db_manager import DBManager
+    from protocol import encode_message, read_message_bytes, ProtocolError
+    from executor import RequestExecutor, ServerBusy, BUSY_RESPONSE
+    from metrics import MetricsRegistry
+    from scheduler import JobScheduler
+    from noshow_monitor import NoShowMonitor
+    from singleflight import SingleFlight
+    from pushhub import PushHub, SocketConnection
+    from inventory import InventoryEngine
+    from group_commit import GroupCommit
+    from waiting_room import WaitingRoom
 
 class SportsVenueServer:
-    def __init__(self, host='127.0.0.1', port=8888):
+    def __init__(self, host='127.0.0.1', port=8888, max_workers=16, max_queue=256, action_limits=None,
+                 inventory_engine=False, group_commit=True):
+        """
+        :param inventory_engine: 热门时段预约使用内存库存引擎 (内存判定 + 批量写入数据库)
+        :param group_commit: 并发的预约/取消/签到合并到同一个事务中提交
+        """
         self.host = host
         self.port = port
         self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         self.db_manager = DBManager()
+        # 有界请求执行器: 限制同时访问数据库的请求数，饱和时快速返回 busy
+        self.executor = RequestExecutor(max_workers, max_queue, action_limits)
+        self.handlers = self.build_handlers()
+        # batch 中只读子请求的并行执行线程池 (独立于请求执行器，避免占满工作线程后互相等待)
+        self.batch_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix='batch')
+        self.metrics = MetricsRegistry()
+        self.single_flight = SingleFlight()
+        self.stats_path = STATS_PATH
+        self.stats_interval = 60
+        self.scheduler = JobScheduler(SCHEDULER_STATE_PATH)
+        self.noshow_monitor = NoShowMonitor(self.db_manager)
+        self.push_hub = PushHub(self.db_manager)
+        self.inventory = InventoryEngine(self.db_manager) if inventory_engine else None
+        self.group_commit = GroupCommit(self.db_manager) if group_commit else None
+        self.waiting_room = WaitingRoom(self.db_manager, WAITING_ROOM_RULES)
         self.running = True
 
     def handle_client(self, client_socket):
+        # 响应与推送共用该连接，发送统一走 conn.send / 推送线程，保证帧不交错
+        conn = SocketConnection(client_socket, self.push_hub)
         try:
             while True:
-                # 接收数据 (最大 4096 字节)
-                request_data = client_socket.recv(4096).decode('utf-8')
-                if not request_data:
+                # 按长度头读取一条完整请求 (不再受单次 recv 4096 字节限制)
+                request_bytes = read_message_bytes(client_socket)
+                if request_bytes is None:
                     break
+                request_data = request_bytes.decode('utf-8')
                 
-                print(f"[>] 收到请求: {request_data}")
+                print(f"[>] 收到请求: {self._preview(request_data)}")
                 
                 try:
                     request = json.loads(request_data)
-                    response = self.process_request(request)
+                    frame = self.respond(request, conn).result()
+                except ServerBusy as e:
+                    print(f"[!] 拒绝请求: {e}")
+                    frame = encode_message(BUSY_RESPONSE)
                 except json.JSONDecodeError:
-                    response = {"status": "error", "message": "无效的 JSON 格式"}
+                    frame = encode_message({"status": "error", "message": "无效的 JSON 格式"})
                 except Exception as e:
-                    response = {"status": "error", "message": f"服务器内部错误: {str(e)}"}
+                    frame = encode_message({"status": "error", "message": f"服务器内部错误: {str(e)}"})
                 
-                # 发送响应
-                # ensure_ascii=False 允许直接输出中文，而不是 Unicode 编码
-                response_data = json.dumps(response, ensure_ascii=False)
-                print(f"[<] 发送响应: {response_data}")
-                client_socket.send(response_data.encode('utf-8'))
+                # 发送响应 (长度头 + JSON)
+                print(f"[<] 发送响应: {len(frame)} 字节")
+                conn.send(frame)
                 
         except ConnectionResetError:
             print(f"[*] 客户端强制断开连接")
+        except ProtocolError as e:
+            print(f"[!] 协议错误: {e}")
         except Exception as e:
             print(f"[!] 客户端处理错误: {e}")
         finally:
             print(f"[*] 连接关闭")
+            self.push_hub.drop(conn)
             client_socket.close()
 
+    @staticmethod
+    def _preview(text, limit=200):
+        """日志中只打印请求的前 limit 个字符"""
+        return text if len(text) <= limit else text[:limit] + '...'
+
+    def respond(self, request, conn=None):
+        """
+        提交请求到有界执行器，返回 Future，结果为编码好的响应帧 (bytes)
+        执行器饱和时直接抛出 ServerBusy，由调用方回复 busy，客户端应退避后重试
+        可合并的只读请求 (COALESCED_ACTIONS) 与进行中的相同请求共享同一次执行和同一份响应帧
+        :param conn: 当前连接 (订阅推送时使用)
+        :raises ServerBusy: 执行器已饱和
+        """
+        action = request.get('action')
+        if action in SUBSCRIPTION_ACTIONS:
+            return self.executor.submit(action, self.encode_subscription, request, conn)
+        if action not in COALESCED_ACTIONS:
+            return self.executor.submit(action, self.encode_response, request)
+        key = SingleFlight.make_key(action, request.get('data'))
+        return self.single_flight.submit(key, lambda: self.executor.submit(action, self.encode_response, request))
+
+    def encode_response(self, request):
+        """处理请求并编码响应帧 (在执行器工作线程中运行)"""
+        try:
+            response = self.process_request(request)
+        except Exception as e:
+            response = {"status": "error", "message": f"服务器内部错误: {str(e)}"}
+        return encode_message(response)
+
+    def encode_subscription(self, request, conn):
+        """
+        订阅/取消订阅号源推送: data = {"venue_id", "date"}
+        订阅成功时返回当前全部时段与游标，之后的变化以 type=push 的帧推送到同一连接
+        """
+        action = request.get('action')
+        data = request.get('data') or {}
+        venue_id = data.get('venue_id')
+        date_str = data.get('date')
+        start = time.perf_counter()
+        if conn is None:
+            response = {"status": "error", "message": "当前连接不支持订阅"}
+        elif not venue_id or not date_str:
+            response = {"status": "error", "message": "缺少场馆ID或日期"}
+        elif action == 'subscribe':
+            success, result = self.push_hub.subscribe(conn, venue_id, date_str)
+            if success:
+                response = {"status": "success", "data": result["slots"], "cursor": result["cursor"]}
+            else:
+                response = {"status": "fail", "message": result}
+        elif self.push_hub.unsubscribe(conn, venue_id, date_str):
+            response = {"status": "success", "message": "已取消订阅"}
+        else:
+            response = {"status": "fail", "message": "未订阅该频道"}
+        status = response["status"]
+        self.metrics.record(action, time.perf_counter() - start, 'success' if status == 'success' else status)
+        return encode_message(response)
+
+    def build_handlers(self):
+        """
+        action -> 处理函数 注册表
+        请求不同的操作——>调用不同的处理函数
+        """
+        return {
+            'login': self.handle_login,
+            'register': self.handle_register,
+            'get_available_slots': self.handle_get_slots,  #获取场馆各个场地时间段(各场地预约情况)
+            'book_venue': self.handle_book,  #预约操作
+            'join_queue': self.handle_join_queue,  #热门放号时段排队
+            'queue_status': self.handle_queue_status,  #查询排队位置
+            'lottery_submit': self.handle_lottery_submit,  #提交热门时段抽签志愿
+            'join_waitlist': self.handle_join_waitlist,  #已满时段加入候补
+            'leave_waitlist': self.handle_leave_waitlist,  #退出候补
+            'get_my_reservations': self.handle_get_reservations,  #查看我的预约
+            'cancel_booking': self.handle_cancel,
+            'add_schedule': self.handle_add_schedule,  #教室导课
+            'remove_schedule': self.handle_remove_schedule,  #教室删课
+            'get_my_schedules': self.handle_get_schedules,  #获取教师课表
+            'check_in': self.handle_check_in,  # 签到(完成预约，否则扣信用分)
+            # --- Admin Actions ---
+            'admin_get_venues': self.handle_admin_get_venues,
+            'admin_add_venue': self.handle_admin_add_venue,
+            'admin_update_venue': self.handle_admin_update_venue,
+            'admin_delete_venue': self.handle_admin_delete_venue,
+            'admin_get_courts': self.handle_admin_get_courts,
+            'admin_add_court': self.handle_admin_add_court,
+            'admin_delete_court': self.handle_admin_delete_court,
+            'admin_get_users': self.handle_admin_get_users,
+            'admin_update_user': self.handle_admin_update_user,
+            'admin_delete_user': self.handle_admin_delete_user,
+            'admin_get_all_reservations': self.handle_admin_get_all_reservations,  #管理员获取预约列表
+            'admin_cancel_reservation': self.handle_admin_cancel_reservation,  #管理员强制取消预约
+            'admin_add_announcement': self.handle_admin_add_announcement,   #管理员发布公告
+            'get_announcements': self.handle_get_announcements,
+            'admin_delete_announcement': self.handle_admin_delete_announcement,
+            'server_stats': self.handle_server_stats,  #管理员查看服务器运行指标
+            'admin_run_lottery': self.handle_admin_run_lottery,  #管理员对某天的热门时段开奖
+            'batch': self.handle_batch,  #批量请求 (一次往返执行多个子请求)
+        }
+
     def process_request(self, request):
         """
-        根据请求的 action 字段分发处理逻辑
+        根据请求的 action 字段查表分发处理逻辑，并记录每个 action 的延迟与结果
         """
         action = request.get('action')
         data = request.get('data')
-        # 请求不同的操作——>调用不同的处理函数
-        if action == 'login':
-            return self.handle_login(data)
-        elif action == 'register':
-            return self.handle_register(data)
-        elif action == 'get_available_slots':  #获取场馆各个场地时间段(各场地预约情况)
-            return self.handle_get_slots(data)
-        elif action == 'book_venue':  #预约操作
-            return self.handle_book(data)
-        elif action == 'get_my_reservations':  #查看我的预约
-            return self.handle_get_reservations(data)
-        elif action == 'cancel_booking':
-            return self.handle_cancel(data)
-        elif action == 'add_schedule':  #教室导课
-            return self.handle_add_schedule(data)
-        elif action == 'remove_schedule':  #教室删课
-            return self.handle_remove_schedule(data)
-        elif action == 'get_my_schedules':  #获取教师课表
-            return self.handle_get_schedules(data)
-        elif action == 'check_in':    # 签到(完成预约，否则扣信用分)
-            return self.handle_check_in(data)
-        # --- Admin Actions ---
-        elif action == 'admin_get_venues':
-            return self.handle_admin_get_venues(data)
-        elif action == 'admin_add_venue':
-            return self.handle_admin_add_venue(data)
-        elif action == 'admin_update_venue':
-            return self.handle_admin_update_venue(data)
-        elif action == 'admin_delete_venue':
-            return self.handle_admin_delete_venue(data)
-        elif action == 'admin_get_courts':
-            return self.handle_admin_get_courts(data)
-        elif action == 'admin_add_court':
-            return self.handle_admin_add_court(data)
-        elif action == 'admin_delete_court':
-            return self.handle_admin_delete_court(data)
-        elif action == 'admin_get_users':
-            return self.handle_admin_get_users(data)
-        elif action == 'admin_update_user':
-            return self.handle_admin_update_user(data)
-        elif action == 'admin_delete_user':
-            return self.handle_admin_delete_user(data)
-        elif action == 'admin_get_all_reservations':  #管理员获取预约列表
-            return self.handle_admin_get_all_reservations(data)
-        elif action == 'admin_cancel_reservation':  #管理员强制取消预约
-            return self.handle_admin_cancel_reservation(data)
-        elif action == 'admin_add_announcement':   #管理员发布公告
-            return self.handle_admin_add_announcement(data)
-        elif action == 'get_announcements':
-            return self.handle_get_announcements(data)
-        elif action == 'admin_delete_announcement':
-            return self.handle_admin_delete_announcement(data)
-        else:
+        handler = self.handlers.get(action)
+        if handler is None:
             return {"status": "error", "message": f"未知的请求类型: {action}"}
 
+        outcome = 'error'
+        start = time.perf_counter()
+        try:
+            response = handler(data)
+            status = response.get('status')
+            outcome = 'success' if status in ('success', 'not_modified') else ('error' if status == 'error' else 'fail')
+            return response
+        finally:
+            self.metrics.record(action, time.perf_counter() - start, outcome)
+
+    def handle_batch(self, data):
+        """
+        批量请求: data = {"requests": [{"action", "data"}, ...], "parallel": bool}
+        子请求按顺序返回结果；全部为只读请求且 parallel=True 时并行执行
+        每个子请求占用各自 action 的并发名额，已达上限的子请求单独返回 busy (其余照常执行)
+        """
+        requests = (data or {}).get('requests')
+        if not isinstance(requests, list) or not requests:
+            return {"status": "error", "message": "缺少子请求列表"}
+        if len(requests) > MAX_BATCH_SIZE:
+            return {"status": "error", "message": f"单次批量请求最多 {MAX_BATCH_SIZE} 个"}
+        for sub in requests:
+            if not isinstance(sub, dict) or sub.get('action') == 'batch':
+                return {"status": "error", "message": "子请求格式错误"}
+
+        parallel = data.get('parallel', True)
+        if parallel and len(requests) > 1 and all(sub.get('action') in READ_ONLY_ACTIONS for sub in requests):
+            results = list(self.batch_pool.map(self.run_sub_request, requests))
+        else:
+            # 含写操作时严格按顺序执行，保证前后依赖
+            results = [self.run_sub_request(sub) for sub in requests]
+        return {"status": "success", "data": results}
+
+    def run_sub_request(self, request):
+        # 子请求同样计入各自 action 的并发上限，超出时该子请求返回 busy
+        action = request.get('action')
+        try:
+            self.executor.acquire(action)
+        except ServerBusy:
+            return dict(BUSY_RESPONSE)
+        try:
+            return self.process_request(request)
+        except Exception as e:
+            return {"status": "error", "message": f"服务器内部错误: {str(e)}"}
+        finally:
+            self.executor.release(action)
+
     def handle_register(self, data):
         if not data:
             return {"status": "error", "message": "缺少请求数据"}
@@ -162,6 +332,13 @@ class SportsVenueServer:
         if not venue_id or not date_str:
             return {"status": "error", "message": "缺少场馆ID或日期"}
         
+        # 增量同步: 带 since (首次可传空字符串) 时只返回游标之后变化的时段和新游标
+        if 'since' in data:
+            success, result = self.db_manager.get_slot_changes(venue_id, date_str, data.get('since'))
+            if success:
+                return {"status": "success", "data": result["slots"], "cursor": result["cursor"], "full": result["full"]}
+            return {"status": "fail", "message": result}
+        
         success, result = self.db_manager.get_available_slots(venue_id, date_str)
         if success:
             return {"status": "success", "data": result}
@@ -174,8 +351,78 @@ class SportsVenueServer:
         
         if not user_account or not slot_id:
             return {"status": "error", "message": "缺少用户账号或时间段ID"}
+
+        if LOTTERY_HOT_SLOTS and self.db_manager.is_lottery_slot(slot_id):
+            return {"status": "fail", "message": "该热门时段采用抽签分配，请提交抽签志愿"}
+
+        # 排队时段内需要已放行的排队号，否则返回排队状态 (客户端按 wait_seconds 轮询 queue_status 后重试)
+        allowed, queue = self.waiting_room.check(user_account, slot_id, data.get('queue_token'))
+        if not allowed:
+            return {"status": "queued", "message": "当前预约人数较多，正在排队", "data": queue}
             
         success, message = self.db_manager.create_reservation(user_account, slot_id)
+        if success:
+            return {"status": "success", "message": message}
+        elif message == "该时段预约人数已满":
+            # 客户端据此提示用户加入候补 (join_waitlist)
+            return {"status": "fail", "message": message, "can_waitlist": True}
+        else:
+            return {"status": "fail", "message": message}
+
+    def handle_join_waitlist(self, data):
+        user_account = data.get('user_account')
+        slot_id = data.get('slot_id')
+        if not user_account or not slot_id:
+            return {"status": "error", "message": "缺少用户账号或时间段ID"}
+        success, message = self.db_manager.join_waitlist(user_account, slot_id)
+        if success:
+            return {"status": "success", "message": message}
+        else:
+            return {"status": "fail", "message": message}
+
+    def handle_leave_waitlist(self, data):
+        user_account = data.get('user_account')
+        slot_id = data.get('slot_id')
+        if not user_account or not slot_id:
+            return {"status": "error", "message": "缺少用户账号或时间段ID"}
+        success, message = self.db_manager.leave_waitlist(user_account, slot_id)
+        if success:
+            return {"status": "success", "message": message}
+        else:
+            return {"status": "fail", "message": message}
+
+    def handle_join_queue(self, data):
+        user_account = data.get('user_account')
+        venue_id = data.get('venue_id')
+        if not user_account or not venue_id:
+            return {"status": "error", "message": "缺少用户账号或场馆ID"}
+        success, result = self.waiting_room.join(user_account, venue_id)
+        if success:
+            return {"status": "success", "data": result}
+        else:
+            return {"status": "fail", "message": result}
+
+    def handle_queue_status(self, data):
+        token = data.get('queue_token')
+        if not token:
+            return {"status": "error", "message": "缺少排队号"}
+        success, result = self.waiting_room.status(token)
+        if success:
+            return {"status": "success", "data": result}
+        else:
+            return {"status": "fail", "message": result}
+
+    def handle_lottery_submit(self, data):
+        user_account = data.get('user_account')
+        slot_ids = data.get('slot_ids')
+        if not user_account or not slot_ids:
+            return {"status": "error", "message": "缺少用户账号或志愿时段"}
+        # 未开启抽签模式时热门时段直接预约，不接受志愿；已开奖的时段也不再接受
+        if not LOTTERY_HOT_SLOTS:
+            return {"status": "fail", "message": "当前未开启热门时段抽签，请直接预约"}
+        if isinstance(slot_ids, list) and not all(self.db_manager.is_lottery_slot(slot_id) for slot_id in slot_ids):
+            return {"status": "fail", "message": "所选时段不在抽签范围内或已开奖"}
+        success, message = self.db_manager.submit_lottery_entries(user_account, slot_ids)
         if success:
             return {"status": "success", "message": message}
         else:
@@ -215,7 +462,7 @@ class SportsVenueServer:
         if not all([teacher_account, venue_id, day_of_week is not None, start_time, end_time]):
             return {"status": "error", "message": "缺少必要参数"}
             
-        success, message = self.db_manager.add_teacher_schedule(teacher_account, venue_id, int(day_of_week), start_time, end_time)
+        success, message = self.db_manager.add_teacher_schedule(teacher_account, int(venue_id), int(day_of_week), start_time, end_time)
         if success:
             return {"status": "success", "message": message}
         else:
@@ -260,12 +507,21 @@ class SportsVenueServer:
 
     # --- Admin Handlers ---
 
-    def handle_admin_get_venues(self, data):
-        success, result = self.db_manager.admin_get_venues()
-        if success:
-            return {"status": "success", "data": result}
-        else:
+    def reference_response(self, data, key, loader):
+        """
+        参考数据 (场馆、场地、公告) 的读取响应，带版本号
+        请求中的 if_version 与当前版本相同时只回复 not_modified，不再传输完整数据
+        """
+        if_version = (data or {}).get('if_version')
+        version, success, result = self.db_manager.ref_cache.get(key, loader)
+        if not success:
             return {"status": "fail", "message": result}
+        if if_version is not None and if_version == version:
+            return {"status": "not_modified", "version": version}
+        return {"status": "success", "data": result, "version": version}
+
+    def handle_admin_get_venues(self, data):
+        return self.reference_response(data, ('venues',), self.db_manager.admin_get_venues)
 
     def handle_admin_add_venue(self, data):
         name = data.get('name')
@@ -300,11 +556,8 @@ class SportsVenueServer:
 
     def handle_admin_get_courts(self, data):
         venue_id = data.get('venue_id')
-        success, result = self.db_manager.admin_get_courts(venue_id)
-        if success:
-            return {"status": "success", "data": result}
-        else:
-            return {"status": "fail", "message": result}
+        return self.reference_response(data, ('courts', venue_id),
+                                       lambda: self.db_manager.admin_get_courts(venue_id))
 
     def handle_admin_add_court(self, data):
         venue_id = data.get('venue_id')
@@ -377,11 +630,7 @@ class SportsVenueServer:
             return {"status": "fail", "message": message}
 
     def handle_get_announcements(self, data):
-        success, result = self.db_manager.get_announcements()
-        if success:
-            return {"status": "success", "data": result}
-        else:
-            return {"status": "fail", "message": result}
+        return self.reference_response(data, ('announcements',), self.db_manager.get_announcements)
 
     def handle_admin_delete_announcement(self, data):
         ann_id = data.get('ann_id')
@@ -391,31 +640,77 @@ class SportsVenueServer:
         else:
             return {"status": "fail", "message": message}
 
+    def handle_admin_run_lottery(self, data):
+        account = data.get('account')
+        date_str = data.get('date')
+        if not account or not date_str:
+            return {"status": "error", "message": "缺少管理员账号或日期"}
+        if self.db_manager.get_user_role(account) != 'admin':
+            return {"status": "fail", "message": "只有管理员可以开奖"}
+        success, result = self.db_manager.run_lottery(date_str, data.get('seed'))
+        if success:
+            return {"status": "success", "data": result}
+        else:
+            return {"status": "fail", "message": result}
+
+    def handle_server_stats(self, data):
+        account = (data or {}).get('account')
+        if not account:
+            return {"status": "error", "message": "缺少管理员账号"}
+        if self.db_manager.get_user_role(account) != 'admin':
+            return {"status": "fail", "message": "只有管理员可以查看服务器状态"}
+        return {"status": "success", "data": self.collect_stats()}
+
+    def collect_stats(self):
+        stats = self.metrics.snapshot()
+        stats["executor"] = self.executor.stats()
+        stats["single_flight"] = self.single_flight.stats()
+        stats["push"] = self.push_hub.stats()
+        if self.db_manager.pool:
+            stats["db_pool"] = self.db_manager.pool.stats()
+        stats["db_settings"] = self.db_manager.get_db_settings()
+        if self.db_manager.slot_cache:
+            stats["slot_cache"] = self.db_manager.slot_cache.stats()
+        stats["ref_cache"] = self.db_manager.ref_cache.stats()
+        stats["scheduler"] = self.scheduler.stats()
+        stats["noshow_monitor"] = self.noshow_monitor.stats()
+        stats["waiting_room"] = self.waiting_room.stats()
+        if self.inventory:
+            stats["inventory"] = self.inventory.stats()
+        if self.group_commit:
+            stats["group_commit"] = self.group_commit.stats()
+        return stats
+
+    def start_stats_dump(self):
+        """
+        启动后台线程，每隔 stats_interval 秒将运行指标写入 stats_path
+        """
+        def run_dump():
+            while self.running:
+                time.sleep(self.stats_interval)
+                try:
+                    self.metrics.dump(self.stats_path, {"executor": self.executor.stats(),
+                                                        "scheduler": self.scheduler.stats()})
+                except Exception as e:
+                    print(f"[!] 导出服务器指标失败: {e}")
+
+        dump_thread = threading.Thread(target=run_dump)
+        dump_thread.daemon = True
+        dump_thread.start()
+
     def start_scheduler(self):
         """
-        启动后台定时任务线程
+        注册并启动后台定时任务
+        - 爽约判定: 由 NoShowMonitor 在时段结束后数秒内完成，每小时的全量扫描只作兜底
+        - 信用分恢复、号源维护: 每天 22:00 各执行一次
         """
-        import time
         import datetime
-        
-        def run_schedule():
-            print("[Scheduler] 定时任务线程已启动")
-            while self.running:
-                now = datetime.datetime.now()
-                # 每天晚上 22:00 执行 (这里为了演示，可以设为每分钟检查一次，或者严格判断时间)
-                # 简单逻辑: 每分钟检查一次，如果是 22:00 则执行
-                if now.hour >= 22 and now.minute >= 0:
-                    print(f"[Scheduler] 开始执行每日检查爽约任务 @ {now}")
-                    self.db_manager.process_daily_tasks()
-                    # 休眠 61 秒防止重复执行
-                    time.sleep(61)
-                else:
-                    # 每 30 秒检查一次时间
-                    time.sleep(30)
-        
-        scheduler_thread = threading.Thread(target=run_schedule)
-        scheduler_thread.daemon = True
-        scheduler_thread.start()
+        db = self.db_manager
+        self.noshow_monitor.start()
+        self.scheduler.add_interval('no_shows', lambda: db.process_no_shows(datetime.datetime.now()), 60 * 60)
+        self.scheduler.add_daily('credit_restore', lambda: db.restore_credit_scores(datetime.datetime.now()), 22)
+        self.scheduler.add_daily('slot_maintenance', lambda: db.maintain_slots(datetime.date.today()), 22)
+        self.scheduler.start()
 
     def start(self):
         try:
@@ -425,6 +720,12 @@ class SportsVenueServer:
             
             # 启动定时任务
             self.start_scheduler()
+            self.start_stats_dump()
+            self.push_hub.start()
+            if self.inventory:
+                self.inventory.start()
+            if self.group_commit:
+                self.group_commit.start()
             
             print(f"[*] 等待客户端连接...")
             
@@ -443,5 +744,15 @@ class SportsVenueServer:
 
 if __name__ == '__main__':
     # 可以在这里配置 IP 和 端口
-    server = SportsVenueServer()
+    # python server.py --async 使用 asyncio 引擎 (适合大量并发连接)
+    # python server.py --inventory 热门时段使用内存库存引擎 (抢号高峰)
+    inventory_engine = '--inventory' in sys.argv
+    if '--async' in sys.argv:
+        try:
+            from server.async_server import AsyncSportsVenueServer
+        except ImportError:
+            from async_server import AsyncSportsVenueServer
+        server = AsyncSportsVenueServer(inventory_engine=inventory_engine)
+    else:
+        server = SportsVenueServer(inventory_engine=inventory_engine)
     server.start()
@@ -0,0 +1,53 @@
+import json
+import threading
+
+
+class SingleFlight:
+    """
+    相同请求合并 (single-flight)
+    同一时刻多个完全相同的只读请求只执行一次，后到的请求直接等待并共享第一个请求的结果
+    (服务器中共享的是编码好的响应帧 bytes，合并的请求连 JSON 序列化都省掉)
+    请求执行完成后立即从表中移除，之后到达的请求重新执行，不会读到旧结果
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = {}   # key -> concurrent.futures.Future
+        self.leaders = 0  # 实际执行的次数
+        self.shared = 0   # 合并掉 (共享结果) 的次数
+
+    @staticmethod
+    def make_key(action, data):
+        return action, json.dumps(data, sort_keys=True, ensure_ascii=False)
+
+    def submit(self, key, start):
+        """
+        :param start: 无参函数，启动实际执行并返回 Future (只在没有进行中的相同请求时调用)
+        :return: Future - 进行中的相同请求的 Future，或新启动的 Future
+        """
+        with self.lock:
+            future = self.calls.get(key)
+            if future is not None:
+                self.shared += 1
+                return future
+            # start() 抛出异常 (如执行器繁忙) 时不登记，直接向上抛出
+            future = start()
+            self.calls[key] = future
+            self.leaders += 1
+        future.add_done_callback(lambda f: self._forget(key, f))
+        return future
+
+    def _forget(self, key, future):
+        with self.lock:
+            if self.calls.get(key) is future:
+                del self.calls[key]
+
+    def stats(self):
+        with self.lock:
+            total = self.leaders + self.shared
+            return {
+                "in_flight": len(self.calls),
+                "executed": self.leaders,
+                "shared": self.shared,
+                "shared_rate": round(self.shared / total, 4) if total else 0
+            }
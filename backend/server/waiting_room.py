@@ -0,0 +1,207 @@
+import datetime
+import secrets
+import threading
+import time
+
+
+class _Room:
+    """
+    一个场馆在一个排队时段内的队列
+    放行进度不需要后台线程推进: 队列积压期间排队号按 rate 匀速放行，
+    第 anchor_seq 号在 anchor_time 放行，之后每 1/rate 秒放行一个，已放行数可直接算出
+    """
+    __slots__ = ('rate', 'window_end', 'tail', 'anchor_seq', 'anchor_time', 'next_admit', 'tokens', 'users')
+
+    def __init__(self, rate, window_end):
+        self.rate = rate                  # 每秒放行人数
+        self.window_end = window_end      # 排队时段结束时间 (datetime)
+        self.tail = 0                     # 已发出的排队号数 (排队号从 1 开始)
+        self.anchor_seq = 1
+        self.anchor_time = 0.0
+        self.next_admit = float('-inf')   # 下一个排队号最早的放行时刻
+        self.tokens = {}                  # token -> (排队号, user_account, 放行时刻)
+        self.users = {}                   # user_account -> token
+
+    def enqueue(self, now):
+        """:return: (排队号, 放行时刻)"""
+        self.tail += 1
+        if now >= self.next_admit:
+            # 队列已经放空，从当前时刻重新开始匀速放行
+            self.anchor_seq, self.anchor_time = self.tail, now
+        admit_at = self.anchor_time + (self.tail - self.anchor_seq) / self.rate
+        self.next_admit = admit_at + 1 / self.rate
+        return self.tail, admit_at
+
+    def admitted_count(self, now):
+        """已放行的排队号数"""
+        if self.tail == 0:
+            return 0
+        return min(self.tail, self.anchor_seq + int((now - self.anchor_time) * self.rate))
+
+
+class WaitingRoom:
+    """
+    热门号源放出时的虚拟排队
+    - 规则: 指定场馆在每天的某个时间段 (如 22:00-22:10 号源维护放号) 内开启排队
+    - 规则生效时，book_venue 必须带上已放行的 queue_token，否则返回 status=queued 与排队号
+    - 排队号顺序发放，放行进度按 rate 人/秒随时间推进，位置 = 排队号 - 已放行数，查询为 O(1)
+    - 放行后 admit_ttl 秒内可以预约 (允许换时段重试)，过期需重新排队
+    - 队列只保存在内存中，排队时段结束后下次访问时整体丢弃
+    """
+
+    def __init__(self, db_manager, rules=None, admit_ttl=60, clock=time.monotonic, wall_clock=datetime.datetime.now):
+        self.db = db_manager
+        self.admit_ttl = admit_ttl
+        self.clock = clock
+        self.wall_clock = wall_clock
+        self.lock = threading.Lock()
+        self.rules = {}        # venue_id -> [(开始 time, 结束 time, rate)]
+        self.rooms = {}        # venue_id -> _Room
+        self.slot_venues = {}  # slot_id -> venue_id (时段所属场馆不会改变)
+        self.joined = 0
+        self.admitted = 0
+        self.turned_away = 0
+        for rule in rules or []:
+            self.add_rule(**rule)
+
+    def add_rule(self, venue_id, start, end, rate=20):
+        """
+        :param start: 开始时间 'HH:MM'
+        :param end: 结束时间 'HH:MM' (不跨天)
+        :param rate: 每秒放行人数
+        """
+        start_time = datetime.time.fromisoformat(start)
+        end_time = datetime.time.fromisoformat(end)
+        if end_time <= start_time or rate <= 0:
+            raise ValueError("排队时段或放行速率无效")
+        with self.lock:
+            self.rules.setdefault(int(venue_id), []).append((start_time, end_time, rate))
+
+    def _active_rule(self, venue_id, now):
+        for start_time, end_time, rate in self.rules.get(venue_id, ()):
+            if start_time <= now.time() < end_time:
+                return datetime.datetime.combine(now.date(), end_time), rate
+        return None
+
+    def _room(self, venue_id):
+        """当前生效的队列 (没有生效的规则时为 None)，过期的队列在这里丢弃"""
+        now = self.wall_clock()
+        room = self.rooms.get(venue_id)
+        if room is not None and now >= room.window_end:
+            del self.rooms[venue_id]
+            room = None
+        if room is None:
+            rule = self._active_rule(venue_id, now)
+            if rule is None:
+                return None
+            room = self.rooms[venue_id] = _Room(rule[1], rule[0])
+        return room
+
+    def venue_of(self, slot_id):
+        try:
+            slot_id = int(slot_id)
+        except (TypeError, ValueError):
+            return None
+        venue_id = self.slot_venues.get(slot_id)
+        if venue_id is None:
+            venue_id = self.db.get_slot_venue(slot_id)
+            if venue_id is not None:
+                self.slot_venues[slot_id] = venue_id
+        return venue_id
+
+    def join(self, user_account, venue_id):
+        """
+        入队 (同一用户重复入队返回原排队号)
+        :return: (bool, dict 或 错误信息) - dict: {token, position, admitted, wait_seconds}
+        """
+        try:
+            venue_id = int(venue_id)
+        except (TypeError, ValueError):
+            return False, "场馆ID无效"
+        with self.lock:
+            room = self._room(venue_id)
+            if room is None:
+                return False, "当前不在排队时段，可直接预约"
+            token = room.users.get(user_account)
+            if token is None:
+                seq, admit_at = room.enqueue(self.clock())
+                token = f"{venue_id}-{seq}-{secrets.token_hex(8)}"
+                room.tokens[token] = (seq, user_account, admit_at)
+                room.users[user_account] = token
+                self.joined += 1
+            return True, self._status(room, token)
+
+    def status(self, token):
+        """:return: (bool, dict 或 错误信息)"""
+        venue_id = self._token_venue(token)
+        with self.lock:
+            room = self._room(venue_id) if venue_id is not None else None
+            if room is None or token not in room.tokens:
+                return False, "排队号无效或已过期，请重新排队"
+            return True, self._status(room, token)
+
+    def _status(self, room, token):
+        seq, _, admit_at = room.tokens[token]
+        now = self.clock()
+        position = max(0, seq - room.admitted_count(now))
+        return {
+            "token": token,
+            "position": position,
+            "admitted": position == 0,
+            "wait_seconds": round(max(0.0, admit_at - now), 1) if position else 0
+        }
+
+    @staticmethod
+    def _token_venue(token):
+        try:
+            return int(str(token).split('-', 1)[0])
+        except ValueError:
+            return None
+
+    def check(self, user_account, slot_id, token=None):
+        """
+        book_venue 前检查是否需要排队
+        :return: (bool, dict/None) - 可以预约时为 (True, None)；需要排队时为 (False, 排队状态)，
+                 没有排队号的用户自动入队
+        """
+        if not self.rules:
+            return True, None
+        venue_id = self.venue_of(slot_id)
+        if venue_id is None:
+            return True, None
+        with self.lock:
+            if venue_id not in self.rules:
+                return True, None
+            room = self._room(venue_id)
+            if room is None:
+                return True, None
+            entry = room.tokens.get(token) if token else None
+            if entry is not None and entry[1] == user_account:
+                seq, _, admit_at = entry
+                now = self.clock()
+                if seq <= room.admitted_count(now):
+                    if now - admit_at <= self.admit_ttl:
+                        self.admitted += 1
+                        return True, None
+                    # 放行后超时未预约，重新排到队尾
+                    del room.tokens[token]
+                    del room.users[user_account]
+            self.turned_away += 1
+        success, status = self.join(user_account, venue_id)
+        if not success:
+            return True, None
+        return False, status
+
+    def stats(self):
+        with self.lock:
+            now = self.clock()
+            return {
+                "rules": {venue_id: [f"{s.strftime('%H:%M')}-{e.strftime('%H:%M')} {rate}/s" for s, e, rate in rules]
+                          for venue_id, rules in self.rules.items()},
+                "rooms": {venue_id: {"queued": room.tail, "admitted": room.admitted_count(now),
+                                     "waiting": room.tail - room.admitted_count(now)}
+                          for venue_id, room in self.rooms.items()},
+                "joined": self.joined,
+                "admitted_bookings": self.admitted,
+                "turned_away": self.turned_away
+            }
@@ -30,6 +30,21 @@ class AdminWidget(QWidget):
         self.setup_user_tab()
         self.setup_reservation_tab()
         self.setup_announcement_tab()
+
+        # 首次加载: 四个列表合并为一次 batch 请求，只需一次网络往返
+        self.load_all()
+
+    def load_all(self):
+        results = self.network.send_batch([
+            {"action": "admin_get_venues"},
+            {"action": "admin_get_users"},
+            {"action": "admin_get_all_reservations"},
+            {"action": "get_announcements"}
+        ])
+        self.show_venues(results[0])
+        self.show_users(results[1])
+        self.show_reservations(results[2])
+        self.show_announcements(results[3])
         
     def setup_venue_tab(self):
         self.venue_tab = QWidget()
@@ -54,11 +69,10 @@ class AdminWidget(QWidget):
         self.venue_table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
         layout.addWidget(self.venue_table)
         
-        self.load_venues()
-        
     def load_venues(self):
-        req = {"action": "admin_get_venues"}
-        res = self.network.send_request(req)
+        self.show_venues(self.network.send_cached("admin_get_venues"))
+
+    def show_venues(self, res):
         if res and res.get("status") == "success":
             venues = res.get("data", [])
             self.venue_table.setRowCount(len(venues))
@@ -221,8 +235,7 @@ class AdminWidget(QWidget):
         dialog.exec_()
 
     def load_courts(self, venue_id):
-        req = {"action": "admin_get_courts", "data": {"venue_id": venue_id}}
-        res = self.network.send_request(req)
+        res = self.network.send_cached("admin_get_courts", {"venue_id": venue_id})
         if res and res.get("status") == "success":
             courts = res.get("data", [])
             self.court_table.setRowCount(len(courts))
@@ -269,12 +282,12 @@ class AdminWidget(QWidget):
         self.user_table.setHorizontalHeaderLabels(["账号", "姓名", "角色", "电话", "信用分", "操作"])
         self.user_table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
         layout.addWidget(self.user_table)
-        
-        self.load_users()
 
     def load_users(self):
         req = {"action": "admin_get_users"}
-        res = self.network.send_request(req)
+        self.show_users(self.network.send_request(req))
+
+    def show_users(self, res):
         if res and res.get("status") == "success":
             users = res.get("data", [])
             self.user_table.setRowCount(len(users))
@@ -373,12 +386,12 @@ class AdminWidget(QWidget):
         self.res_table.setHorizontalHeaderLabels(["ID", "用户", "场馆", "场地", "日期", "时间", "状态/操作"])
         self.res_table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
         layout.addWidget(self.res_table)
-        
-        self.load_reservations()
 
     def load_reservations(self):
         req = {"action": "admin_get_all_reservations"}
-        res = self.network.send_request(req)
+        self.show_reservations(self.network.send_request(req))
+
+    def show_reservations(self, res):
         if res and res.get("status") == "success":
             reservations = res.get("data", [])
             self.res_table.setRowCount(len(reservations))
@@ -446,8 +459,6 @@ class AdminWidget(QWidget):
         btn_refresh = QPushButton("刷新列表")
         btn_refresh.clicked.connect(self.load_announcements)
         layout.addWidget(btn_refresh)
-        
-        self.load_announcements()
 
     def publish_announcement(self):
         title = self.ann_title.text()
@@ -478,8 +489,9 @@ class AdminWidget(QWidget):
             QMessageBox.warning(self, "错误", res.get("message", "发布失败"))
 
     def load_announcements(self):
-        req = {"action": "get_announcements"}
-        res = self.network.send_request(req)
+        self.show_announcements(self.network.send_cached("get_announcements"))
+
+    def show_announcements(self, res):
         if res and res.get("status") == "success":
             anns = res.get("data", [])
             self.ann_table.setRowCount(len(anns))
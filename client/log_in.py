@@ -1,6 +1,10 @@
 import sys
 import json
 import socket
+import struct
+import time
+import random
+import select
 from PyQt5.QtWidgets import (QApplication, QWidget, QVBoxLayout, QHBoxLayout, 
                              QLabel, QLineEdit, QPushButton, QMessageBox, 
                              QStackedWidget, QComboBox, QFrame)
@@ -12,11 +16,42 @@ try:
 except ImportError:
     from client.import_class import TeacherDashboard
 
+# 通信协议: 4 字节大端长度头 + UTF-8 JSON 正文 (与服务器 protocol.py 保持一致)
+HEADER = struct.Struct('!I')
+
+
+def recv_exact(sock, size):
+    """循环读取直到收满 size 字节"""
+    buf = bytearray()
+    while len(buf) < size:
+        chunk = sock.recv(min(size - len(buf), 64 * 1024))
+        if not chunk:
+            raise ConnectionResetError("服务器已关闭连接")
+        buf.extend(chunk)
+    return bytes(buf)
+
+
+def send_message(sock, obj):
+    body = json.dumps(obj, ensure_ascii=False).encode('utf-8')
+    sock.sendall(HEADER.pack(len(body)) + body)
+
+
+def recv_message(sock):
+    (length,) = HEADER.unpack(recv_exact(sock, HEADER.size))
+    return json.loads(recv_exact(sock, length).decode('utf-8'))
+
+
 class NetworkClient:
-    def __init__(self, host='127.0.0.1', port=8888):
+    def __init__(self, host='127.0.0.1', port=8888, busy_retries=3, busy_backoff=0.1):
         self.host = host
         self.port = port
         self.client_socket = None
+        self.busy_retries = busy_retries
+        self.busy_backoff = busy_backoff
+        # 参考数据 (场馆、场地、公告) 的本地缓存: (action, data) -> 带 version 的响应
+        self.reference_cache = {}
+        # 订阅推送回调: push_handler(channel, slots, full)，推送帧与响应共用连接，收到即回调
+        self.push_handler = None
 
     def connect(self):
         try:
@@ -38,16 +73,114 @@ class NetworkClient:
         
         try:
             request = {"action": action, "data": data}
-            self.client_socket.send(json.dumps(request, ensure_ascii=False).encode('utf-8'))
-            
-            response_data = self.client_socket.recv(4096).decode('utf-8')
-            return json.loads(response_data)
+            # 服务器繁忙 (status=busy) 时指数退避重试，避免继续挤压数据库
+            for attempt in range(self.busy_retries + 1):
+                send_message(self.client_socket, request)
+                response = self.recv_response()
+                if response.get("status") != "busy" or attempt == self.busy_retries:
+                    return response
+                time.sleep(self.busy_backoff * (2 ** attempt) * (1 + random.random()))
         except Exception as e:
+            # 连接已不可用 (帧可能只读了一半)，丢弃后下次请求重新连接
+            self.close()
             return {"status": "error", "message": f"通信错误: {str(e)}"}
     
+    def recv_response(self):
+        """读取下一条响应，途中收到的推送帧 (type=push) 交给 push_handler"""
+        while True:
+            response = recv_message(self.client_socket)
+            if response.get("type") != "push":
+                return response
+            if self.push_handler:
+                self.push_handler(response.get("channel"), response.get("data", []), response.get("full"))
+
+    def poll_push(self, timeout=0):
+        """
+        空闲时处理已到达的推送帧 (如界面定时器中调用)
+        :return: int - 处理的推送帧数
+        """
+        if not self.client_socket:
+            return 0
+        count = 0
+        try:
+            while select.select([self.client_socket], [], [], timeout)[0]:
+                frame = recv_message(self.client_socket)
+                if frame.get("type") == "push" and self.push_handler:
+                    self.push_handler(frame.get("channel"), frame.get("data", []), frame.get("full"))
+                count += 1
+                timeout = 0
+        except Exception as e:
+            print(f"接收推送失败: {e}")
+            self.close()
+        return count
+
+    def subscribe(self, venue_id, date_str):
+        """订阅场馆某天的号源变化，返回当前全部时段"""
+        return self.send_request("subscribe", {"venue_id": venue_id, "date": date_str})
+
+    def unsubscribe(self, venue_id, date_str):
+        return self.send_request("unsubscribe", {"venue_id": venue_id, "date": date_str})
+
+    def book(self, user_account, slot_id, max_wait=300):
+        """
+        预约时段，服务器处于排队时段时 (status=queued) 按提示的等待时间轮询排队位置，放行后带排队号重试
+        """
+        data = {"user_account": user_account, "slot_id": slot_id}
+        deadline = time.time() + max_wait
+        while True:
+            response = self.send_request("book_venue", data)
+            if response.get("status") != "queued":
+                return response
+            queue = response.get("data", {})
+            data["queue_token"] = queue.get("token")
+            while not queue.get("admitted"):
+                if time.time() > deadline:
+                    return {"status": "fail", "message": "排队超时，请稍后再试"}
+                time.sleep(min(max(queue.get("wait_seconds", 1), 0.2), 5))
+                status = self.send_request("queue_status", {"queue_token": data["queue_token"]})
+                if status.get("status") != "success":
+                    # 排队号过期，重新预约会自动重新排队
+                    break
+                queue = status["data"]
+
+    def join_waitlist(self, user_account, slot_id):
+        """已满时段加入候补 (book 返回 can_waitlist 时可用)，有人取消后服务器自动为排在前面的候补预约"""
+        return self.send_request("join_waitlist", {"user_account": user_account, "slot_id": slot_id})
+
+    def leave_waitlist(self, user_account, slot_id):
+        return self.send_request("leave_waitlist", {"user_account": user_account, "slot_id": slot_id})
+
+    def send_cached(self, action, data=None):
+        """
+        读取参考数据 (场馆、场地、公告)
+        带上本地缓存的版本号 if_version，服务器回复 not_modified 时直接返回本地缓存的响应
+        """
+        data = dict(data or {})
+        key = (action, json.dumps(data, sort_keys=True))
+        cached = self.reference_cache.get(key)
+        if cached:
+            data["if_version"] = cached["version"]
+        response = self.send_request(action, data)
+        if response.get("status") == "not_modified" and cached:
+            return cached
+        if response.get("status") == "success" and "version" in response:
+            self.reference_cache[key] = response
+        return response
+
+    def send_batch(self, requests, parallel=True):
+        """
+        将多个请求合并为一次 batch 往返，按顺序返回各子请求的响应列表
+        :param requests: [{"action": ..., "data": ...}, ...]
+        """
+        resp = self.send_request("batch", {"requests": requests, "parallel": parallel})
+        if resp.get("status") == "success":
+            return resp.get("data", [])
+        return [resp for _ in requests]
+
     def close(self):
         if self.client_socket:
             self.client_socket.close()
+            self.client_socket = None
 
 class LoginWindow(QWidget):
     def __init__(self, network_client=None, login_callback=None):
@@ -1,7 +1,11 @@
 import socket
 import json
+import struct
 import sys
 
+# 4 字节大端长度头 + UTF-8 JSON 正文
+HEADER = struct.Struct('!I')
+
 def test_client():
     host = '127.0.0.1'
     port = 8888
@@ -74,10 +78,12 @@ def send_request(sock, request_dict):
     # 发送
     json_str = json.dumps(request_dict, ensure_ascii=False)
     print(f"发送: {json_str}")
-    sock.send(json_str.encode('utf-8'))
+    body = json_str.encode('utf-8')
+    sock.sendall(HEADER.pack(len(body)) + body)
     
-    # 接收
-    response_data = sock.recv(4096).decode('utf-8')
+    # 接收 (先读长度头，再读满正文)
+    (length,) = HEADER.unpack(recv_exact(sock, HEADER.size))
+    response_data = recv_exact(sock, length).decode('utf-8')
     try:
         # 尝试解析 JSON 并格式化输出，方便阅读
         parsed_json = json.loads(response_data)
@@ -85,5 +91,14 @@ def send_request(sock, request_dict):
     except:
         print(f"接收: {response_data}")
 
+def recv_exact(sock, size):
+    buf = b''
+    while len(buf) < size:
+        chunk = sock.recv(size - len(buf))
+        if not chunk:
+            raise ConnectionResetError("服务器已关闭连接")
+        buf += chunk
+    return buf
+
 if __name__ == '__main__':
     test_client()
@@ -4,18 +4,31 @@ import time
 import sys
 import os
 import sqlite3
+import struct
 
 #该py文件用于后端开发时模拟客户操作
 # 配置
 HOST = '127.0.0.1'
 PORT = 8888
+# 4 字节大端长度头 + UTF-8 JSON 正文
+HEADER = struct.Struct('!I')
+
+def recv_exact(sock, size):
+    buf = b''
+    while len(buf) < size:
+        chunk = sock.recv(size - len(buf))
+        if not chunk:
+            raise ConnectionResetError("服务器已关闭连接")
+        buf += chunk
+    return buf
 
 def send_request(sock, request):
     """发送请求并接收响应"""
     try:
-        sock.send(json.dumps(request).encode('utf-8'))
-        response_data = sock.recv(4096).decode('utf-8')
-        return json.loads(response_data)
+        body = json.dumps(request).encode('utf-8')
+        sock.sendall(HEADER.pack(len(body)) + body)
+        (length,) = HEADER.unpack(recv_exact(sock, HEADER.size))
+        return json.loads(recv_exact(sock, length).decode('utf-8'))
     except Exception as e:
         print(f"[!] 请求失败: {e}")
         return None